@@ -1,3 +1,4 @@
+import asyncio, contextlib
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
@@ -8,9 +9,34 @@ from .routers.arbitrage import router as arb_router
 from .routers.markets import router as markets_router
 from .routers.markets import router as markets_router
 from .routers.diag import router as diag_router
+from .routers.pnl import router as pnl_router
+from .routers.spreads import router as spreads_router
 from .routers.arbitrage import router as arb_router
+from .services.exchanges import refresh_markets_loop
+from .services.async_rest import close_rest
+from .services.orderbook_store import close_follower
+from .services.redis_pool import init_redis, close_redis
+from .services.ws_hub import hub as ws_hub
 
 app = FastAPI(title="Arbitrage API")
+_tasks = []
+
+@app.on_event("startup")
+async def startup():
+    init_redis()
+    _tasks.append(asyncio.create_task(refresh_markets_loop()))
+
+@app.on_event("shutdown")
+async def shutdown():
+    for t in _tasks:
+        t.cancel()
+    for t in _tasks:
+        with contextlib.suppress(BaseException):
+            await t
+    await ws_hub.close()
+    await close_follower()
+    await close_rest()
+    await close_redis()
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,4 +53,6 @@ app.include_router(markets_router)
 
 app.include_router(markets_router)
 app.include_router(diag_router)
+app.include_router(pnl_router)
+app.include_router(spreads_router)
 app.include_router(arb_router)
\ No newline at end of file
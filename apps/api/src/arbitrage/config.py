@@ -3,9 +3,19 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     env: str = "dev"
     redis_url: str = "redis://redis:6379/0"
+    redis_pool_size: int = 32
+    redis_pool_timeout: float = 5.0
     api_port: int = 8000
-    opp_list_key: str = "opps:recent"
     opp_channel: str = "opportunities"
+    # WebSocket-hub: wachtrij per client en wat er met trage clients gebeurt (conflate | drop)
+    ws_queue_size: int = 64
+    ws_slow_policy: str = "conflate"
+    # /arbitrage/scan(-multi): resultaat zoveel ms delen tussen identieke aanvragen (0 = alleen single-flight)
+    scan_cache_ttl_ms: int = 1000
+    scan_cache_max: int = 1024
+    # paren per exchange tegelijk in een scan, en de deadline van een hele scan-aanvraag
+    scan_pair_concurrency: int = 4
+    scan_deadline_sec: float = 4.0
     cors_allow_origins: list[str] = ["*"]
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", env_prefix="")
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 from typing import List, Dict, Any
 import asyncio
-from ..services.arbitrage import compute_all_pairs
+import math
+from ..services.arbitrage import compute_all_pairs, compute_pair_curve, load_books, scan_complete, scan_deadline
 from ..services.exchanges import list_symbols_with_quote
+from ..services.scan_cache import scan_cache
 
 router = APIRouter(prefix="/arbitrage", tags=["arbitrage"])
 
@@ -14,7 +16,17 @@ async def scan_arbitrage(
     withdraw_fee_base: float = Query(0.0, ge=0.0),
 ):
     ex_list = [e.strip().lower() for e in exchanges.split(",") if e.strip()]
-    results = await compute_all_pairs(symbol, ex_list, budget_quote, withdraw_fee_base)
+    symbol = symbol.strip().upper()
+
+    async def compute():
+        deadline = scan_deadline()
+        book_ts: Dict[tuple, int] = {}
+        books = await load_books([symbol], ex_list, deadline, book_ts)
+        res = await compute_all_pairs(symbol, ex_list, budget_quote, withdraw_fee_base, books=books, deadline=deadline)
+        return res, min(book_ts.values(), default=None)
+
+    key = ("scan", symbol, tuple(ex_list), budget_quote, withdraw_fee_base)
+    results = await scan_cache.get(key, compute, cacheable=scan_complete)
     return {"symbol": symbol, "exchanges": ex_list, "results": results}
 
 @router.get("/scan-multi")
@@ -26,13 +38,42 @@ async def scan_multi(
 ):
     ex_list = [e.strip().lower() for e in exchanges.split(",") if e.strip()]
     sym_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
-    tasks = [compute_all_pairs(sym, ex_list, budget_quote, withdraw_fee_base) for sym in sym_list]
-    blocks: List[List[Dict[str, Any]]] = await asyncio.gather(*tasks, return_exceptions=False)
+
+    async def compute():
+        deadline = scan_deadline()  # één deadline voor snapshot én alle paren
+        book_ts: Dict[tuple, int] = {}
+        books = await load_books(sym_list, ex_list, deadline, book_ts)  # één snapshot voor alle symbolen
+        tasks = [compute_all_pairs(sym, ex_list, budget_quote, withdraw_fee_base, books=books, deadline=deadline)
+                 for sym in sym_list]
+        blocks = await asyncio.gather(*tasks, return_exceptions=False)
+        return blocks, min(book_ts.values(), default=None)
+
+    key = ("multi", tuple(sym_list), tuple(ex_list), budget_quote, withdraw_fee_base)
+    blocks: List[List[Dict[str, Any]]] = await scan_cache.get(
+        key, compute, cacheable=lambda blocks: all(scan_complete(res) for res in blocks))
     out = []
     for sym, res in zip(sym_list, blocks):
         out.append({"symbol": sym, "results": res})
     return {"exchanges": ex_list, "blocks": out}
 
+@router.get("/curve")
+async def profit_curve(
+    symbol: str = Query(..., examples=["BTC/EUR"]),
+    buy: str = Query(..., examples=["kraken"]),
+    sell: str = Query(..., examples=["bitvavo"]),
+    budgets: str = Query("100,250,500,1000", description="Komma-lijst van budgetten in quote"),
+    withdraw_fee_base: float = Query(0.0, ge=0.0),
+):
+    try:
+        budget_list = [float(b) for b in budgets.split(",") if b.strip()]
+    except ValueError:
+        raise HTTPException(422, "budgets must be a comma list of numbers")
+    if not budget_list or not all(0 < b < math.inf for b in budget_list):
+        raise HTTPException(422, "budgets must be positive")
+    symbol = symbol.strip().upper()
+    res = await compute_pair_curve(symbol, buy.strip().lower(), sell.strip().lower(), budget_list, withdraw_fee_base)
+    return {"symbol": symbol, "budgets": budget_list, "result": res}
+
 @router.get("/discover")
 def discover(
     exchanges: str = Query("bitvavo,coinbase,kraken"),
@@ -1,7 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from ..services.metrics import render as render_metrics
+from ..services.redis_pool import pool_stats
+from ..services.scan_cache import scan_cache
 
 router = APIRouter()
 
 @router.get("/health")
 def health():
-    return {"ok": True, "service": "api"}
+    return {"ok": True, "service": "api", "redis_pool": pool_stats(), "scan_cache": scan_cache.stats()}
+
+@router.get("/metrics")
+def metrics():
+    body, content_type, status = render_metrics()
+    return Response(body, status_code=status, media_type=content_type)
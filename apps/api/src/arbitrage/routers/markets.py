@@ -2,7 +2,7 @@ from fastapi import APIRouter, Query
 from typing import Optional
 from ..services.orderbook_store import get_cached_orderbook
 from ..services.exchanges import (
-    fetch_orderbook, fetch_ticker, list_symbols, list_symbols_with_quote,
+    fetch_orderbook_async, fetch_ticker, list_symbols, list_symbols_with_quote,
     get_market_meta, ping
 )
 
@@ -44,7 +44,7 @@ async def orderbook(
             asks, bids = a[:limit], b[:limit]
             source = "cache"
     if asks is None or bids is None:
-        a, b = fetch_orderbook(exchange, symbol, limit=limit)
+        a, b = await fetch_orderbook_async(exchange, symbol, limit=limit)
         asks, bids = a, b
         source = "rest"
     return {"exchange": exchange, "symbol": symbol, "asks": asks, "bids": bids, "source": source}
@@ -1,15 +1,15 @@
 from fastapi import APIRouter, Depends, Query
-from redis.asyncio import Redis, from_url as redis_from_url
-from typing import List, Optional
+from redis.asyncio import Redis
+from typing import List, Literal, Optional
 
-from ..config import settings
 from ..schemas.opportunity import Opportunity
 from ..services.redis_store import fetch_recent_opportunities
+from ..services.redis_pool import get_redis
 
 router = APIRouter(prefix="/opportunities", tags=["opportunities"])
 
 async def get_redis_client() -> Redis:
-    return redis_from_url(settings.redis_url, decode_responses=True)
+    return get_redis()
 
 @router.get("", response_model=List[Opportunity])
 async def list_opportunities(
@@ -17,13 +17,12 @@ async def list_opportunities(
     symbol: Optional[str] = Query(None, description="Filter by symbol (e.g., BTC/USDT)"),
     min_profit: Optional[float] = Query(None, description="Minimum net profit in quote"),
     min_spread_bps: Optional[float] = Query(None, description="Minimum gross spread in bps"),
+    offset: int = Query(0, ge=0, le=10000),
+    order: Optional[Literal["recent", "profit", "spread"]] = Query(
+        None, description="recent (default, newest first, also with filters), profit or spread (highest first)"),
     redis: Redis = Depends(get_redis_client),
 ):
-    items = await fetch_recent_opportunities(redis, settings.opp_list_key, limit=limit)
-    if symbol:
-        items = [x for x in items if x.symbol == symbol]
-    if min_profit is not None:
-        items = [x for x in items if x.net_profit_quote >= min_profit]
-    if min_spread_bps is not None:
-        items = [x for x in items if x.spread_bps >= min_spread_bps]
-    return items
+    return await fetch_recent_opportunities(
+        redis, limit=limit, offset=offset, symbol=symbol,
+        min_profit=min_profit, min_spread_bps=min_spread_bps, order=order,
+    )
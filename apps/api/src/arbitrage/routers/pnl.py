@@ -0,0 +1,32 @@
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from ..services import pnl_rollup
+from ..services.redis_pool import get_redis
+
+router = APIRouter(prefix="/pnl", tags=["pnl"])
+
+@router.get("")
+async def pnl_summary():
+    """Paper-PnL: totaal, per symbool en per route (lopende aggregaten van de paper-executor)."""
+    return await pnl_rollup.summary(get_redis())
+
+@router.get("/series")
+async def pnl_series(
+    resolution: str = Query("minute", description="minute | hour | day"),
+    start_ms: Optional[int] = Query(None, description="Begin (ms); standaard 60 buckets terug"),
+    end_ms: Optional[int] = Query(None, description="Eind (ms); standaard nu"),
+    limit: int = Query(1440, ge=1, le=5000, description="Hoogstens zoveel buckets (de laatste)"),
+    skip_empty: bool = Query(True),
+):
+    res = pnl_rollup.RESOLUTIONS.get(resolution.lower())
+    if res is None:
+        raise HTTPException(400, "resolution must be minute, hour or day")
+    end = end_ms if end_ms is not None else int(time.time() * 1000)
+    start = start_ms if start_ms is not None else end - 59 * pnl_rollup.BUCKET_MS[res]
+    if start > end:
+        raise HTTPException(400, "start_ms after end_ms")
+    rows = await pnl_rollup.series(get_redis(), res, start, end, max_buckets=limit)
+    buckets = [{"start_ms": b, **(agg or pnl_rollup.empty())} for b, agg in rows if agg or not skip_empty]
+    return {"resolution": resolution, "bucket_ms": pnl_rollup.BUCKET_MS[res], "buckets": buckets}
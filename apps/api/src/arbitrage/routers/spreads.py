@@ -0,0 +1,31 @@
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from ..services import spread_series
+from ..services.redis_pool import get_redis
+
+router = APIRouter(prefix="/spreads", tags=["spreads"])
+
+@router.get("/routes")
+async def spread_routes():
+    """Routes (symbol, buy, sell) waarvoor de strategy spread-buckets bijhoudt."""
+    return {"routes": await spread_series.routes(get_redis())}
+
+@router.get("/series")
+async def spread_range(
+    symbol: str = Query(..., examples=["BTC/EUR"]),
+    buy: str = Query(..., examples=["kraken"]),
+    sell: str = Query(..., examples=["bitvavo"]),
+    resolution: str = Query("1m", description="1s | 1m | 1h"),
+    start_ms: Optional[int] = Query(None, description="Begin (ms); standaard 120 buckets terug"),
+    end_ms: Optional[int] = Query(None, description="Eind (ms); standaard nu"),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """OHLC van gross spread (bps) en netto winst, grootste qty binnen het budget en aantallen per bucket, oudste eerst."""
+    if resolution not in spread_series.BUCKET_MS:
+        raise HTTPException(400, "resolution must be 1s, 1m or 1h")
+    end = end_ms if end_ms is not None else int(time.time() * 1000)
+    start = start_ms if start_ms is not None else end - 120 * spread_series.BUCKET_MS[resolution]
+    buckets = await spread_series.query(get_redis(), symbol, buy.lower(), sell.lower(), resolution, start, end, limit)
+    return {"symbol": symbol, "buy": buy.lower(), "sell": sell.lower(), "resolution": resolution, "buckets": buckets}
@@ -1,7 +1,49 @@
-from typing import Dict, Any, List
-from .exchanges import fetch_orderbook, get_market_meta
-from .orderbook_store import get_cached_orderbook
-from .depth_sim import simulate_cross_fill
+import asyncio, contextlib, time
+from typing import Dict, Any, List, Optional, Tuple
+from ..config import settings
+from .async_rest import REST_TIMEOUT_SEC
+from .exchanges import fetch_orderbook_async, get_market_meta_async
+from .orderbook_store import get_cached_orderbook, get_cached_orderbooks_aged
+from .depth_sim import simulate_cross_fill, solve_optimal_size, curve_at_budget
+from .metrics import REST_FALLBACKS, SIMULATE, SIMULATED_PAIRS
+
+_pair_sems: Dict[str, asyncio.Semaphore] = {}
+
+def _pair_sem(exchange: str) -> asyncio.Semaphore:
+    sem = _pair_sems.get(exchange)
+    if sem is None:
+        sem = _pair_sems[exchange] = asyncio.Semaphore(max(settings.scan_pair_concurrency, 1))
+    return sem
+
+def scan_deadline() -> float:
+    """Monotone deadline voor één scan-aanvraag (``SCAN_DEADLINE_SEC`` vanaf nu)."""
+    return time.monotonic() + settings.scan_deadline_sec
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+async def _fill_missing(books: Dict[Tuple[str, str], Any], deadline: Optional[float] = None) -> None:
+    # ontbrekende boeken parallel via REST, elk met eigen deadline (nooit voorbij die van de scan);
+    # een fout wordt per boek bewaard
+    missing = [book for book, val in books.items() if not val]
+    for ex, sym in missing:
+        REST_FALLBACKS.labels(ex, sym).inc()
+    if missing:
+        left = _remaining(deadline)
+        timeout = None if left is None else min(REST_TIMEOUT_SEC, left)
+        got = await asyncio.gather(*(fetch_orderbook_async(ex, sym, limit=50, timeout=timeout) for ex, sym in missing),
+                                   return_exceptions=True)
+        books.update(zip(missing, got))
+
+async def _book_from_snapshot(books: Dict[Tuple[str, str], Any], exchange: str, symbol: str):
+    # ontbrekend/stale boek: één REST-call per scan, daarna uit de snapshot
+    book = books.get((exchange, symbol))
+    if not book:
+        REST_FALLBACKS.labels(exchange, symbol).inc()
+        book = books[(exchange, symbol)] = await fetch_orderbook_async(exchange, symbol, limit=50)
+    if isinstance(book, BaseException):
+        raise book
+    return book
 
 async def compute_pair_opportunity(
     symbol: str,
@@ -9,19 +51,18 @@ async def compute_pair_opportunity(
     sell_ex: str,
     budget_quote: float = 100.0,
     withdraw_fee_base: float = 0.0,
+    with_curve: bool = False,
+    books: Optional[Dict[Tuple[str, str], Any]] = None,
 ) -> Dict[str, Any]:
-    cached_buy = await get_cached_orderbook(buy_ex, symbol)
-    cached_sell = await get_cached_orderbook(sell_ex, symbol)
+    # books: snapshot uit get_cached_orderbooks; zonder snapshot per boek lezen
+    if books is None:
+        books = {
+            (buy_ex, symbol): await get_cached_orderbook(buy_ex, symbol),
+            (sell_ex, symbol): await get_cached_orderbook(sell_ex, symbol),
+        }
 
-    if cached_buy:
-        asks, _ = cached_buy
-    else:
-        asks, _ = fetch_orderbook(buy_ex, symbol, limit=50)
-
-    if cached_sell:
-        _, bids = cached_sell
-    else:
-        _, bids = fetch_orderbook(sell_ex, symbol, limit=50)
+    asks, _ = await _book_from_snapshot(books, buy_ex, symbol)
+    _, bids = await _book_from_snapshot(books, sell_ex, symbol)
 
     if not asks or not bids:
         return {"ok": 0, "reason": "empty_orderbook", "buy": buy_ex, "sell": sell_ex, "symbol": symbol}
@@ -30,11 +71,18 @@ async def compute_pair_opportunity(
     best_bid = bids[0][0]
     gross_spread = (best_bid - best_ask) / best_ask
 
-    buy_meta = get_market_meta(buy_ex, symbol)
-    sell_meta = get_market_meta(sell_ex, symbol)
+    buy_meta = await get_market_meta_async(buy_ex, symbol)
+    sell_meta = await get_market_meta_async(sell_ex, symbol)
     fee_buy = buy_meta["taker_fee"]
     fee_sell = sell_meta["taker_fee"]
 
+    limits = dict(
+        base_step=buy_meta.get("base_step") or sell_meta.get("base_step"),
+        min_base=buy_meta.get("min_base") or sell_meta.get("min_base"),
+        min_notional_buy=buy_meta.get("min_notional"),
+        min_notional_sell=sell_meta.get("min_notional"),
+    )
+    t0 = time.perf_counter()
     res = simulate_cross_fill(
         asks=asks,
         bids=bids,
@@ -42,13 +90,12 @@ async def compute_pair_opportunity(
         fee_sell=fee_sell,
         withdraw_fee_base=withdraw_fee_base,
         max_quote_buy=budget_quote,
-        base_step=buy_meta.get("base_step") or sell_meta.get("base_step"),
-        min_base=buy_meta.get("min_base") or sell_meta.get("min_base"),
-        min_notional_buy=buy_meta.get("min_notional"),
-        min_notional_sell=sell_meta.get("min_notional"),
+        **limits,
     )
+    SIMULATE.labels("scalar").observe(time.perf_counter() - t0)
+    SIMULATED_PAIRS.labels("scalar").inc()
 
-    return {
+    out = {
         "ok": res.get("ok", 0),
         "symbol": symbol,
         "buy": buy_ex,
@@ -62,16 +109,115 @@ async def compute_pair_opportunity(
         "withdraw_fee_base": withdraw_fee_base,
         "depth_result": res,
     }
+    if with_curve:
+        out["curve"] = solve_optimal_size(
+            asks=asks, bids=bids, fee_buy=fee_buy, fee_sell=fee_sell,
+            withdraw_fee_base=withdraw_fee_base, **limits,
+        )
+    return out
+
+def _budget_point(sim: Dict[str, Any], budget_quote: float) -> Dict[str, Any]:
+    # simulate_cross_fill-uitkomst in de vorm van een curve-punt
+    p = {k: float(sim.get(k) or 0.0) for k in ("qty_base_sold", "spent_quote", "buy_fee_quote",
+                                                "received_quote", "sell_fee_quote", "net_profit_quote")}
+    p["qty_base"] = float(sim.get("qty_base_bought") or 0.0)
+    p["budget_quote"] = budget_quote
+    p["roi"] = p["net_profit_quote"] / p["spent_quote"] if p["spent_quote"] > 0 else 0.0
+    return p
+
+async def compute_pair_curve(
+    symbol: str,
+    buy_ex: str,
+    sell_ex: str,
+    budgets: List[float],
+    withdraw_fee_base: float = 0.0,
+) -> Dict[str, Any]:
+    """Eén simulatie → winstcurve, optimale size en de uitkomst voor elk gevraagd budget.
 
-async def compute_all_pairs(symbol: str, exchanges: List[str], budget_quote: float, withdraw_fee_base: float) -> List[Dict[str, Any]]:
+    Budgetten die de curve niet exact kan beantwoorden (zie ``curve_at_budget``) worden op dezelfde
+    boek-snapshot alsnog met ``simulate_cross_fill`` doorgerekend.
+    """
+    budget = max(budgets) if budgets else 100.0
+    books = {
+        (buy_ex, symbol): await get_cached_orderbook(buy_ex, symbol),
+        (sell_ex, symbol): await get_cached_orderbook(sell_ex, symbol),
+    }
+    res = await compute_pair_opportunity(symbol, buy_ex, sell_ex, budget, withdraw_fee_base, with_curve=True, books=books)
+    curve = res.get("curve")
+    if curve is not None:
+        out = []
+        for b in budgets:
+            p = curve_at_budget(curve["curve"], b, curve.get("base_step"), curve.get("min_qty_base"))
+            if p is None:
+                sim = res["depth_result"] if b == budget else (
+                    await compute_pair_opportunity(symbol, buy_ex, sell_ex, b, withdraw_fee_base, books=books)
+                ).get("depth_result") or {}
+                p = _budget_point(sim, b)
+            out.append(p)
+        res["budgets"] = out
+    return res
+
+async def load_books(symbols: List[str], exchanges: List[str], deadline: Optional[float] = None,
+                     book_ts: Optional[Dict[Tuple[str, str], int]] = None) -> Dict[Tuple[str, str], Any]:
+    """Point-in-time snapshot van alle boeken voor symbols × exchanges in één Redis round-trip.
+
+    Ontbrekende boeken worden direct parallel via REST aangevuld, binnen ``deadline``. Met ``book_ts``
+    komt daarin de timestamp (ms) van elk bruikbaar boek; via REST opgehaald telt als nu.
+    """
+    aged = await get_cached_orderbooks_aged((ex, sym) for sym in symbols for ex in exchanges)
+    books: Dict[Tuple[str, str], Any] = {book: val[:2] if val else None for book, val in aged.items()}
+    await _fill_missing(books, deadline)
+    if book_ts is not None:
+        now = int(time.time() * 1000)
+        for book, val in books.items():
+            if val and not isinstance(val, BaseException):
+                cached = aged.get(book)
+                book_ts[book] = (cached[2] or now) if cached else now
+    return books
+
+async def _guarded_pair(symbol: str, buy_ex: str, sell_ex: str, budget_quote: float, withdraw_fee_base: float,
+                        books: Dict[Tuple[str, str], Any]) -> Dict[str, Any]:
+    # per exchange hoogstens SCAN_PAIR_CONCURRENCY paren tegelijk; vaste volgorde tegen deadlocks
+    async with contextlib.AsyncExitStack() as stack:
+        for ex in sorted({buy_ex, sell_ex}):
+            await stack.enter_async_context(_pair_sem(ex))
+        try:
+            return await compute_pair_opportunity(symbol, buy_ex, sell_ex, budget_quote, withdraw_fee_base, books=books)
+        except asyncio.TimeoutError:
+            return {"ok": 0, "reason": "timeout", "symbol": symbol, "buy": buy_ex, "sell": sell_ex}
+        except Exception as e:
+            return {"ok": 0, "symbol": symbol, "buy": buy_ex, "sell": sell_ex, "error": str(e)}
+
+def scan_complete(results: List[Dict[str, Any]]) -> bool:
+    """False als een paar een fout (bv. mislukte REST-aanvulling) of een timeout gaf: niet cachen."""
+    return not any(r.get("error") or r.get("reason") == "timeout" for r in results)
+
+async def compute_all_pairs(
+    symbol: str,
+    exchanges: List[str],
+    budget_quote: float,
+    withdraw_fee_base: float,
+    books: Optional[Dict[Tuple[str, str], Any]] = None,
+    deadline: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Alle geordende paren parallel; wat na ``deadline`` nog loopt komt terug als ``reason: timeout``."""
+    if deadline is None:
+        deadline = scan_deadline()
+    if books is None:
+        books = await load_books([symbol], exchanges, deadline)
+    pairs = [(b, s) for b in exchanges for s in exchanges if b != s]
+    tasks = [asyncio.create_task(_guarded_pair(symbol, b, s, budget_quote, withdraw_fee_base, books)) for b, s in pairs]
+    try:
+        if tasks:
+            await asyncio.wait(tasks, timeout=_remaining(deadline))
+    finally:
+        for task in tasks:
+            task.cancel()  # te laat, of de aanvraag zelf is geannuleerd
     out: List[Dict[str, Any]] = []
-    for i, buy_ex in enumerate(exchanges):
-        for j, sell_ex in enumerate(exchanges):
-            if i == j:
-                continue
-            try:
-                out.append(await compute_pair_opportunity(symbol, buy_ex, sell_ex, budget_quote, withdraw_fee_base))
-            except Exception as e:
-                out.append({"ok": 0, "symbol": symbol, "buy": buy_ex, "sell": sell_ex, "error": str(e)})
+    for (buy_ex, sell_ex), task in zip(pairs, tasks):
+        if task.done() and not task.cancelled():
+            out.append(task.result())
+        else:
+            out.append({"ok": 0, "reason": "timeout", "symbol": symbol, "buy": buy_ex, "sell": sell_ex})
     out.sort(key=lambda x: (x.get("depth_result", {}).get("net_profit_quote") or -1e18), reverse=True)
     return out
@@ -0,0 +1,133 @@
+"""Niet-blokkerende REST-laag rond ccxt (moet gelijk blijven in bot en api).
+
+Elke call krijgt een deadline (``REST_TIMEOUT_SEC``) en een per-exchange semafoor, zodat één
+trage venue nooit de event loop of de andere venues ophoudt. Voorkeur: ``ccxt.async_support``
+(annuleerbaar); zonder async-ondersteuning draait de sync-call in een begrensde thread-pool.
+Bij een timeout stopt het wachten; een thread-call loopt op de achtergrond uit tot ccxt's eigen timeout.
+"""
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .metrics import REST_CALLS, REST_SECONDS
+
+REST_TIMEOUT_SEC = float(os.getenv("REST_TIMEOUT_SEC", "5"))
+# load_markets is zwaarder (Coinbase/Kraken: duizenden markets) en mag langer duren
+REST_MARKETS_TIMEOUT_SEC = float(os.getenv("REST_MARKETS_TIMEOUT_SEC", "30"))
+REST_MAX_WORKERS = int(os.getenv("REST_MAX_WORKERS", "8"))
+REST_MAX_PER_EXCHANGE = int(os.getenv("REST_MAX_PER_EXCHANGE", "4"))
+# 0: altijd sync ccxt in de thread-pool (bv. als aiohttp ontbreekt of voor debugging)
+REST_USE_ASYNC = os.getenv("REST_USE_ASYNC", "1").lower() not in ("0", "false", "no")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_sems: Dict[str, asyncio.Semaphore] = {}
+_market_locks: Dict[str, asyncio.Lock] = {}
+_async_exchanges: Dict[str, Any] = {}
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=REST_MAX_WORKERS, thread_name_prefix="ccxt-rest")
+    return _executor
+
+def _sem(name: str) -> asyncio.Semaphore:
+    sem = _sems.get(name)
+    if sem is None:
+        sem = _sems[name] = asyncio.Semaphore(REST_MAX_PER_EXCHANGE)
+    return sem
+
+def async_exchange(name: str):
+    """Gedeelde ``ccxt.async_support``-instantie, of None als die niet beschikbaar is."""
+    if not REST_USE_ASYNC:
+        return None
+    ex = _async_exchanges.get(name)
+    if ex is None:
+        try:
+            import ccxt.async_support as ccxt_async
+            klass = getattr(ccxt_async, name)
+        except (ImportError, AttributeError):
+            return None
+        # ccxt-timeout als bovengrens per HTTP-request; de deadline per call is korter
+        ex = _async_exchanges[name] = klass({"enableRateLimit": True, "timeout": int(REST_MARKETS_TIMEOUT_SEC * 1000)})
+    return ex
+
+async def run_blocking(name: str, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+    """Sync-call in de begrensde thread-pool, met deadline en per-exchange limiet."""
+    loop = asyncio.get_running_loop()
+    async with _sem(name):
+        fut = loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+        return await asyncio.wait_for(fut, REST_TIMEOUT_SEC if timeout is None else timeout)
+
+async def run_async(name: str, coro_fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+    """Async ccxt-call met deadline en per-exchange limiet; bij timeout wordt het request geannuleerd."""
+    async with _sem(name):
+        return await asyncio.wait_for(coro_fn(*args, **kwargs), REST_TIMEOUT_SEC if timeout is None else timeout)
+
+async def _observed(name: str, method: str, aw: Awaitable):
+    """Telt elke REST-call per exchange/methode met uitkomst (ok | timeout | error) en duur."""
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        res = await aw
+        outcome = "ok"
+        return res
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    finally:
+        REST_SECONDS.labels(name, method).observe(time.perf_counter() - t0)
+        REST_CALLS.labels(name, method, outcome).inc()
+
+async def call(name: str, sync_ex, method: str, *args, timeout: Optional[float] = None, **kwargs):
+    """``method`` op de async-instantie van ``name``; valt terug op ``sync_ex`` in de thread-pool."""
+    ex = async_exchange(name)
+    if ex is not None:
+        return await _observed(name, method, run_async(name, getattr(ex, method), *args, timeout=timeout, **kwargs))
+    return await _observed(name, method, run_blocking(name, getattr(sync_ex, method), *args, timeout=timeout, **kwargs))
+
+async def ensure_markets(name: str, sync_ex, timeout: Optional[float] = None):
+    """Markets eenmalig laden zonder de loop te blokkeren; sync- en async-instantie delen het resultaat."""
+    ex = async_exchange(name)
+    if not sync_ex.markets:
+        lock = _market_locks.setdefault(name, asyncio.Lock())
+        async with lock:  # gelijktijdige eerste aanvragen laden maar één keer
+            if not sync_ex.markets:
+                timeout = REST_MARKETS_TIMEOUT_SEC if timeout is None else timeout
+                if ex is not None:
+                    await _observed(name, "load_markets", run_async(name, ex.load_markets, timeout=timeout))
+                    sync_ex.set_markets(ex.markets, ex.currencies)
+                else:
+                    await _observed(name, "load_markets", run_blocking(name, sync_ex.load_markets, timeout=timeout))
+    if ex is not None and not ex.markets:
+        ex.set_markets(sync_ex.markets, sync_ex.currencies)
+    return sync_ex.markets
+
+async def reload_markets(name: str, sync_ex, timeout: Optional[float] = None):
+    """Markets opnieuw laden op een losse instantie in de thread-pool en pas daarna, in één stap op de
+    loop, in de sync- en async-instantie zetten: lezers zien nooit een half vervangen ``markets`` en
+    beide instanties houden dezelfde markets."""
+    fresh = type(sync_ex)({"enableRateLimit": True, "timeout": sync_ex.timeout})
+    timeout = REST_MARKETS_TIMEOUT_SEC if timeout is None else timeout
+    await _observed(name, "load_markets", run_blocking(name, fresh.load_markets, timeout=timeout))
+    sync_ex.set_markets(fresh.markets, fresh.currencies)
+    ex = async_exchange(name)
+    if ex is not None:
+        ex.set_markets(fresh.markets, fresh.currencies)
+    return sync_ex.markets
+
+async def close_rest() -> None:
+    global _executor
+    for ex in list(_async_exchanges.values()):
+        try:
+            await ex.close()
+        except Exception:
+            pass
+    _async_exchanges.clear()
+    _sems.clear()
+    _market_locks.clear()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
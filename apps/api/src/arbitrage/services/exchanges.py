@@ -1,8 +1,12 @@
+import asyncio, os
 import ccxt
-from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, Any
+from .async_rest import call, ensure_markets, reload_markets
+from .market_index import index_for
 from .symbols import resolve_symbol_for_exchange
 
+MARKETS_REFRESH_SEC = float(os.getenv("MARKETS_REFRESH_SEC", "3600"))
+
 SUPPORTED = {
     "bitvavo": ccxt.bitvavo,
     "coinbase": ccxt.coinbase,  # Advanced Trade spot
@@ -32,17 +36,42 @@ def _sanitize_levels(levels):
             continue
     return out
 
-@lru_cache(maxsize=16)
+_EXCHANGES: Dict[str, Any] = {}
+
 def get_exchange(name: str):
     name = name.lower()
-    if name not in SUPPORTED:
-        raise ValueError(f"Exchange '{name}' not supported")
-    klass = SUPPORTED[name]
-    return klass({"enableRateLimit": True, "timeout": 20000})
+    ex = _EXCHANGES.get(name)
+    if ex is None:
+        if name not in SUPPORTED:
+            raise ValueError(f"Exchange '{name}' not supported")
+        ex = _EXCHANGES[name] = SUPPORTED[name]({"enableRateLimit": True, "timeout": 20000})
+    return ex
 
 def load_markets(name: str) -> Dict[str, Dict[str, Any]]:
     ex = get_exchange(name)
-    return ex.load_markets()
+    return ex.markets or ex.load_markets()
+
+async def get_market_meta_async(name: str, symbol: str):
+    """Als ``get_market_meta``, maar laadt markets (eerste keer) zonder de loop te blokkeren."""
+    await ensure_markets(name, get_exchange(name))
+    return get_market_meta(name, symbol)
+
+async def refresh_markets() -> None:
+    """Markets van alle gebruikte exchanges herladen (in de thread-pool) en hun index opnieuw opbouwen.
+
+    Markets (sync én async) en index wisselen samen op de loop, zonder await ertussen.
+    """
+    for name, ex in list(_EXCHANGES.items()):
+        try:
+            await reload_markets(name, ex)
+            index_for(ex)
+        except Exception as e:
+            print(f"[markets] refresh failed for {name}:", e)
+
+async def refresh_markets_loop():
+    while True:
+        await asyncio.sleep(MARKETS_REFRESH_SEC)
+        await refresh_markets()
 
 def list_symbols(name: str) -> List[str]:
     markets = load_markets(name)
@@ -59,59 +88,43 @@ def list_symbols_with_quote(name: str, quote: str) -> List[str]:
             out.append(sym)
     return sorted(out)
 
-def fetch_orderbook(name: str, symbol: str, limit: int = 50):
-    ex = get_exchange(name)
-    sym = resolve_symbol_for_exchange(ex, symbol)
-    ob = ex.fetch_order_book(sym, limit=limit)
+def _book_from_ccxt(ob):
     asks = _sanitize_levels(ob.get("asks"))
     bids = _sanitize_levels(ob.get("bids"))
     asks.sort(key=lambda x: x[0])
     bids.sort(key=lambda x: x[0], reverse=True)
     return asks, bids
 
+def fetch_orderbook(name: str, symbol: str, limit: int = 50):
+    # blokkerend: alleen buiten de event loop gebruiken (scripts, sync endpoints)
+    ex = get_exchange(name)
+    sym = resolve_symbol_for_exchange(ex, symbol)
+    return _book_from_ccxt(ex.fetch_order_book(sym, limit=limit))
+
+async def fetch_orderbook_async(name: str, symbol: str, limit: int = 50, timeout: float = None):
+    """REST-orderboek zonder de loop te blokkeren; deadline via ``async_rest`` (asyncio.TimeoutError).
+
+    Met ``timeout`` valt ook een (koude) ``load_markets`` binnen dezelfde deadline als de fetch.
+    """
+    ex = get_exchange(name)
+
+    async def fetch():
+        await ensure_markets(name, ex)
+        sym = resolve_symbol_for_exchange(ex, symbol)
+        return _book_from_ccxt(await call(name, ex, "fetch_order_book", sym, limit=limit, timeout=timeout))
+
+    if timeout is None:
+        return await fetch()
+    return await asyncio.wait_for(fetch(), timeout)
+
 def fetch_ticker(name: str, symbol: str):
     ex = get_exchange(name)
     sym = resolve_symbol_for_exchange(ex, symbol)
     return ex.fetch_ticker(sym)
 
 def get_market_meta(name: str, symbol: str):
-    ex = get_exchange(name)
-    sym = resolve_symbol_for_exchange(ex, symbol)
-    markets = ex.load_markets()
-    m = markets[sym]
-    taker = m.get("taker", ex.fees.get("trading", {}).get("taker"))
-    maker = m.get("maker", ex.fees.get("trading", {}).get("maker"))
-    precision = (m.get("precision") or {})
-    limits = (m.get("limits") or {})
-    base_step = precision.get("amount")
-    price_step = precision.get("price")
-    min_base = (limits.get("amount") or {}).get("min")
-    max_base = (limits.get("amount") or {}).get("max")
-    min_cost = (limits.get("cost") or {}).get("min")
-    max_cost = (limits.get("cost") or {}).get("max")
-    withdraws = ex.fees.get("funding", {}).get("withdraw", {}) if getattr(ex, "fees", None) else {}
-    base = (m.get("base") or "").upper()
-    withdraw_fee_base = None
-    if isinstance(withdraws, dict) and base in withdraws:
-        fee_val = withdraws[base]
-        if isinstance(fee_val, dict):
-            withdraw_fee_base = fee_val.get("fee")
-        elif isinstance(fee_val, (int, float)):
-            withdraw_fee_base = float(fee_val)
-    return {
-        "taker_fee": float(taker) if taker is not None else None,
-        "maker_fee": float(maker) if maker is not None else None,
-        "base_step": float(base_step) if base_step else None,
-        "price_step": float(price_step) if price_step else None,
-        "min_base": float(min_base) if min_base else None,
-        "max_base": float(max_base) if max_base else None,
-        "min_notional": float(min_cost) if min_cost else None,
-        "max_notional": float(max_cost) if max_cost else None,
-        "withdraw_fee_base": float(withdraw_fee_base) if withdraw_fee_base is not None else None,
-        "base": m.get("base"),
-        "quote": m.get("quote"),
-        "active": bool(m.get("active", True)),
-    }
+    # O(1): record is vooraf opgebouwd bij het laden van de markets (gedeeld, niet muteren)
+    return index_for(get_exchange(name)).meta(symbol, include_inactive=True)
 
 
 def ping(name: str) -> Dict[str, Any]:
@@ -0,0 +1,100 @@
+"""Index per exchange: canoniek symbool → native symbool en vooraf opgebouwde meta-records.
+
+Moet gelijk blijven in bot en api. Wordt één keer per ``load_markets``-resultaat opgebouwd;
+na een reload (nieuw markets-dict) bouwt ``index_for`` automatisch opnieuw. Lookups zijn
+daarna dictionary-hits. Records worden gedeeld: niet muteren.
+"""
+from typing import Any, Dict, Optional
+
+# base-aliassen die als hetzelfde asset gelden (Kraken gebruikt XBT)
+BASE_ALIASES = {"XBT": "BTC"}
+
+def _norm(x: Optional[str]) -> str:
+    return (x or "").upper().strip()
+
+def _canon_base(base: Optional[str]) -> str:
+    b = _norm(base)
+    return BASE_ALIASES.get(b, b)
+
+def _canon_key(base: Optional[str], quote: Optional[str]) -> str:
+    return f"{_canon_base(base)}/{_norm(quote)}"
+
+def _opt_float(v) -> Optional[float]:
+    return float(v) if v else None
+
+def _withdraw_fee(fees: Dict[str, Any], base: str) -> Optional[float]:
+    withdraws = (fees.get("funding") or {}).get("withdraw") or {}
+    if not isinstance(withdraws, dict) or base not in withdraws:
+        return None
+    fee_val = withdraws[base]
+    if isinstance(fee_val, dict):
+        fee_val = fee_val.get("fee")
+    return float(fee_val) if isinstance(fee_val, (int, float)) else None
+
+def build_meta(m: Dict[str, Any], fees: Dict[str, Any]) -> Dict[str, Any]:
+    trading = fees.get("trading") or {}
+    taker = m.get("taker", trading.get("taker"))
+    maker = m.get("maker", trading.get("maker"))
+    precision = m.get("precision") or {}
+    limits = m.get("limits") or {}
+    amount = limits.get("amount") or {}
+    cost = limits.get("cost") or {}
+    return {
+        "taker_fee": float(taker) if taker is not None else None,
+        "maker_fee": float(maker) if maker is not None else None,
+        "base_step": _opt_float(precision.get("amount")),
+        "price_step": _opt_float(precision.get("price")),
+        "min_base": _opt_float(amount.get("min")),
+        "max_base": _opt_float(amount.get("max")),
+        "min_notional": _opt_float(cost.get("min")),
+        "max_notional": _opt_float(cost.get("max")),
+        "withdraw_fee_base": _withdraw_fee(fees, _norm(m.get("base"))),
+        "base": m.get("base"),
+        "quote": m.get("quote"),
+        "active": bool(m.get("active", True)),
+    }
+
+class MarketIndex:
+    def __init__(self, exchange_id: str, markets: Dict[str, Dict[str, Any]], fees: Optional[Dict[str, Any]] = None):
+        self.exchange_id = exchange_id
+        self.markets = markets
+        self.fees = fees = fees or {}
+        self._active: Dict[str, str] = {}
+        self._inactive: Dict[str, str] = {}
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        for sym, m in markets.items():
+            if not m or not m.get("symbol"):
+                continue
+            key = _canon_key(m.get("base"), m.get("quote"))
+            # eerste market in load_markets-volgorde wint, net als de oude lineaire zoektocht
+            (self._active if m.get("active", True) else self._inactive).setdefault(key, m["symbol"])
+            self._meta[sym] = build_meta(m, fees)
+
+    def resolve(self, canonical_symbol: str, include_inactive: bool = False) -> str:
+        if canonical_symbol in self.markets:
+            return canonical_symbol
+        if "/" not in canonical_symbol:
+            raise ValueError(f"Invalid symbol '{canonical_symbol}', expected BASE/QUOTE")
+        base, quote = canonical_symbol.split("/", 1)
+        key = _canon_key(base, quote)
+        native = self._active.get(key) or (self._inactive.get(key) if include_inactive else None)
+        if native is None:
+            raise ValueError(f"Symbol '{canonical_symbol}' not found for exchange '{self.exchange_id}'")
+        return native
+
+    def meta(self, canonical_symbol: str, include_inactive: bool = False) -> Dict[str, Any]:
+        native = self.resolve(canonical_symbol, include_inactive)
+        rec = self._meta.get(native)
+        if rec is None:  # market zonder "symbol"-veld: alleen via directe hit bereikbaar
+            rec = self._meta[native] = build_meta(self.markets[native], self.fees)
+        return rec
+
+_INDEXES: Dict[int, MarketIndex] = {}
+
+def index_for(ex) -> MarketIndex:
+    """Index voor een (sync) ccxt-exchange; opnieuw opgebouwd zodra ``ex.markets`` vervangen is."""
+    markets = ex.markets or ex.load_markets()
+    idx = _INDEXES.get(id(ex))
+    if idx is None or idx.markets is not markets:
+        idx = _INDEXES[id(ex)] = MarketIndex(getattr(ex, "id", "?"), markets, getattr(ex, "fees", None))
+    return idx
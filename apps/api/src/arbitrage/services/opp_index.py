@@ -0,0 +1,199 @@
+"""Secundaire indexen over gepubliceerde kansen (moet gelijk blijven in bot en api).
+
+De bot schrijft bij elke ``publish_opportunities`` (in dezelfde pipeline), de API leest:
+
+    {P}:items                    hash   id → item-JSON (velden van ``schemas.Opportunity``)
+    {P}:recent, {P}:sym:{sym}    list   item-JSON, nieuwste eerst (LRANGE = één call)
+    {P}:profit[:{sym}]           zset   score net_profit_quote, member "id|spread_bps"
+    {P}:spread[:{sym}]           zset   score spread_bps,       member "id|net_profit_quote"
+    {P}:ids                      list   "id|symbol|spread|net", nieuwste eerst (voor het opruimen)
+
+Een id is ``{ts}-{origin}-{seq}``: ``origin`` is de replica (``SHARD_ID``, anders host-pid), zodat
+replica's in dezelfde milliseconde elkaars records in ``{P}:items`` niet overschrijven.
+
+De zset-members dragen de andere score mee, zodat een query met beide filters op één index kan
+lopen zonder extra call per item; een gefilterde "nieuwste eerst"-query leest de zset vanaf de
+drempel en sorteert op de ts in het id (ook twee calls). Het opruimen gebeurt in batches: pas als ``{P}:ids`` meer dan
+``OPP_INDEX_MAXLEN + OPP_INDEX_TRIM_BATCH`` entries heeft, gaan de oudste uit alle indexen, in één
+MULTI onder WATCH op ``{P}:ids`` (een gelijktijdige writer laat de trim opnieuw lezen).
+"""
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from redis.exceptions import WatchError
+
+OPP_INDEX_PREFIX = os.getenv("OPP_INDEX_PREFIX", "opps")
+OPP_INDEX_MAXLEN = int(os.getenv("OPP_INDEX_MAXLEN", "10000"))
+OPP_INDEX_SYMBOL_MAXLEN = int(os.getenv("OPP_INDEX_SYMBOL_MAXLEN", "1000"))
+OPP_INDEX_TRIM_BATCH = int(os.getenv("OPP_INDEX_TRIM_BATCH", "500"))
+OPP_INDEX_TRIM_RETRIES = 5
+
+# "|" scheidt de velden in zset- en ids-members
+_ORIGIN = (os.getenv("SHARD_ID") or f"{socket.gethostname()}-{os.getpid()}").replace("|", "_")
+_seq = 0
+
+def key(*parts: str) -> str:
+    return ":".join((OPP_INDEX_PREFIX,) + parts)
+
+def to_record(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Strategy-item → index-record; None voor items zonder paar of zonder fill (cycli, fouten)."""
+    if item.get("kind") == "cycle" or not item.get("buy") or not item.get("sell") or not item.get("best_ask"):
+        return None
+    d = item.get("depth") or {}
+    qty = float(d.get("qty_base_sold") or d.get("qty_base_bought") or 0.0)
+    if qty <= 0:
+        return None
+    return {
+        "symbol": item["symbol"],
+        "buy_exchange": item["buy"],
+        "sell_exchange": item["sell"],
+        "spread_bps": float(item.get("gross_spread") or 0.0) * 10000.0,
+        "net_profit_quote": float(d.get("net_profit_quote") or 0.0),
+        "qty_base": qty,
+        "ts": int(item.get("ts") or time.time() * 1000),
+        "ok": int(item.get("ok") or 0),
+    }
+
+def _next_id(ts: int) -> str:
+    global _seq
+    _seq = (_seq + 1) % 1000000
+    return f"{ts}-{_ORIGIN}-{_seq}"
+
+def add_to_pipeline(pipe, items: List[Dict[str, Any]]) -> int:
+    """Zet de index-writes voor ``items`` in ``pipe``; geeft het aantal gequeue'de commands terug.
+
+    Het laatste command is de LPUSH op ``{P}:ids``; zijn resultaat (lengte) gaat naar ``needs_trim``.
+    """
+    recs = [r for r in map(to_record, items) if r is not None]
+    if not recs:
+        return 0
+    ids, blobs, id_recs = {}, [], []
+    by_symbol: Dict[str, List[bytes]] = {}
+    n = 0
+    for rec in recs:
+        oid = _next_id(rec["ts"])
+        blob = orjson.dumps(rec)
+        sym, spread, net = rec["symbol"], rec["spread_bps"], rec["net_profit_quote"]
+        ids[oid] = blob
+        blobs.append(blob)
+        by_symbol.setdefault(sym, []).append(blob)
+        id_recs.append(f"{oid}|{sym}|{spread!r}|{net!r}")
+        for idx, score, other in (("profit", net, spread), ("spread", spread, net)):
+            member = f"{oid}|{other!r}"
+            pipe.zadd(key(idx), {member: score})
+            pipe.zadd(key(idx, sym), {member: score})
+            n += 2
+    pipe.hset(key("items"), mapping=ids)
+    # LPUSH met meerdere waarden zet de laatste vooraan: omgedraaid staat het beste item van de batch bovenaan
+    pipe.lpush(key("recent"), *reversed(blobs))
+    pipe.ltrim(key("recent"), 0, OPP_INDEX_MAXLEN - 1)
+    n += 3
+    for sym, sym_blobs in by_symbol.items():
+        pipe.lpush(key("sym", sym), *reversed(sym_blobs))
+        pipe.ltrim(key("sym", sym), 0, OPP_INDEX_SYMBOL_MAXLEN - 1)
+        n += 2
+    pipe.lpush(key("ids"), *id_recs)
+    return n + 1
+
+def needs_trim(ids_len: int) -> bool:
+    return ids_len > OPP_INDEX_MAXLEN + OPP_INDEX_TRIM_BATCH
+
+async def trim(redis) -> int:
+    """Oudste entries voorbij ``OPP_INDEX_MAXLEN`` uit hash en zsets halen; geeft het aantal terug.
+
+    LRANGE en LTRIM/ZREM/HDEL zijn samen atomair (WATCH + MULTI): schuift een writer tussendoor
+    nieuwe ids in de lijst, dan wordt opnieuw gelezen i.p.v. ids weg te knippen die niet zijn opgeruimd.
+    """
+    async with redis.pipeline(transaction=True) as pipe:
+        for _ in range(OPP_INDEX_TRIM_RETRIES):
+            try:
+                await pipe.watch(key("ids"))
+                old = await pipe.lrange(key("ids"), OPP_INDEX_MAXLEN, -1)
+                if not old:
+                    await pipe.unwatch()
+                    return 0
+                pipe.multi()
+                pipe.ltrim(key("ids"), 0, OPP_INDEX_MAXLEN - 1)
+                gone: List[str] = []
+                for raw in old:
+                    oid, sym, spread, net = (raw.decode() if isinstance(raw, bytes) else raw).split("|")
+                    gone.append(oid)
+                    for idx, other in (("profit", spread), ("spread", net)):
+                        member = f"{oid}|{other}"
+                        pipe.zrem(key(idx), member)
+                        pipe.zrem(key(idx, sym), member)
+                pipe.hdel(key("items"), *gone)
+                await pipe.execute()
+                return len(gone)
+            except WatchError:
+                continue
+    return 0  # blijft het druk, dan probeert de volgende publish het opnieuw
+
+def _newest_first(oid: str) -> Tuple[int, str, int]:
+    # id = "{ts}-{origin}-{seq}" (origin kan zelf "-" bevatten)
+    ts, rest = oid.split("-", 1)
+    origin, seq = rest.rsplit("-", 1)
+    return -int(ts), origin, int(seq)
+
+async def _recent(redis, symbol: Optional[str], min_profit: Optional[float], min_spread_bps: Optional[float],
+                  limit: int, offset: int) -> List[Dict[str, Any]]:
+    if min_profit is None and min_spread_bps is None:
+        raw = await redis.lrange(key("sym", symbol) if symbol else key("recent"), offset, offset + limit - 1)
+        return [orjson.loads(x) for x in raw]
+    # gefilterd maar nieuwste eerst: alle members boven de drempel uit één zset (de andere drempel
+    # staat in het member), sorteren op de ts in het id, daarna één HMGET
+    idx, lo, other_min = (("profit", min_profit, min_spread_bps) if min_profit is not None
+                          else ("spread", min_spread_bps, None))
+    members = await redis.zrangebyscore(key(idx, symbol) if symbol else key(idx), lo, "+inf")
+    ids = [oid for oid, other in map(_split, members) if other_min is None or other >= other_min]
+    ids = sorted(ids, key=_newest_first)[offset:offset + limit]
+    if not ids:
+        return []
+    return [orjson.loads(x) for x in await redis.hmget(key("items"), ids) if x]
+
+def _split(member) -> Tuple[str, float]:
+    oid, other = (member.decode() if isinstance(member, bytes) else member).split("|", 1)
+    return oid, float(other)
+
+async def query(
+    redis,
+    symbol: Optional[str] = None,
+    min_profit: Optional[float] = None,
+    min_spread_bps: Optional[float] = None,
+    limit: int = 20,
+    offset: int = 0,
+    order: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Gefilterde, gepagineerde records uit de index; de volgorde hangt alleen van ``order`` af.
+
+    ``order`` None of ``"recent"``: nieuwste eerst; zonder filters één LRANGE op de lijst, met filters
+    één ZRANGEBYSCORE op de profit- (of spread-)zset vanaf de drempel, gesorteerd op de ts in het id,
+    en één HMGET. ``order="profit"|"spread"``: hoogste score eerst via de zset, de tweede drempel op
+    de score in het member; daarna één HMGET.
+    """
+    if order not in ("profit", "spread"):
+        return await _recent(redis, symbol, min_profit, min_spread_bps, limit, offset)
+
+    zkey = key(order, symbol) if symbol else key(order)
+    lo, other_min = (min_profit, min_spread_bps) if order == "profit" else (min_spread_bps, min_profit)
+    lo = "-inf" if lo is None else lo
+    want = offset + limit
+    ids: List[str] = []
+    start, batch = 0, max(want * 2, 100)
+    while len(ids) < want:
+        members = await redis.zrevrangebyscore(zkey, "+inf", lo, start=start, num=batch)
+        for m in members:
+            oid, other = _split(m)
+            if other_min is None or other >= other_min:
+                ids.append(oid)
+        if len(members) < batch:
+            break
+        start += batch
+        batch *= 2  # zeldzame tweede drempel: grotere stappen
+    ids = ids[offset:want]
+    if not ids:
+        return []
+    return [orjson.loads(x) for x in await redis.hmget(key("items"), ids) if x]
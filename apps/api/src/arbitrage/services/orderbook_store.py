@@ -1,23 +1,76 @@
-import os, time, orjson
-from typing import Optional, Tuple, List
-from redis.asyncio import from_url as redis_from_url
+import asyncio, contextlib, os, time
+from typing import Dict, Iterable, Optional, Tuple, List
+from .book_codec import decode_book
+from .book_deltas import DeltaBookFollower
+from .metrics import BOOK_AGE, observe_age
+from .redis_pool import get_redis
 
-REDIS_URL = os.getenv("REDIS_URL","redis://redis:6379/0")
 STALE_MS = int(float(os.getenv("ORDERBOOK_STALE_MS","5000")))
+# 1: boeken lokaal bijhouden via de delta-streams (obd:*) van de bot
+ORDERBOOK_DELTAS = os.getenv("ORDERBOOK_DELTAS","0").lower() in ("1","true","yes")
+
+_follower: Optional[DeltaBookFollower] = None
+_follower_task: Optional[asyncio.Task] = None
 
 def _key(exchange: str, symbol: str) -> str: return f"ob:{exchange}:{symbol}"
 
+# (asks, bids, ts): boek met zijn exchange-/stream-timestamp in ms (0 = onbekend)
+AgedBook = Tuple[List[tuple], List[tuple], int]
+
+def _decode(data, exchange: str, symbol: str) -> Optional[AgedBook]:
+    # binair (book_codec) of JSON; beide komen gesorteerd terug
+    if not data: return None
+    book = decode_book(data)
+    observe_age(BOOK_AGE, book.ts, exchange, symbol, "redis")
+    if book.ts and (time.time()*1000 - book.ts) > STALE_MS: return None
+    return book.asks, book.bids, book.ts
+
+def _get_follower() -> DeltaBookFollower:
+    global _follower, _follower_task
+    if _follower is None:
+        _follower = DeltaBookFollower(get_redis())
+        _follower_task = asyncio.create_task(_follower.run())
+    return _follower
+
+async def close_follower() -> None:
+    global _follower, _follower_task
+    if _follower_task is not None:
+        _follower_task.cancel()
+        with contextlib.suppress(BaseException):
+            await _follower_task
+    _follower = _follower_task = None
+
+def _from_deltas(exchange: str, symbol: str):
+    """(gevonden, boek) uit de gevolgde delta-streams; eerste aanvraag registreert het boek."""
+    if not ORDERBOOK_DELTAS: return False, None
+    follower = _get_follower()
+    follower.follow(exchange, symbol)
+    got = follower.get(exchange, symbol)
+    if got is None or (got[0] and (time.time()*1000 - got[0]) > STALE_MS): return False, None
+    observe_age(BOOK_AGE, got[0], exchange, symbol, "deltas")
+    return True, (got[1], got[2], got[0])
+
 async def get_cached_orderbook(exchange: str, symbol: str) -> Optional[Tuple[List[tuple], List[tuple]]]:
-    r = redis_from_url(REDIS_URL, decode_responses=False)
-    try:
-        data = await r.get(_key(exchange, symbol))
-        if not data: return None
-        snap = orjson.loads(data)
-        ts = int(snap.get("ts") or 0)
-        if ts and (time.time()*1000 - ts) > STALE_MS: return None
-        asks = [(float(p), float(a)) for p,a in snap.get("asks", [])]
-        bids = [(float(p), float(a)) for p,a in snap.get("bids", [])]
-        asks.sort(key=lambda x:x[0]); bids.sort(key=lambda x:x[0], reverse=True)
-        return asks, bids
-    finally:
-        await r.close()
+    found, book = _from_deltas(exchange, symbol)
+    if not found: book = _decode(await get_redis().get(_key(exchange, symbol)), exchange, symbol)
+    return book[:2] if book else None
+
+async def get_cached_orderbooks_aged(books: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[AgedBook]]:
+    """Alle gevraagde (exchange, symbol)-boeken als (asks, bids, ts): delta-boeken lokaal, de rest in één MGET;
+    elk boek één keer gedecodeerd, ontbrekende en stale boeken zijn None."""
+    out: Dict[Tuple[str, str], Optional[AgedBook]] = {}
+    missing = []
+    for book in dict.fromkeys(books):
+        found, val = _from_deltas(*book)
+        if found: out[book] = val
+        else: missing.append(book)
+    if missing:
+        raw = await get_redis().mget([_key(ex, sym) for ex, sym in missing])
+        for book, data in zip(missing, raw):
+            out[book] = _decode(data, *book)
+    return out
+
+async def get_cached_orderbooks(books: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[Tuple[List[tuple], List[tuple]]]]:
+    """Als ``get_cached_orderbooks_aged``, zonder timestamps."""
+    aged = await get_cached_orderbooks_aged(books)
+    return {book: val[:2] if val else None for book, val in aged.items()}
@@ -0,0 +1,148 @@
+"""Lopende PnL-aggregaten van paper-fills in Redis-hashes (moet gelijk blijven in bot en api).
+
+De paper-executor werkt per fill een vast aantal hashes bij (O(1), in dezelfde pipeline als de XADD),
+de API leest ze met een paar HGETALLs i.p.v. de gecapte ``paper_trades``-stream op te tellen:
+
+    {P}:total                          hash   alle fills
+    {P}:sym:{symbol}                   hash   per symbool      (leden in set {P}:symbols)
+    {P}:route:{buy}>{sell}             hash   per route        (leden in set {P}:routes)
+    {P}:bucket:{res}:{start_ms}        hash   per minuut/uur/dag (res = m | h | d), met TTL per resolutie
+
+Velden: ``fills``, ``wins``, ``net_quote``, ``volume_quote`` (uitgegeven quote), ``qty_base``,
+``latency_cost_quote`` (alleen fills met boek-model) en ``last_ts``.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+PNL_PREFIX = os.getenv("PNL_PREFIX", "pnl")
+# bewaartermijn per bucket-resolutie in seconden; 0 = geen TTL
+PNL_TTL_SEC = {
+    "m": int(os.getenv("PNL_TTL_MINUTE_SEC", str(2 * 86400))),
+    "h": int(os.getenv("PNL_TTL_HOUR_SEC", str(30 * 86400))),
+    "d": int(os.getenv("PNL_TTL_DAY_SEC", "0")),
+}
+BUCKET_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+RESOLUTIONS = {"minute": "m", "hour": "h", "day": "d", "m": "m", "h": "h", "d": "d"}
+
+_INT_FIELDS = ("fills", "wins")
+
+def key(*parts: str) -> str:
+    return ":".join((PNL_PREFIX,) + parts)
+
+def route(buy: str, sell: str) -> str:
+    return f"{buy}>{sell}"
+
+def bucket_start(ts_ms: int, res: str) -> int:
+    return ts_ms - ts_ms % BUCKET_MS[res]
+
+def add_to_pipeline(pipe, trades: Iterable[Dict[str, Any]]) -> int:
+    """Zet de aggregaat-updates voor ``trades`` in ``pipe`` (per batch eerst lokaal opgeteld).
+
+    Geeft het aantal gequeue'de commands terug.
+    """
+    sums: Dict[str, Dict[str, float]] = {}
+    last: Dict[str, int] = {}
+    symbols, routes, buckets = set(), set(), {}
+    for t in trades:
+        ts = int(t.get("ts") or 0)
+        sym, rt = t.get("symbol") or "", route(t.get("buy") or "", t.get("sell") or "")
+        symbols.add(sym)
+        routes.add(rt)
+        keys = [key("total"), key("sym", sym), key("route", rt)]
+        for res in BUCKET_MS:
+            bk = key("bucket", res, str(bucket_start(ts, res)))
+            buckets[bk] = res
+            keys.append(bk)
+        net = float(t.get("net_profit_quote") or 0.0)
+        delta = {
+            "fills": 1,
+            "wins": 1 if net > 0 else 0,
+            "net_quote": net,
+            "volume_quote": float(t.get("spent_quote") or 0.0),
+            "qty_base": float(t.get("qty_base") or 0.0),
+        }
+        if "latency_cost_quote" in t:
+            delta["latency_cost_quote"] = float(t["latency_cost_quote"] or 0.0)
+        for k in keys:
+            acc = sums.setdefault(k, {})
+            for f, v in delta.items():
+                acc[f] = acc.get(f, 0) + v
+            last[k] = max(last.get(k, 0), ts)
+
+    n = 0
+    for k, acc in sums.items():
+        for f, v in acc.items():
+            if f in _INT_FIELDS:
+                if v:
+                    pipe.hincrby(k, f, int(v))
+                    n += 1
+            else:
+                pipe.hincrbyfloat(k, f, v)
+                n += 1
+        pipe.hset(k, "last_ts", last[k])
+        n += 1
+    for bk, res in buckets.items():
+        if PNL_TTL_SEC[res] > 0:
+            pipe.expire(bk, PNL_TTL_SEC[res])
+            n += 1
+    if symbols:
+        pipe.sadd(key("symbols"), *symbols)
+        n += 1
+    if routes:
+        pipe.sadd(key("routes"), *routes)
+        n += 1
+    return n
+
+def empty() -> Dict[str, Any]:
+    return {"fills": 0, "wins": 0, "net_quote": 0.0, "volume_quote": 0.0, "win_rate": 0.0, "avg_net_quote": 0.0}
+
+def _decode(raw: Dict[Any, Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = empty()
+    for f, v in raw.items():
+        f = f.decode() if isinstance(f, bytes) else f
+        v = v.decode() if isinstance(v, bytes) else v
+        out[f] = int(float(v)) if f in _INT_FIELDS or f == "last_ts" else float(v)
+    fills = out["fills"]
+    out["win_rate"] = out["wins"] / fills if fills else 0.0
+    out["avg_net_quote"] = out["net_quote"] / fills if fills else 0.0
+    return out
+
+def _members(raw) -> List[str]:
+    return sorted(m.decode() if isinstance(m, bytes) else m for m in raw)
+
+async def summary(redis) -> Dict[str, Any]:
+    """Totaal, per symbool en per route: twee round-trips ongeacht het aantal fills."""
+    pipe = redis.pipeline(transaction=False)
+    pipe.smembers(key("symbols"))
+    pipe.smembers(key("routes"))
+    pipe.hgetall(key("total"))
+    symbols_raw, routes_raw, total = await pipe.execute()
+    symbols, routes = _members(symbols_raw), _members(routes_raw)
+    pipe = redis.pipeline(transaction=False)
+    for s in symbols:
+        pipe.hgetall(key("sym", s))
+    for r in routes:
+        pipe.hgetall(key("route", r))
+    res = await pipe.execute() if symbols or routes else []
+    return {
+        "total": _decode(total),
+        "symbols": {s: _decode(h) for s, h in zip(symbols, res[:len(symbols)])},
+        "routes": {r: _decode(h) for r, h in zip(routes, res[len(symbols):])},
+    }
+
+def bucket_range(res: str, start_ms: int, end_ms: int, max_buckets: int) -> List[int]:
+    """Bucket-starts van ``start_ms`` t/m ``end_ms``; bij te veel buckets de laatste ``max_buckets``."""
+    step = BUCKET_MS[res]
+    first, last = bucket_start(start_ms, res), bucket_start(end_ms, res)
+    first = max(first, last - (max_buckets - 1) * step)
+    return list(range(first, last + 1, step))
+
+async def series(redis, res: str, start_ms: int, end_ms: int,
+                 max_buckets: int = 1440) -> List[Tuple[int, Optional[Dict[str, Any]]]]:
+    """(bucket-start, aggregaat of None) per bucket in het bereik, in één pipeline."""
+    starts = bucket_range(res, start_ms, end_ms, max_buckets)
+    pipe = redis.pipeline(transaction=False)
+    for b in starts:
+        pipe.hgetall(key("bucket", res, str(b)))
+    raw = await pipe.execute() if starts else []
+    return [(b, _decode(h) if h else None) for b, h in zip(starts, raw)]
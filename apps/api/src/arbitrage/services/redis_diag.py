@@ -1,30 +1,21 @@
-import os, time, orjson
+import time
 from typing import Any, Dict, List
-from redis.asyncio import from_url as redis_from_url
-
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+from .book_codec import to_dict
+from .redis_pool import get_redis
 
 async def keys(pattern: str) -> List[str]:
-    r = redis_from_url(REDIS_URL, decode_responses=True)
-    try:
-        return [k async for k in r.scan_iter(match=pattern)]
-    finally:
-        await r.close()
+    return [k.decode() async for k in get_redis().scan_iter(match=pattern)]
 
 async def get_json(key: str) -> Dict[str, Any]:
-    r = redis_from_url(REDIS_URL, decode_responses=False)
-    try:
-        raw = await r.get(key)
-        if not raw:
-            return {"key": key, "exists": False}
-        snap = orjson.loads(raw)
-        age_ms = None
-        ts = snap.get("ts")
-        if ts:
-            try:
-                age_ms = int(time.time() * 1000) - int(ts)
-            except Exception:
-                age_ms = None
-        return {"key": key, "exists": True, "age_ms": age_ms, "data": snap}
-    finally:
-        await r.close()
+    raw = await get_redis().get(key)
+    if not raw:
+        return {"key": key, "exists": False}
+    snap = to_dict(raw)  # ob:* kan binair zijn
+    age_ms = None
+    ts = snap.get("ts")
+    if ts:
+        try:
+            age_ms = int(time.time() * 1000) - int(ts)
+        except Exception:
+            age_ms = None
+    return {"key": key, "exists": True, "age_ms": age_ms, "data": snap}
@@ -0,0 +1,43 @@
+from typing import Any, Dict, Optional
+from redis.asyncio import Redis, BlockingConnectionPool
+from ..config import settings
+
+_pool: Optional[BlockingConnectionPool] = None
+_client: Optional[Redis] = None
+
+def init_redis() -> Redis:
+    """Eén gedeelde client (bytes, geen decode) op één connection pool per API-proces."""
+    global _pool, _client
+    if _client is None:
+        _pool = BlockingConnectionPool.from_url(
+            settings.redis_url,
+            max_connections=settings.redis_pool_size,
+            timeout=settings.redis_pool_timeout,
+        )
+        _client = Redis(connection_pool=_pool)
+    return _client
+
+def get_redis() -> Redis:
+    # normaal al aangemaakt in de startup-hook; lazy voor scripts/tests
+    return _client if _client is not None else init_redis()
+
+async def close_redis() -> None:
+    global _pool, _client
+    client, pool = _client, _pool
+    _client = _pool = None
+    if client is not None:
+        await client.close()
+    if pool is not None:
+        await pool.disconnect()
+
+def pool_stats() -> Dict[str, Any]:
+    if _pool is None:
+        return {"initialized": False, "max_connections": settings.redis_pool_size}
+    in_use = len(getattr(_pool, "_in_use_connections", ()))
+    idle = len([c for c in getattr(_pool, "_available_connections", ()) if c is not None])
+    return {
+        "initialized": True,
+        "max_connections": _pool.max_connections,
+        "in_use": in_use,
+        "idle": idle,
+    }
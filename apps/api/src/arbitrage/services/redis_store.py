@@ -1,13 +1,23 @@
-import orjson
+from typing import Optional
+
 from redis.asyncio import Redis
 from ..schemas.opportunity import Opportunity
+from . import opp_index
 
-async def fetch_recent_opportunities(redis: Redis, list_key: str, limit: int = 20) -> list[Opportunity]:
-    items = await redis.lrange(list_key, 0, max(0, limit - 1))
+async def fetch_recent_opportunities(
+    redis: Redis,
+    limit: int = 20,
+    offset: int = 0,
+    symbol: Optional[str] = None,
+    min_profit: Optional[float] = None,
+    min_spread_bps: Optional[float] = None,
+    order: Optional[str] = None,
+) -> list[Opportunity]:
+    """Filteren en pagineren gebeurt in Redis (``opp_index``); hier alleen naar het schema."""
+    items = await opp_index.query(redis, symbol, min_profit, min_spread_bps, limit, offset, order)
     out: list[Opportunity] = []
-    for raw in items:
+    for data in items:
         try:
-            data = orjson.loads(raw)
             out.append(Opportunity(**data))
         except Exception:
             continue
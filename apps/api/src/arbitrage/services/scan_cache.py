@@ -0,0 +1,85 @@
+"""Kort-levende cache voor scan-resultaten, met single-flight per key.
+
+Tien dashboards die tegelijk dezelfde ``/arbitrage/scan`` pollen delen één berekening: de eerste
+aanvraag rekent, gelijktijdige identieke aanvragen wachten op dezelfde taak, en het resultaat blijft
+``SCAN_CACHE_TTL_MS`` geldig, maar nooit langer dan het oudste gebruikte boek nog vers is
+(``ORDERBOOK_STALE_MS`` na zijn timestamp). Fouten worden niet gecachet: geen exceptions, en geen
+resultaat dat ``cacheable`` afkeurt (bv. paren met een REST-fout of timeout). Een client die afhaakt
+annuleert de gedeelde taak niet.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from ..config import settings
+from .metrics import SCAN_CACHE
+from .orderbook_store import STALE_MS
+
+class ScanCache:
+    def __init__(self, ttl_ms: int, max_entries: int = 1024):
+        self.ttl = max(min(ttl_ms, STALE_MS), 0) / 1000.0
+        self.max_entries = max(max_entries, 1)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = self.misses = self.coalesced = 0
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Tuple[Any, Optional[int]]]],
+                  cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """``compute`` geeft (resultaat, timestamp in ms van het oudste gebruikte boek of None).
+
+        Met ``cacheable`` wordt een resultaat waarvoor die False geeft alleen gedeeld met de
+        aanvragen die er al op wachtten, niet bewaard.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                SCAN_CACHE.labels("hit").inc()
+                return entry[1]
+            del self._entries[key]
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            SCAN_CACHE.labels("coalesced").inc()
+        else:
+            self.misses += 1
+            SCAN_CACHE.labels("miss").inc()
+            task = self._inflight[key] = asyncio.create_task(self._fill(key, compute, cacheable))
+        return await asyncio.shield(task)
+
+    def _ttl_for(self, oldest_ts_ms: Optional[int]) -> float:
+        if not oldest_ts_ms:
+            return self.ttl
+        left = (STALE_MS - (time.time() * 1000 - oldest_ts_ms)) / 1000.0
+        return max(min(self.ttl, left), 0.0)
+
+    async def _fill(self, key: Hashable, compute: Callable[[], Awaitable[Tuple[Any, Optional[int]]]],
+                    cacheable: Optional[Callable[[Any], bool]]) -> Any:
+        try:
+            value, oldest_ts_ms = await compute()
+            ttl = self._ttl_for(oldest_ts_ms)
+            if ttl > 0 and (cacheable is None or cacheable(value)):
+                self._store(key, value, ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key: Hashable, value: Any, ttl: float) -> None:
+        now = time.monotonic()
+        self._entries[key] = (now + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)  # minst recent opgeslagen eruit
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_ms": int(self.ttl * 1000),
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+scan_cache = ScanCache(settings.scan_cache_ttl_ms, settings.scan_cache_max)
@@ -0,0 +1,203 @@
+"""Gedownsamplede spread-historie per route (moet gelijk blijven in bot en api).
+
+De strategy geeft elke uitkomst van ``evaluate_pairs`` door aan ``SpreadRecorder.observe``, ook voor
+niet-winstgevende paren. Per (symbool, buy, sell) en resolutie (1s, 1m, 1h) houdt de recorder één open
+bucket in het geheugen bij met OHLC van gross spread (bps) en netto winst, de grootste qty die de
+detectie binnen het strategy-budget vulde (``qty_budget_max``, dus niet de volle vulbare diepte), het
+aantal observaties en hoeveel daarvan ok waren. Een eigen taak (``start``) schrijft elke
+``SPREAD_FLUSH_MS`` de gewijzigde buckets naar Redis, ook als er even geen observaties komen:
+
+    {P}:{res}:{symbol}:{buy}>{sell}    zset   score = bucket-start (ms), member = bucket-JSON
+    {P}:routes                         set    "symbol|buy|sell"
+
+Een open bucket wordt bij elke flush vervangen (ZREMRANGEBYSCORE op zijn start + ZADD). Elke
+``SPREAD_TRIM_MS`` gaat voor alle bekende routes (ook die uit ``{P}:routes`` van eerdere processen)
+alles ouder dan ``SPREAD_RETENTION_*_SEC`` uit de zsets; routes zonder buckets gaan uit de set. Elke
+geschreven zset krijgt ook een EXPIRE van zijn retentie, zodat een stilgevallen route vanzelf verdwijnt.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import orjson
+
+SPREAD_PREFIX = os.getenv("SPREAD_PREFIX", "spr")
+SPREAD_FLUSH_MS = int(float(os.getenv("SPREAD_FLUSH_MS", "1000")))
+SPREAD_TRIM_MS = int(float(os.getenv("SPREAD_TRIM_MS", "60000")))
+BUCKET_MS = {"1s": 1_000, "1m": 60_000, "1h": 3_600_000}
+RETENTION_SEC = {
+    "1s": int(os.getenv("SPREAD_RETENTION_1S_SEC", "3600")),
+    "1m": int(os.getenv("SPREAD_RETENTION_1M_SEC", str(7 * 86400))),
+    "1h": int(os.getenv("SPREAD_RETENTION_1H_SEC", str(90 * 86400))),
+}
+
+Route = Tuple[str, str, str]  # (symbol, buy, sell)
+
+def key(res: str, symbol: str, buy: str, sell: str) -> str:
+    return f"{SPREAD_PREFIX}:{res}:{symbol}:{buy}>{sell}"
+
+def routes_key() -> str:
+    return f"{SPREAD_PREFIX}:routes"
+
+class _Bucket:
+    __slots__ = ("t", "n", "ok", "spread", "net", "qty_budget_max")
+
+    def __init__(self, t: int, spread: float, net: float):
+        self.t = t
+        self.n = self.ok = 0
+        self.spread = [spread, spread, spread, spread]  # open, high, low, close
+        self.net = [net, net, net, net]
+        self.qty_budget_max = 0.0
+
+    def add(self, spread: float, net: float, qty: float, ok: bool) -> None:
+        self.n += 1
+        self.ok += 1 if ok else 0
+        s, p = self.spread, self.net
+        if spread > s[1]:
+            s[1] = spread
+        if spread < s[2]:
+            s[2] = spread
+        s[3] = spread
+        if net > p[1]:
+            p[1] = net
+        if net < p[2]:
+            p[2] = net
+        p[3] = net
+        if qty > self.qty_budget_max:
+            self.qty_budget_max = qty
+
+    def dumps(self) -> bytes:
+        return orjson.dumps({"t": self.t, "n": self.n, "ok": self.ok, "spread_bps": self.spread,
+                             "net_quote": self.net, "qty_budget_max": self.qty_budget_max})
+
+class SpreadRecorder:
+    def __init__(self, flush_ms: int = SPREAD_FLUSH_MS, trim_ms: int = SPREAD_TRIM_MS):
+        self.flush_ms = flush_ms
+        self.trim_ms = trim_ms
+        self._open: Dict[Tuple[str, Route], _Bucket] = {}
+        self._dirty: set = set()
+        self._closed: List[Tuple[str, Route, _Bucket]] = []
+        self._new_routes: set = set()
+        self._routes: Set[Route] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def observe(self, items: Iterable[Dict[str, Any]], now_ms: Optional[int] = None) -> None:
+        """Pair-uitkomsten in de open buckets; naar Redis gaan ze met de volgende ``flush``."""
+        now = int(time.time() * 1000) if now_ms is None else now_ms
+        for it in items:
+            if not it or not it.get("best_ask") or "gross_spread" not in it:
+                continue  # fout of leeg boek: geen spread
+            d = it.get("depth") or {}
+            rt = (it["symbol"], it["buy"], it["sell"])
+            spread = float(it["gross_spread"]) * 10000.0
+            net = float(d.get("net_profit_quote") or 0.0)
+            qty = float(d.get("qty_base_sold") or 0.0)
+            ok = bool(it.get("ok"))
+            for res, step in BUCKET_MS.items():
+                t = now - now % step
+                k = (res, rt)
+                b = self._open.get(k)
+                if b is None or b.t != t:
+                    if b is None:
+                        self._new_routes.add(rt)
+                        self._routes.add(rt)
+                    elif k in self._dirty:
+                        self._closed.append((res, rt, b))  # laatste stand nog niet geflusht
+                    b = self._open[k] = _Bucket(t, spread, net)
+                b.add(spread, net, qty, ok)
+                self._dirty.add(k)
+
+    async def flush(self, redis) -> int:
+        """Gewijzigde en afgesloten buckets in één pipeline naar Redis; geeft het aantal buckets terug."""
+        closed, self._closed = self._closed, []
+        dirty, self._dirty = self._dirty, set()
+        new_routes, self._new_routes = self._new_routes, set()
+        if not closed and not dirty:
+            return 0
+        pipe = redis.pipeline(transaction=False)
+        written: Dict[str, str] = {}
+        for res, rt, b in closed + [(res, rt, self._open[(res, rt)]) for res, rt in dirty]:
+            zkey = key(res, *rt)
+            pipe.zremrangebyscore(zkey, b.t, b.t)
+            pipe.zadd(zkey, {b.dumps(): b.t})
+            written[zkey] = res
+        for zkey, res in written.items():
+            pipe.expire(zkey, RETENTION_SEC[res])
+        if new_routes:
+            pipe.sadd(routes_key(), *("|".join(rt) for rt in new_routes))
+        await pipe.execute()
+        return len(closed) + len(dirty)
+
+    async def trim(self, redis, now_ms: Optional[int] = None) -> int:
+        """Retentie voor alle bekende routes (lokaal en uit ``{P}:routes``); geeft het aantal
+        verwijderde routes zonder buckets terug."""
+        now = int(time.time() * 1000) if now_ms is None else now_ms
+        for m in await redis.smembers(routes_key()):
+            self._routes.add(tuple((m.decode() if isinstance(m, bytes) else m).split("|")))
+        routes = sorted(self._routes)
+        if not routes:
+            return 0
+        pipe = redis.pipeline(transaction=False)
+        for rt in routes:
+            for res in BUCKET_MS:
+                pipe.zremrangebyscore(key(res, *rt), "-inf", f"({now - RETENTION_SEC[res] * 1000}")
+            pipe.exists(*(key(res, *rt) for res in BUCKET_MS))
+        got = await pipe.execute()
+        step = len(BUCKET_MS) + 1
+        # een route met een open bucket in dit proces blijft, ook als hij nog niet geflusht is
+        dead = [rt for i, rt in enumerate(routes)
+                if not got[i * step + step - 1] and not any((res, rt) in self._open for res in BUCKET_MS)]
+        if dead:
+            await redis.srem(routes_key(), *("|".join(rt) for rt in dead))
+            self._routes.difference_update(dead)
+        return len(dead)
+
+    async def run(self, redis) -> None:
+        """Flush elke ``flush_ms`` en retentie elke ``trim_ms``, los van de observaties."""
+        last_trim = 0.0
+        while True:
+            await asyncio.sleep(self.flush_ms / 1000.0)
+            try:
+                await self.flush(redis)
+                if (time.monotonic() - last_trim) * 1000 >= self.trim_ms:
+                    last_trim = time.monotonic()
+                    await self.trim(redis)
+            except Exception as e:
+                print("[spreads] flush/trim error:", e)
+
+    def start(self, redis) -> None:
+        """Start de flush/trim-taak als die nog niet loopt (vanuit een draaiende event loop)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(redis))
+
+    async def close(self, redis=None) -> None:
+        """Stopt de taak; met ``redis`` gaat de laatste stand nog naar Redis."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(BaseException):
+                await task
+        if redis is not None:
+            with contextlib.suppress(Exception):
+                await self.flush(redis)
+
+recorder = SpreadRecorder()
+
+async def routes(redis) -> List[Dict[str, str]]:
+    raw = await redis.smembers(routes_key())
+    out = []
+    for m in sorted(x.decode() if isinstance(x, bytes) else x for x in raw):
+        symbol, buy, sell = m.split("|")
+        out.append({"symbol": symbol, "buy": buy, "sell": sell})
+    return out
+
+async def query(redis, symbol: str, buy: str, sell: str, res: str = "1m",
+                start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                limit: int = 1000) -> List[Dict[str, Any]]:
+    """Buckets van één route in [start_ms, end_ms], oudste eerst; één ZRANGEBYSCORE."""
+    lo = "-inf" if start_ms is None else start_ms
+    hi = "+inf" if end_ms is None else end_ms
+    raw = await redis.zrangebyscore(key(res, symbol, buy, sell), lo, hi, start=0, num=limit)
+    return [orjson.loads(x) for x in raw]
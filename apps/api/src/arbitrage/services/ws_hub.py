@@ -0,0 +1,136 @@
+"""Eén Redis-subscriber per API-proces die naar alle WebSocket-clients uitzendt.
+
+Elke client heeft een begrensde wachtrij (``WS_QUEUE_SIZE``); de subscriber wacht nooit op een client.
+Loopt een wachtrij vol, dan volgt ``WS_SLOW_POLICY``:
+
+    conflate   oudste bericht weg, nieuwste erin (latest-wins); de client blijft verbonden
+    drop       client wordt afgesloten (close-code 1013, later opnieuw proberen)
+
+Een bericht wordt één keer gedecodeerd en als dezelfde ``str`` naar alle wachtrijen gezet.
+"""
+import asyncio
+import contextlib
+from typing import Any, Dict, Optional, Set
+
+from ..config import settings
+from .metrics import WS_CLIENTS, WS_DROPS, WS_MESSAGES, WS_QUEUE_DEPTH, WS_QUEUE_MAX
+from .redis_pool import get_redis
+
+class _Client:
+    __slots__ = ("queue", "conflated", "closed")
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(size)
+        self.conflated = 0
+        self.closed = False
+
+class OpportunityHub:
+    def __init__(self, channel: str, queue_size: int = 64, policy: str = "conflate"):
+        self.channel = channel
+        self.queue_size = max(queue_size, 1)
+        self.policy = policy
+        self.clients: Set[_Client] = set()
+        self.messages = 0
+        self.conflated = 0
+        self.disconnected = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self) -> _Client:
+        client = _Client(self.queue_size)
+        self.clients.add(client)
+        WS_CLIENTS.set(len(self.clients))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())  # eerste client start de subscriber
+        return client
+
+    def unregister(self, client: _Client) -> None:
+        self.clients.discard(client)
+        WS_CLIENTS.set(len(self.clients))
+
+    def broadcast(self, text: str) -> None:
+        self.messages += 1
+        WS_MESSAGES.inc()
+        depth = deepest = 0
+        for client in list(self.clients):
+            if client.closed:
+                continue
+            q = client.queue
+            if q.full():
+                if self.policy == "drop":
+                    self._disconnect(client)
+                    continue
+                q.get_nowait()  # oudste eruit: de client krijgt altijd de laatste stand
+                client.conflated += 1
+                self.conflated += 1
+                WS_DROPS.labels("conflated").inc()
+            q.put_nowait(text)
+            depth += q.qsize()
+            deepest = max(deepest, q.qsize())
+        WS_QUEUE_DEPTH.set(depth)
+        WS_QUEUE_MAX.set(deepest)
+
+    def _disconnect(self, client: _Client) -> None:
+        client.closed = True
+        dropped = client.queue.qsize()
+        while not client.queue.empty():
+            client.queue.get_nowait()
+        client.queue.put_nowait(None)  # wekt de sender, die de socket sluit
+        self.disconnected += 1
+        WS_DROPS.labels("disconnected").inc(dropped + 1)
+
+    async def serve(self, ws, client: _Client) -> None:
+        """Stuur de wachtrij van ``client`` naar ``ws`` tot de socket wegvalt of de client gedropt wordt."""
+        while True:
+            text = await client.queue.get()
+            if text is None:
+                await ws.close(code=1013)
+                return
+            await ws.send_text(text)
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                backoff = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        data = message["data"]
+                        self.broadcast(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ws] subscriber error on '{self.channel}', retry in {backoff:.0f}s:", e)
+            finally:
+                with contextlib.suppress(Exception):
+                    await pubsub.unsubscribe(self.channel)
+                    await pubsub.close()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(BaseException):
+                await self._task
+            self._task = None
+        for client in list(self.clients):
+            self._disconnect(client)
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = [c.queue.qsize() for c in self.clients]
+        return {
+            "channel": self.channel,
+            "running": self._task is not None and not self._task.done(),
+            "clients": len(self.clients),
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "queue_depth": sum(sizes),
+            "queue_depth_max": max(sizes, default=0),
+            "messages": self.messages,
+            "conflated": self.conflated,
+            "disconnected": self.disconnected,
+        }
+
+hub = OpportunityHub(settings.opp_channel, settings.ws_queue_size, settings.ws_slow_policy)
@@ -1,29 +1,32 @@
 import asyncio
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from redis.asyncio import from_url as redis_from_url
-from ..config import settings
+import contextlib
+from fastapi import APIRouter, WebSocket
+from ..services.ws_hub import hub
 
 router = APIRouter()
 
+async def _until_disconnect(ws: WebSocket) -> None:
+    # clients sturen niets; receive() merkt wel direct een gesloten socket op
+    while True:
+        msg = await ws.receive()
+        if msg.get("type") == "websocket.disconnect":
+            return
+
 @router.websocket("/ws/opportunities")
 async def websocket_opportunities(ws: WebSocket):
     await ws.accept()
-    redis = redis_from_url(settings.redis_url, decode_responses=True)
-    pubsub = redis.pubsub()
-    await pubsub.subscribe(settings.opp_channel)
+    client = hub.register()  # geen eigen Redis-subscriber: de hub deelt er één per proces
+    sender = asyncio.create_task(hub.serve(ws, client))
+    receiver = asyncio.create_task(_until_disconnect(ws))
     try:
-        async for message in pubsub.listen():
-            if message is None:
-                await asyncio.sleep(0.05)
-                continue
-            if message.get("type") == "message":
-                await ws.send_text(message["data"])
-    except WebSocketDisconnect:
-        pass
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
     finally:
-        try:
-            await pubsub.unsubscribe(settings.opp_channel)
-            await pubsub.close()
-            await redis.close()
-        except Exception:
-            pass
+        hub.unregister(client)
+        for t in (sender, receiver):
+            t.cancel()
+            with contextlib.suppress(BaseException):
+                await t
+
+@router.get("/ws/stats")
+def websocket_stats():
+    return hub.stats()
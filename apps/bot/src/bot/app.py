@@ -1,8 +1,16 @@
 import asyncio, contextlib
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from .workers.stream import run as run_stream
 from .workers.strategy import run as run_strategy
 from .execution.paper import run as run_paper
+from .services.markets import refresh_markets_loop
+from .services.async_rest import close_rest
+from .services.book_refresher import refresher
+from .services import spread_series
+from .services.orderbook_store import close_follower
+from .services.metrics import render as render_metrics
+from .services.redis_pool import get_redis, close_redis, pool_stats
+from .services.sharding import close_shard, get_shard
 
 app = FastAPI(title="Arbitrage Bot (Streams + Strategy + PaperExec)")
 _tasks = []
@@ -10,9 +18,14 @@ _tasks = []
 @app.on_event("startup")
 async def startup():
     global _tasks
+    get_redis()  # één gedeelde connection pool voor alle workers
+    shard = get_shard()
+    if shard is not None:
+        _tasks.append(asyncio.create_task(shard.run()))
     _tasks.append(asyncio.create_task(run_stream()))
     _tasks.append(asyncio.create_task(run_strategy()))
     _tasks.append(asyncio.create_task(run_paper())) 
+    _tasks.append(asyncio.create_task(refresh_markets_loop()))
 
 @app.on_event("shutdown")
 async def shutdown():
@@ -22,6 +35,12 @@ async def shutdown():
     for t in _tasks:
         with contextlib.suppress(Exception):
             await t
+    await close_shard()
+    await refresher.close()
+    await spread_series.recorder.close(get_redis())
+    await close_follower()
+    await close_rest()
+    await close_redis()
 
 @app.get("/health")
 def health():
@@ -30,4 +49,18 @@ def health():
         "service": "bot",
         "tasks": len(_tasks),
         "running": any(not t.done() for t in _tasks),
+        "redis_pool": pool_stats(),
+        "shard": _shard_status(),
+        "book_refresh": refresher.stats(),
     }
+
+def _shard_status():
+    shard = get_shard()
+    if shard is None:
+        return None
+    return {"id": shard.id, "replicas": shard.members, "owned": sorted(k for k in shard.held if shard.owns(k))}
+
+@app.get("/metrics")
+def metrics():
+    body, content_type, status = render_metrics()
+    return Response(body, status_code=status, media_type=content_type)
@@ -0,0 +1,467 @@
+"""Microbenchmarks voor de hete paden: depth-simulatie, level-sanitize, boek-decode, scan-lus en paper.
+
+Draait zonder Redis of netwerk: een in-memory ``FakeRedis`` vervangt de gedeelde client en
+``FakeExchange`` levert markets/meta voor synthetische exchanges (``bench0``, ``bench1``, ...).
+Boeken komen uit ``make_book`` (diepte, tick-afstand, spread en skew instelbaar), met een vaste seed.
+
+    PYTHONPATH=src python -m bot.bench [--quick] [--only sim,scan] [--out base.json]
+    PYTHONPATH=src python -m bot.bench --compare base.json [--fail-over 1.2]
+
+Uitvoer is JSON (``--out`` of ``--json``) met per case de mediaan en het minimum per operatie;
+``--compare`` zet de huidige run naast een eerdere en faalt (exit 2) als een case meer dan
+``--fail-over`` keer trager is. Maak een baseline op de commit vóór een optimalisatie.
+"""
+import argparse
+import asyncio
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from .execution import paper
+from .services import markets, orderbook_store, redis_pool
+from .services.book_codec import decode_book, encode_book
+from .strategy import arbitrage_engine
+from .strategy.arbitrage_engine import scan_all
+from .strategy.depth_sim import simulate_cross_fill
+
+Levels = List[Tuple[float, float]]
+
+# ---------- synthetische data ----------
+
+def make_book(rng: random.Random, mid: float = 100.0, depth: int = 50, tick_bps: float = 1.0,
+              spread_bps: float = 2.0, size: float = 1.0, skew: float = 0.0) -> Tuple[Levels, Levels]:
+    """(asks oplopend, bids aflopend). ``skew`` > 0 maakt de ask-kant dieper, < 0 de bid-kant."""
+    half = mid * spread_bps / 20000.0
+    tick = mid * tick_bps / 10000.0
+    ask_size = size * (1.0 + max(skew, 0.0))
+    bid_size = size * (1.0 + max(-skew, 0.0))
+    asks = [(mid + half + i * tick, ask_size * rng.lognormvariate(0.0, 0.5)) for i in range(depth)]
+    bids = [(mid - half - i * tick, bid_size * rng.lognormvariate(0.0, 0.5)) for i in range(depth)]
+    return asks, bids
+
+def make_raw_levels(rng: random.Random, levels: Levels, kind: str) -> List[Any]:
+    """ccxt-achtige levels: ``float`` ([p, s]), ``str`` (["p", "s"]) of ``mixed`` (incl. dicts, nullen, rommel)."""
+    if kind == "float":
+        return [[p, s] for p, s in levels]
+    if kind == "str":
+        return [[str(p), str(s)] for p, s in levels]
+    out: List[Any] = []
+    for p, s in levels:
+        r = rng.random()
+        if r < 0.1:
+            out.append({"price": p, "amount": s})
+        elif r < 0.15:
+            out.append([p, 0.0])
+        elif r < 0.17:
+            out.append([None, s])
+        else:
+            out.append([p, s, None])
+    return out
+
+def make_meta(base_step: Optional[float] = 1e-6, min_base: Optional[float] = 1e-5,
+              min_notional: Optional[float] = 5.0, taker: float = 0.001) -> Dict[str, Any]:
+    return {"taker_fee": taker, "base_step": base_step, "min_base": min_base, "min_notional": min_notional}
+
+# ---------- stand-ins ----------
+
+class _FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self._redis = redis
+        self._calls: List[Tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        return [await getattr(self._redis, name)(*args, **kwargs) for name, args, kwargs in self._calls]
+
+class FakeRedis:
+    """In-memory stand-in voor het deel van ``redis.asyncio`` dat de hete paden gebruiken (bytes, geen netwerk)."""
+
+    def __init__(self):
+        self.kv: Dict[str, bytes] = {}
+        self._expires: Dict[str, float] = {}
+        self.published = 0
+        self.streams: Dict[str, int] = {}
+        self.hashes: Dict[str, Dict[str, Any]] = {}
+        self.sets: Dict[str, set] = {}
+
+    def _alive(self, key: str) -> bool:
+        exp = self._expires.get(key)
+        if exp is not None and exp <= time.monotonic():
+            self.kv.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self.kv
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.kv.get(key) if self._alive(key) else None
+
+    async def mget(self, keys) -> List[Optional[bytes]]:
+        return [self.kv.get(k) if self._alive(k) else None for k in keys]
+
+    async def set(self, key: str, value, nx: bool = False, px: Optional[int] = None, ex: Optional[int] = None):
+        if nx and self._alive(key):
+            return None
+        self.kv[key] = value if isinstance(value, bytes) else str(value).encode()
+        ttl = px / 1000.0 if px else ex
+        if ttl:
+            self._expires[key] = time.monotonic() + ttl
+        else:
+            self._expires.pop(key, None)
+        return True
+
+    async def publish(self, channel: str, payload) -> int:
+        self.published += 1
+        return 0
+
+    async def xadd(self, key: str, fields, **kwargs) -> bytes:
+        n = self.streams[key] = self.streams.get(key, 0) + 1
+        return f"0-{n}".encode()
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        h = self.hashes.setdefault(key, {})
+        h[field] = h.get(field, 0) + amount
+        return h[field]
+
+    async def hincrbyfloat(self, key: str, field: str, amount: float = 1.0) -> float:
+        return await self.hincrby(key, field, amount)
+
+    async def hset(self, key: str, field: str, value) -> int:
+        self.hashes.setdefault(key, {})[field] = value
+        return 1
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return key in self.hashes
+
+    async def sadd(self, key: str, *members) -> int:
+        s = self.sets.setdefault(key, set())
+        n = len(s)
+        s.update(members)
+        return len(s) - n
+
+    def pipeline(self, transaction: bool = True) -> _FakePipeline:
+        return _FakePipeline(self)
+
+    def clear(self) -> None:
+        self.kv.clear()
+        self._expires.clear()
+        self.hashes.clear()
+        self.sets.clear()
+
+class FakeExchange:
+    """Genoeg van een sync ccxt-exchange voor ``get_exchange``/``index_for``/``ensure_markets``."""
+
+    def __init__(self, name: str, symbols: List[str], taker: float = 0.001):
+        self.id = name
+        self.fees = {"trading": {"taker": taker, "maker": taker}}
+        self.currencies: Dict[str, Any] = {}
+        self.markets = {}
+        for sym in symbols:
+            base, quote = sym.split("/", 1)
+            self.markets[sym] = {
+                "symbol": sym, "base": base, "quote": quote, "active": True, "taker": taker,
+                "precision": {"amount": 1e-6, "price": 0.01},
+                "limits": {"amount": {"min": 1e-5}, "cost": {"min": 5.0}},
+            }
+
+    def load_markets(self, reload: bool = False):
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+
+class _Env:
+    """Installeert FakeRedis en de fake exchanges; herstelt alles bij het verlaten."""
+
+    def __init__(self, exchanges: List[FakeExchange]):
+        self.redis = FakeRedis()
+        self.exchanges = exchanges
+
+    def __enter__(self) -> "_Env":
+        self._saved = (redis_pool._client, orderbook_store.ORDERBOOK_DELTAS, orderbook_store.STALE_MS)
+        redis_pool._client = self.redis
+        orderbook_store.ORDERBOOK_DELTAS = False  # deltas lezen vraagt XREAD; de bench meet het GET/MGET-pad
+        # een lange case mag boeken niet stale zien worden: dan meet hij de REST-fallback i.p.v. de scan
+        orderbook_store.STALE_MS = 10 ** 12
+        for ex in self.exchanges:
+            markets._EXCHANGES[ex.id] = ex
+        return self
+
+    def __exit__(self, *exc) -> None:
+        redis_pool._client, orderbook_store.ORDERBOOK_DELTAS, orderbook_store.STALE_MS = self._saved
+        for ex in self.exchanges:
+            markets._EXCHANGES.pop(ex.id, None)
+
+    def put_books(self, books: Dict[Tuple[str, str], Tuple[Levels, Levels]], fmt: str = "bin") -> None:
+        ts = int(time.time() * 1000)
+        for (ex, sym), (asks, bids) in books.items():
+            if fmt == "json":
+                data = orjson.dumps({"ts": ts, "asks": asks, "bids": bids})
+            else:
+                data = encode_book(asks, bids, ts)
+            self.redis.kv[f"ob:{ex}:{sym}"] = data
+
+# ---------- meten ----------
+
+def _result(name: str, params: Dict[str, Any], number: int, samples: List[float]) -> Dict[str, Any]:
+    per_op = [s / number * 1e6 for s in samples]  # µs
+    med = statistics.median(per_op)
+    return {
+        "name": name,
+        "params": params,
+        "number": number,
+        "repeat": len(samples),
+        "median_us": med,
+        "min_us": min(per_op),
+        "ops_per_sec": 1e6 / med if med > 0 else 0.0,
+    }
+
+def measure(name: str, params: Dict[str, Any], fn: Callable[[], Any], number: int, repeat: int,
+            setup: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    if setup is not None:
+        setup()
+    fn()  # warm-up (imports, caches)
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append(time.perf_counter() - t0)
+    return _result(name, params, number, samples)
+
+async def measure_async(name: str, params: Dict[str, Any], fn: Callable[[], Any], number: int, repeat: int,
+                        setup: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+    if setup is not None:
+        setup()
+    await fn()
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        samples.append(time.perf_counter() - t0)
+    return _result(name, params, number, samples)
+
+# ---------- cases ----------
+
+def bench_sim(rng: random.Random, scale: float, repeat: int) -> List[Dict[str, Any]]:
+    out = []
+    for depth in (10, 50, 200):
+        for skew in (0.0, 2.0):
+            asks, _ = make_book(rng, 100.0, depth, skew=skew)
+            _, bids = make_book(rng, 100.3, depth, skew=-skew)
+            meta = make_meta()
+            # budget zo dat ongeveer de helft van de ask-kant gekocht wordt
+            budget = sum(p * s for p, s in asks[: max(depth // 2, 1)])
+            kw = dict(asks=asks, bids=bids, fee_buy=meta["taker_fee"], fee_sell=meta["taker_fee"],
+                      max_quote_buy=budget, base_step=meta["base_step"], min_base=meta["min_base"],
+                      min_notional_buy=meta["min_notional"], min_notional_sell=meta["min_notional"])
+            out.append(measure("simulate_cross_fill", {"depth": depth, "skew": skew},
+                               lambda kw=kw: simulate_cross_fill(**kw), max(int(2000 * scale / depth), 5), repeat))
+    return out
+
+def bench_sanitize(rng: random.Random, scale: float, repeat: int) -> List[Dict[str, Any]]:
+    out = []
+    for depth in (50, 500):
+        asks, _ = make_book(rng, 100.0, depth)
+        for kind in ("float", "str", "mixed"):
+            raw = make_raw_levels(rng, asks, kind)
+            out.append(measure("sanitize_levels", {"depth": depth, "kind": kind},
+                               lambda raw=raw: markets._sanitize_levels(raw), max(int(20000 * scale / depth), 5), repeat))
+    return out
+
+async def bench_decode(rng: random.Random, scale: float, repeat: int) -> List[Dict[str, Any]]:
+    out = []
+    with _Env([]) as env:
+        for depth in (50, 500):
+            book = make_book(rng, 100.0, depth)
+            for fmt in ("bin", "json"):
+                env.put_books({("bench0", "BTC/EUR"): book}, fmt)
+                data = env.redis.kv["ob:bench0:BTC/EUR"]
+                n = max(int(20000 * scale / depth), 5)
+                out.append(measure("decode_book", {"depth": depth, "format": fmt},
+                                   lambda data=data: decode_book(data), n, repeat))
+                out.append(await measure_async(
+                    "get_cached_orderbook", {"depth": depth, "format": fmt},
+                    lambda: orderbook_store.get_cached_orderbook("bench0", "BTC/EUR"), n, repeat,
+                    setup=lambda book=book, fmt=fmt: env.put_books({("bench0", "BTC/EUR"): book}, fmt)))
+        books = {(f"bench{i % 5}", f"S{i // 5}/EUR"): make_book(rng, 100.0, 50) for i in range(100)}
+        keys = list(books)
+        out.append(await measure_async(
+            "get_cached_orderbooks", {"books": len(keys), "depth": 50, "format": "bin"},
+            lambda: orderbook_store.get_cached_orderbooks(keys), max(int(100 * scale), 3), repeat,
+            setup=lambda: env.put_books(books)))
+    return out
+
+async def bench_scan(rng: random.Random, scale: float, repeat: int) -> List[Dict[str, Any]]:
+    out = []
+    for n_ex, n_sym in ((3, 10), (5, 50), (8, 100)):
+        symbols = [f"S{i}/EUR" for i in range(n_sym)]
+        exchanges = [FakeExchange(f"bench{i}", symbols) for i in range(n_ex)]
+        names = [ex.id for ex in exchanges]
+        books = {}
+        for j, sym in enumerate(symbols):
+            mid = 10.0 + j
+            for name in names:
+                books[(name, sym)] = make_book(rng, mid * (1 + rng.uniform(-0.003, 0.003)), 50)
+        with _Env(exchanges) as env:
+            async def scan(symbols=symbols, names=names):
+                for sym in symbols:
+                    await scan_all(sym, names, 250.0, 0.0)
+            out.append(await measure_async(
+                "scan_all", {"exchanges": n_ex, "symbols": n_sym, "pairs": n_sym * n_ex * (n_ex - 1), "depth": 50,
+                             "batch_sim": arbitrage_engine.STRAT_BATCH_SIM and n_ex * (n_ex - 1) >= arbitrage_engine.STRAT_BATCH_MIN_PAIRS},
+                scan, max(int(20 * scale / n_sym * 10), 1), repeat, setup=lambda books=books: env.put_books(books)))
+    return out
+
+def _paper_items(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    items = []
+    for i in range(n):
+        ask = 100.0 + rng.uniform(-1, 1)
+        bid = ask * (1 + rng.uniform(-0.002, 0.004))
+        qty = rng.uniform(0.1, 2.0)
+        items.append({
+            "ok": 1 if bid > ask else 0, "symbol": f"S{i % 20}/EUR", "buy": "bench0", "sell": "bench1",
+            "best_ask": ask, "best_bid": bid, "fee_buy": 0.001, "fee_sell": 0.001,
+            "depth": {"qty_base_bought": qty, "qty_base_sold": qty, "net_profit_quote": (bid - ask) * qty,
+                      "roi": (bid - ask) / ask},
+        })
+    return items
+
+async def bench_paper(rng: random.Random, scale: float, repeat: int) -> List[Dict[str, Any]]:
+    items = _paper_items(rng, 1000)
+    out = [measure("paper_fill", {"items": len(items)}, lambda: [paper._paper_fill(it) for it in items],
+                   max(int(20 * scale), 2), repeat)]
+    # book-fills hebben stream-historie nodig (en slaan zonder over): de batch-case meet het tob-pad
+    saved_model, paper.PAPER_FILL_MODEL = paper.PAPER_FILL_MODEL, "tob"
+    try:
+        with _Env([]) as env:
+            async def execute():
+                for i in range(0, len(items), 5):  # berichten van STRAT_TOPN items
+                    await paper.execute_batch(env.redis, items[i:i + 5])
+
+            def reset():
+                env.redis.clear()
+                paper._dedup.clear()
+            # na reset alles nieuw (SET NX slaagt, fills naar de stream); daarna lokale dedup-hits
+            out.append(await measure_async("paper_execute_batch", {"items": len(items), "batch": 5}, execute,
+                                           max(int(10 * scale), 2), repeat, setup=reset))
+    finally:
+        paper.PAPER_FILL_MODEL = saved_model
+    return out
+
+CASES = {
+    "sim": bench_sim,
+    "sanitize": bench_sanitize,
+    "decode": bench_decode,
+    "scan": bench_scan,
+    "paper": bench_paper,
+}
+
+async def run_benchmarks(only: Optional[List[str]] = None, quick: bool = False, seed: int = 1) -> Dict[str, Any]:
+    scale, repeat = (0.1, 3) if quick else (1.0, 7)
+    results: List[Dict[str, Any]] = []
+    for name, fn in CASES.items():
+        if only and name not in only:
+            continue
+        rng = random.Random(seed)  # elke groep eigen seed: resultaten onafhankelijk van --only
+        res = fn(rng, scale, repeat)
+        results.extend(await res if asyncio.iscoroutine(res) else res)
+    return {"meta": _meta(quick, seed), "results": results}
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def _meta(quick: bool, seed: int) -> Dict[str, Any]:
+    try:
+        import numpy
+        np_version = numpy.__version__
+    except ImportError:
+        np_version = None
+    return {
+        "ts": int(time.time() * 1000),
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "numpy": np_version,
+        "platform": platform.platform(),
+        "quick": quick,
+        "seed": seed,
+        "strat_batch_sim": arbitrage_engine.STRAT_BATCH_SIM,
+        "strat_batch_min_pairs": arbitrage_engine.STRAT_BATCH_MIN_PAIRS,
+    }
+
+def case_key(res: Dict[str, Any]) -> str:
+    return res["name"] + "(" + ",".join(f"{k}={v}" for k, v in sorted(res["params"].items())) + ")"
+
+def compare(base: Dict[str, Any], cur: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per case: ratio = huidig / baseline (mediaan); > 1 is trager. Cases zonder tegenhanger vallen weg."""
+    old = {case_key(r): r for r in base.get("results", [])}
+    out = []
+    for r in cur["results"]:
+        b = old.get(case_key(r))
+        if b is None or not b["median_us"]:
+            continue
+        out.append({"case": case_key(r), "base_us": b["median_us"], "cur_us": r["median_us"],
+                    "ratio": r["median_us"] / b["median_us"]})
+    return out
+
+def _print_table(report: Dict[str, Any]) -> None:
+    for r in report["results"]:
+        print(f"{case_key(r):<70} {r['median_us']:>12.2f} µs  (min {r['min_us']:.2f})  {r['ops_per_sec']:>12.0f}/s")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="bot.bench", description="Microbenchmarks for the hot paths")
+    ap.add_argument("--only", help="comma list of groups: " + ",".join(CASES))
+    ap.add_argument("--quick", action="store_true", help="fewer iterations (smoke run)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    ap.add_argument("--out", help="write the report as JSON to this file")
+    ap.add_argument("--compare", help="baseline report (JSON) to compare against")
+    ap.add_argument("--fail-over", type=float, default=0.0,
+                    help="with --compare: exit 2 if any case is more than this many times slower")
+    args = ap.parse_args(argv)
+
+    only = [x.strip() for x in args.only.split(",")] if args.only else None
+    report = asyncio.run(run_benchmarks(only, args.quick, args.seed))
+    if args.out:
+        with open(args.out, "wb") as fh:
+            fh.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+
+    rows = None
+    if args.compare:
+        with open(args.compare, "rb") as fh:
+            rows = compare(orjson.loads(fh.read()), report)
+        report["compare"] = {"baseline": args.compare, "rows": rows}
+
+    if args.json:
+        print(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode())
+    elif rows is not None:
+        for row in rows:
+            print(f"{row['case']:<70} {row['base_us']:>10.2f} → {row['cur_us']:>10.2f} µs  x{row['ratio']:.2f}")
+    else:
+        _print_table(report)
+
+    if rows and args.fail_over > 0 and any(row["ratio"] > args.fail_over for row in rows):
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,15 @@
 import os
 import asyncio
 import time
-import hashlib
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
 import orjson
-from redis.asyncio import from_url as redis_from_url
-
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+from ..services import pnl_rollup
+from ..services.book_registry import registry
+from ..services.metrics import OPPORTUNITY_TO_FILL, PAPER_BATCH, PAPER_FILLS, PAPER_SKIPPED, observe_age
+from ..services.redis_pool import get_redis
+from ..strategy.depth_sim import simulate_cross_fill
 
 # Luister naar dezelfde channel als de strategy-publicatie
 EXECUTE_CHANNEL = os.getenv("PUBLISH_CHANNEL", "opps")
@@ -19,29 +21,85 @@ PAPER_MIN_NET_QUOTE = float(os.getenv("PAPER_MIN_NET_QUOTE", os.getenv("STRAT_MI
 PAPER_MIN_ROI_PCT   = float(os.getenv("PAPER_MIN_ROI_PCT",  os.getenv("STRAT_MIN_ROI_PCT",  "0")))
 PAPER_SLIPPAGE_BPS  = float(os.getenv("PAPER_SLIPPAGE_BPS", "2"))  # 2 bps default
 PAPER_DEDUP_COOLDOWN_MS = int(float(os.getenv("PAPER_DEDUP_COOLDOWN_MS", "4000")))  # 4s
+# lokale dedup-cache vóór Redis: zoveel keys max (verlopen keys gaan er eerst uit)
+PAPER_DEDUP_LOCAL_MAX = int(os.getenv("PAPER_DEDUP_LOCAL_MAX", "10000"))
+# 1: PnL-aggregaten (services/pnl_rollup) bijwerken in dezelfde pipeline als de fills
+PAPER_ROLLUPS = os.getenv("PAPER_ROLLUPS", "1") not in ("0", "false", "False")
 
 ALLOW_NO_PROFIT = os.getenv("ALLOW_NO_PROFIT", "1") not in ("0", "false", "False")
 
+def _parse_latencies(raw: str) -> Dict[str, int]:
+    # "kraken:120,coinbase:80,40": per exchange, een waarde zonder naam geldt voor de rest ("*")
+    out = {"*": 0}
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, ms = part.rpartition(":")
+        out[name.strip().lower() or "*"] = int(float(ms))
+    return out
+
+# book: fill tegen het echte boek op detectie + latency (vereist de stream in dit proces), anders (tob)
+# top-of-book + PAPER_SLIPPAGE_BPS. Nooit gemengd: zonder lokale historie van beide boeken wordt een
+# item onder book overgeslagen (arb_paper_skipped_total{reason="no_book_history"}), zodat een replica
+# die het symbool niet streamt geen tob-fill zet die met de book-fill van de eigenaar om de SET NX racet.
+PAPER_FILL_MODEL = os.getenv("PAPER_FILL_MODEL", "book").lower()
+PAPER_LATENCY_MS = _parse_latencies(os.getenv("PAPER_LATENCY_MS", "50"))
+# extra latencies (ms, voor beide legs) waarop elke fill ook wordt doorgerekend: net_at_latency_ms
+PAPER_LATENCY_PROBES_MS = [int(float(x)) for x in os.getenv("PAPER_LATENCY_PROBES_MS", "").split(",") if x.strip()]
+PAPER_HISTORY_MAX_VERSIONS = int(os.getenv("PAPER_HISTORY_MAX_VERSIONS", "1000"))
+_MAX_DELAY_MS = max([*PAPER_LATENCY_MS.values(), *PAPER_LATENCY_PROBES_MS, 0])
+
 def _now_ms() -> int:
     return int(time.time() * 1000)
 
-def _hash_item(item: Dict[str, Any]) -> str:
+def _dedup_key(item: Dict[str, Any]) -> str:
+    # leesbare key i.p.v. sha1: één f-string, even uniek (prijzen op 2, qty op 8 decimalen)
     d = item.get("depth") or {}
-    parts = [
-        str(item.get("symbol") or ""),
-        str(item.get("buy") or ""),
-        str(item.get("sell") or ""),
-        str(round(float(item.get("best_ask") or 0.0), 2)),
-        str(round(float(item.get("best_bid") or 0.0), 2)),
-        str(round(float(d.get("qty_base_sold") or d.get("qty_base_bought") or 0.0), 8)),
-    ]
-    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+    qty = float(d.get("qty_base_sold") or d.get("qty_base_bought") or 0.0)
+    return (f"{item.get('symbol') or ''}|{item.get('buy') or ''}|{item.get('sell') or ''}|"
+            f"{float(item.get('best_ask') or 0.0):.2f}|{float(item.get('best_bid') or 0.0):.2f}|{qty:.8f}")
+
+class _DedupCache:
+    """Lokale kopie van de dedup-keys die deze worker al in Redis heeft gezet (verloopt met de cooldown).
+
+    Op volgorde van toevoegen; met één vaste TTL verloopt de oudste ook het eerst, dus opruimen en
+    begrenzen is ``popitem(last=False)`` vanaf de voorkant: O(1) per ``add``.
+    """
+
+    def __init__(self, ttl_ms: int, max_entries: int):
+        self.ttl = ttl_ms / 1000.0
+        self.max_entries = max(max_entries, 1)
+        self._until: "OrderedDict[str, float]" = OrderedDict()
+
+    def seen(self, key: str) -> bool:
+        until = self._until.get(key)
+        if until is None:
+            return False
+        if until > time.monotonic():
+            return True
+        del self._until[key]
+        return False
+
+    def add(self, key: str) -> None:
+        now = time.monotonic()
+        until = self._until
+        # verlopen keys vooraan weg, daarna desnoods de oudste levende
+        while until and (next(iter(until.values())) <= now or len(until) >= self.max_entries):
+            until.popitem(last=False)
+        until[key] = now + self.ttl
+        until.move_to_end(key)  # opnieuw toegevoegd: achteraan, met de nieuwe deadline
+
+    def clear(self) -> None:
+        self._until.clear()
+
+_dedup = _DedupCache(PAPER_DEDUP_COOLDOWN_MS, PAPER_DEDUP_LOCAL_MAX)
 
 def _bps(x: float) -> float:
     return (x or 0.0) * 10000.0
 
-async def _should_execute(r, item: Dict[str, Any]) -> bool:
-    """Filter: ok/net/roi en de-dup. In dev kan ALLOW_NO_PROFIT ook 'ok=0' doorlaten."""
+def _passes_filters(item: Dict[str, Any]) -> bool:
+    """Filter zonder Redis: qty en ok/net/roi. In dev kan ALLOW_NO_PROFIT ook 'ok=0' doorlaten."""
     d = item.get("depth") or {}
     qty = float(d.get("qty_base_sold") or d.get("qty_base_bought") or 0.0)
     if qty <= 0:
@@ -59,12 +117,7 @@ async def _should_execute(r, item: Dict[str, Any]) -> bool:
         pass
     else:
         return False
-
-    # Dedup korte termijn
-    h = _hash_item(item)
-    key = f"paper:dedup:{h}"
-    exists = await r.set(key, b"1", nx=True, px=PAPER_DEDUP_COOLDOWN_MS)
-    return bool(exists)
+    return True
 
 
 def _paper_fill(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -115,17 +168,168 @@ def _paper_fill(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         "roi": roi,
         "gross_spread_bps": gross_bps,
         "source": "paper-exec",
+        "fill_model": "tob",
+    }
+
+def _latency(exchange: str) -> int:
+    return PAPER_LATENCY_MS.get(exchange, PAPER_LATENCY_MS["*"])
+
+_LIMIT_KEYS = ("base_step", "min_base", "min_notional_buy", "min_notional_sell")
+
+def _walk_books(item: Dict[str, Any], buy_ms: int, sell_ms: int) -> Optional[Dict[str, Any]]:
+    """Dezelfde order als bij detectie (quote-budget, daarna max. de gedetecteerde qty verkopen, met de
+    market-limits van de strategy) door de boeken zoals ze op detectie + latency golden; None als de
+    historie zo ver niet teruggaat."""
+    ts = int(item.get("ts") or 0)
+    symbol = item.get("symbol")
+    buy_snap = registry.at(item.get("buy"), symbol, ts + buy_ms)
+    sell_snap = registry.at(item.get("sell"), symbol, ts + sell_ms)
+    if buy_snap is None or sell_snap is None:
+        return None
+    d = item.get("depth") or {}
+    limits = item.get("limits") or {}
+    # 0 is een echte grens (niets kopen), alleen None betekent onbegrensd
+    spent, sold = d.get("spent_quote"), d.get("qty_base_sold")
+    return simulate_cross_fill(
+        asks=buy_snap.asks, bids=sell_snap.bids,
+        fee_buy=float(item.get("fee_buy") or 0.001), fee_sell=float(item.get("fee_sell") or 0.001),
+        withdraw_fee_base=float(d.get("withdraw_fee_base") or 0.0),
+        max_quote_buy=None if spent is None else float(spent),
+        max_base_sell=None if sold is None else float(sold),
+        **{k: limits.get(k) for k in _LIMIT_KEYS},
+    )
+
+def _book_fill(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Fill tegen de opgenomen boek-tijdlijn met ``PAPER_LATENCY_MS`` per exchange; None = overslaan."""
+    buy_ms, sell_ms = _latency(item.get("buy") or ""), _latency(item.get("sell") or "")
+    res = _walk_books(item, buy_ms, sell_ms)
+    if res is None:
+        PAPER_SKIPPED.labels("no_book_history").inc()
+        return None
+    d = item.get("depth") or {}
+    spent, qty = res.get("spent_quote") or 0.0, res.get("qty_base_sold") or 0.0
+    if spent <= 0 or qty <= 0:
+        PAPER_SKIPPED.labels("no_fill").inc()
+        return None
+    spent_total = spent + (res.get("buy_fee_quote") or 0.0)
+    net = res.get("net_profit_quote") or 0.0
+    detected = float(d.get("net_profit_quote") or 0.0)
+    best_ask, best_bid = float(item.get("best_ask") or 0.0), float(item.get("best_bid") or 0.0)
+    trade = {
+        "ts": _now_ms(),
+        "symbol": item.get("symbol"),
+        "buy": item.get("buy"),
+        "sell": item.get("sell"),
+        "qty_base": qty,
+        "best_ask": best_ask,
+        "best_bid": best_bid,
+        "eff_ask": res.get("avg_buy_px") or spent / max(res.get("qty_base_bought") or qty, 1e-18),
+        "eff_bid": res.get("avg_sell_px") or 0.0,
+        "fee_buy_rate": float(item.get("fee_buy") or 0.001),
+        "fee_sell_rate": float(item.get("fee_sell") or 0.001),
+        "slippage_bps": 0.0,
+        "spent_quote": spent_total,
+        "received_quote": res.get("received_quote") or 0.0,
+        "net_profit_quote": net,
+        "roi": net / spent_total if spent_total > 0 else 0.0,
+        "gross_spread_bps": _bps((best_bid - best_ask) / best_ask) if best_ask > 0 else 0.0,
+        "source": "paper-exec",
+        "fill_model": "book",
+        "latency_ms": {"buy": buy_ms, "sell": sell_ms},
+        "detected_net_quote": detected,
+        "latency_cost_quote": detected - net,  # >0: winst verloren tussen detectie en uitvoering
     }
+    if PAPER_LATENCY_PROBES_MS:
+        probes = {}
+        for ms in PAPER_LATENCY_PROBES_MS:
+            r = _walk_books(item, ms, ms)
+            if r is not None:
+                probes[str(ms)] = r.get("net_profit_quote") or 0.0
+        trade["net_at_latency_ms"] = probes
+    return trade
+
+def _fill(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Fill volgens ``PAPER_FILL_MODEL``; None = overslaan (nooit terugvallen op het andere model)."""
+    if PAPER_FILL_MODEL == "book":
+        return _book_fill(item)
+    return _paper_fill(item)
+
+async def execute_batch(r, items: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Eén bericht in twee round-trips: alle dedup-``SET NX`` in één pipeline, daarna alle fills in één.
+
+    Keys die lokaal nog in de cooldown zitten (of dubbel in de batch) gaan niet naar Redis; de
+    PnL-aggregaten gaan mee met de XADDs.
+    Geeft (item, trade) terug voor elke geschreven fill.
+    """
+    todo: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    for it in items:
+        if not _passes_filters(it):
+            continue
+        key = _dedup_key(it)
+        if key in todo or _dedup.seen(key):
+            continue
+        trade = _fill(it)
+        if trade:
+            todo[key] = (it, trade)
+    if not todo:
+        return []
+
+    pipe = r.pipeline(transaction=False)
+    for key in todo:
+        pipe.set(f"paper:dedup:{key}", b"1", nx=True, px=PAPER_DEDUP_COOLDOWN_MS)
+    won = await pipe.execute()
+    fills = []
+    for key, ok in zip(todo, won):
+        # ook bij een verloren SET NX: een andere worker heeft hem, dus de komende cooldown overslaan
+        _dedup.add(key)
+        if ok:
+            fills.append(todo[key])
+    if fills:
+        pipe = r.pipeline(transaction=False)
+        for _, trade in fills:
+            pipe.xadd(PAPER_STREAM, {"payload": orjson.dumps(trade)}, maxlen=5000, approximate=True)
+        if PAPER_ROLLUPS:
+            pnl_rollup.add_to_pipeline(pipe, [trade for _, trade in fills])
+        await pipe.execute()
+    return fills
+
+async def _handle(r, items: List[Dict[str, Any]]) -> None:
+    try:
+        t0 = time.perf_counter()
+        fills = await execute_batch(r, items)
+        PAPER_BATCH.observe(time.perf_counter() - t0)
+    except Exception as e:
+        print("[paper] execute error:", e)
+        return
+    for it, trade in fills:
+        observe_age(OPPORTUNITY_TO_FILL, it.get("ts"), trade["symbol"] or "")
+        PAPER_FILLS.labels(trade["symbol"] or "").inc()
+        # Console
+        lat = f" latcost={trade['latency_cost_quote']:.2f}" if trade.get("fill_model") == "book" else ""
+        print(f"[paper] {trade['symbol']} {trade['buy']}→{trade['sell']} "
+              f"qty={trade['qty_base']:.6f} net={trade['net_profit_quote']:.2f} "
+              f"roi={trade['roi']*100:.2f}% slip={trade['slippage_bps']}bps{lat}")
+
+async def _handle_later(r, items: List[Dict[str, Any]], due_ms: int) -> None:
+    # het boek van "detectie + latency" moet eerst binnen zijn
+    await asyncio.sleep(max(due_ms - _now_ms(), 0) / 1000.0)
+    await _handle(r, items)
 
 async def run():
     """Subscribet op EXECUTE_CHANNEL en schrijft fills naar PAPER_STREAM."""
+    if PAPER_FILL_MODEL == "book":
+        # stream in dit proces: versies lang genoeg bewaren voor de grootste latency (+ marge)
+        registry.keep_history(_MAX_DELAY_MS + 2000, PAPER_HISTORY_MAX_VERSIONS)
+        print("[paper] fill=book: items without local book history (stream not in this process) are skipped")
+    pending: set = set()
     while True:
-        r = redis_from_url(REDIS_URL, decode_responses=False)
+        r = get_redis()
         pub = r.pubsub(ignore_subscribe_messages=True)
         try:
             await pub.subscribe(EXECUTE_CHANNEL)
             print(f"[paper] listening on channel '{EXECUTE_CHANNEL}', stream '{PAPER_STREAM}', "
-                  f"minNet={PAPER_MIN_NET_QUOTE}, minRoiPct={PAPER_MIN_ROI_PCT}, slip={PAPER_SLIPPAGE_BPS}bps")
+                  f"minNet={PAPER_MIN_NET_QUOTE}, minRoiPct={PAPER_MIN_ROI_PCT}, slip={PAPER_SLIPPAGE_BPS}bps, "
+                  f"fill={PAPER_FILL_MODEL} latency={PAPER_LATENCY_MS}")
 
             async for msg in pub.listen():
                 try:
@@ -136,18 +340,14 @@ async def run():
                         continue
                     payload = orjson.loads(raw)
                     items: List[Dict[str, Any]] = payload.get("items") or []
-                    for it in items:
-                        if not await _should_execute(r, it):
-                            continue
-                        trade = _paper_fill(it)
-                        if not trade:
-                            continue
-                        # Log naar stream
-                        await r.xadd(PAPER_STREAM, {"payload": orjson.dumps(trade)}, maxlen=5000, approximate=True)
-                        # Console
-                        print(f"[paper] {trade['symbol']} {trade['buy']}→{trade['sell']} "
-                              f"qty={trade['qty_base']:.6f} net={trade['net_profit_quote']:.2f} "
-                              f"roi={trade['roi']*100:.2f}% slip={trade['slippage_bps']}bps")
+                    due_ms = max((int(it.get("ts") or 0) for it in items), default=0) + _MAX_DELAY_MS
+                    if PAPER_FILL_MODEL == "book" and due_ms > _now_ms():
+                        # niet wachten in de lus: volgende berichten lopen door terwijl deze op zijn boek wacht
+                        task = asyncio.create_task(_handle_later(r, items, due_ms))
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
+                    else:
+                        await _handle(r, items)
                 except Exception as e:
                     print("[paper] handle message error:", e)
         except Exception as e:
@@ -157,5 +357,5 @@ async def run():
                 await pub.unsubscribe(EXECUTE_CHANNEL)
             except Exception:
                 pass
-            await r.close()
+            await pub.close()
         await asyncio.sleep(1.0)  # back-off bij reconnect
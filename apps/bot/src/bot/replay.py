@@ -0,0 +1,179 @@
+"""Replay van opnames (``RECORD_DIR``, zie ``services/book_recorder``) door strategy en paper-fills.
+
+Draait zonder Redis of netwerk: boeken gaan in de in-process registry, market-meta komt uit de
+opname, en er wordt niets gepubliceerd. Zo zijn strategie-versies op identieke data te vergelijken.
+
+    PYTHONPATH=src python -m bot.replay recordings/ [--speed 0] [--mode event|full] [--json]
+
+``--speed 0`` = zo snel mogelijk; ``--speed 10`` = tien keer de opgenomen wandkloktijd.
+
+Paper-fills lopen via ``paper._fill`` met hetzelfde ``PAPER_FILL_MODEL`` als live. Bij ``book`` krijgt de
+boek-historie de opgenomen klok: een kans geldt als gedetecteerd op het moment van zijn update en wordt
+gevuld zodra de opname ``PAPER_LATENCY_MS`` verder is (wat aan het eind nog wacht, tegen de laatste boeken).
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import orjson
+
+from .execution.paper import (PAPER_DEDUP_COOLDOWN_MS, PAPER_FILL_MODEL, PAPER_HISTORY_MAX_VERSIONS, _MAX_DELAY_MS,
+                              _dedup_key, _fill, _passes_filters)
+from .services.book_recorder import REC_DEFINE, list_recordings, read_recording
+from .services.book_registry import registry
+from .strategy.arbitrage_engine import run_strategy_for_books, run_strategy_once, select_published
+
+# voor boeken die zijn opgenomen voordat de markets geladen waren
+DEFAULT_META = {"taker_fee": 0.001, "base_step": None, "min_base": None, "min_notional": None}
+
+async def replay(
+    files: List[str],
+    speed: float = 0.0,
+    mode: str = "event",
+    budget_quote: float = 250.0,
+    withdraw_fee_base: float = 0.0,
+    min_net_quote: float = 0.0,
+    min_roi_pct: float = 0.0,
+    topn: int = 5,
+    symbols: Optional[List[str]] = None,
+    exchanges: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    registry.exclusive = True  # strategy leest alleen de registry
+    metas: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    seen_ex: List[str] = []
+    seen_sym: List[str] = []
+    pair_cache: Dict[str, Dict[tuple, dict]] = {}
+    dedup: Dict[str, int] = {}
+    stats = {
+        "files": len(files), "mode": mode, "speed": speed,
+        "updates": 0, "strategy_runs": 0, "pairs_evaluated": 0,
+        "opportunities": 0, "profitable_opportunities": 0,
+        "paper_fill_model": PAPER_FILL_MODEL, "paper_fills": 0, "paper_skipped": 0, "paper_net_quote": 0.0,
+    }
+    book_fills = PAPER_FILL_MODEL == "book"
+    if book_fills:
+        registry.keep_history(_MAX_DELAY_MS + 2000, PAPER_HISTORY_MAX_VERSIONS)
+    waiting: Deque[Tuple[int, Dict[str, Any]]] = deque()  # (opgenomen ts waarop de fill mag, item)
+
+    def fill(item: Dict[str, Any]) -> None:
+        trade = _fill(item)
+        if trade:
+            stats["paper_fills"] += 1
+            stats["paper_net_quote"] += trade["net_profit_quote"]
+        else:
+            stats["paper_skipped"] += 1
+
+    first_ts = last_ts = None
+    t0 = time.perf_counter()
+    try:
+        for path in files:
+            ids: Dict[int, Tuple[str, str]] = {}
+            for rtype, book_id, rec in read_recording(path):
+                if rtype == REC_DEFINE:
+                    key = ids[book_id] = (rec["exchange"], rec["symbol"])
+                    meta = rec.get("meta") or metas.get(key) or DEFAULT_META
+                    metas[key] = meta if meta.get("taker_fee") is not None else {**meta, "taker_fee": 0.001}
+                    continue
+                ex, sym = ids[book_id]
+                if (exchanges and ex not in exchanges) or (symbols and sym not in symbols):
+                    continue
+                if first_ts is None:
+                    first_ts = rec.ts
+                last_ts = rec.ts
+                if speed > 0:
+                    delay = (rec.ts - first_ts) / 1000.0 / speed - (time.perf_counter() - t0)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if ex not in seen_ex:
+                    seen_ex.append(ex)
+                if sym not in seen_sym:
+                    seen_sym.append(sym)
+                # verse ts: de staleness-check in orderbook_store loopt op de wandklok; de historie
+                # (book-fills) op de opgenomen klok
+                registry.put(ex, sym, rec.asks, rec.bids, int(time.time() * 1000), recv_ms=rec.ts)
+                stats["updates"] += 1
+                while waiting and waiting[0][0] <= rec.ts:
+                    fill(waiting.popleft()[1])
+
+                ex_list = exchanges or seen_ex
+                if mode == "full":
+                    sym_list = symbols or seen_sym
+                    res = await run_strategy_once(sym_list, ex_list, budget_quote, withdraw_fee_base,
+                                                  min_net_quote, min_roi_pct, topn, metas=metas, publish=False)
+                    stats["pairs_evaluated"] += len(sym_list) * len(ex_list) * (len(ex_list) - 1)
+                else:
+                    res = await run_strategy_for_books([(ex, sym)], pair_cache, ex_list, budget_quote,
+                                                       withdraw_fee_base, min_net_quote, min_roi_pct, topn,
+                                                       metas=metas, publish=False)
+                    stats["pairs_evaluated"] += 2 * (len(ex_list) - 1)
+                stats["strategy_runs"] += 1
+
+                for item in select_published(res["blocks"])[:topn]:
+                    stats["opportunities"] += 1
+                    stats["profitable_opportunities"] += 1 if item.get("ok") else 0
+                    if not _passes_filters(item):
+                        continue
+                    # dedup zoals paper.py, maar op de opgenomen klok
+                    h = _dedup_key(item)
+                    if rec.ts - dedup.get(h, -PAPER_DEDUP_COOLDOWN_MS) < PAPER_DEDUP_COOLDOWN_MS:
+                        continue
+                    dedup[h] = rec.ts
+                    if book_fills:
+                        waiting.append((rec.ts + _MAX_DELAY_MS, {**item, "ts": rec.ts}))
+                    else:
+                        fill(item)
+        while waiting:
+            fill(waiting.popleft()[1])
+    finally:
+        registry.exclusive = False
+
+    elapsed = time.perf_counter() - t0
+    stats["elapsed_sec"] = elapsed
+    stats["recorded_span_sec"] = (last_ts - first_ts) / 1000.0 if first_ts is not None else 0.0
+    stats["updates_per_sec"] = stats["updates"] / elapsed if elapsed > 0 else 0.0
+    stats["exchanges"] = exchanges or seen_ex
+    stats["symbols"] = symbols or seen_sym
+    return stats
+
+def _csv(x: Optional[str]) -> Optional[List[str]]:
+    return [v.strip() for v in x.split(",") if v.strip()] if x else None
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="bot.replay", description="Replay orderbook recordings through the strategy")
+    ap.add_argument("paths", nargs="+", help=".obr files or directories")
+    ap.add_argument("--speed", type=float, default=0.0, help="0 = as fast as possible, N = N x recorded time")
+    ap.add_argument("--mode", choices=("event", "full"), default="event")
+    ap.add_argument("--budget", type=float, default=250.0)
+    ap.add_argument("--withdraw-fee-base", type=float, default=0.0)
+    ap.add_argument("--min-net", type=float, default=0.0)
+    ap.add_argument("--min-roi-pct", type=float, default=0.0)
+    ap.add_argument("--topn", type=int, default=5)
+    ap.add_argument("--symbols", help="comma list (default: all recorded)")
+    ap.add_argument("--exchanges", help="comma list (default: all recorded)")
+    ap.add_argument("--json", action="store_true", help="print stats as JSON")
+    args = ap.parse_args(argv)
+
+    files = list_recordings(args.paths)
+    if not files:
+        print("no recordings found", file=sys.stderr)
+        return 1
+    stats = asyncio.run(replay(
+        files, args.speed, args.mode, args.budget, args.withdraw_fee_base,
+        args.min_net, args.min_roi_pct, args.topn, _csv(args.symbols), _csv(args.exchanges),
+    ))
+    if args.json:
+        print(orjson.dumps(stats, option=orjson.OPT_INDENT_2).decode())
+    else:
+        print(f"[replay] {stats['updates']} updates in {stats['elapsed_sec']:.2f}s "
+              f"({stats['updates_per_sec']:.0f} upd/s, recorded span {stats['recorded_span_sec']:.0f}s) | "
+              f"runs={stats['strategy_runs']} pairs={stats['pairs_evaluated']} "
+              f"opps={stats['opportunities']} ok={stats['profitable_opportunities']} "
+              f"fills={stats['paper_fills']} ({stats['paper_fill_model']}, skipped={stats['paper_skipped']}) "
+              f"net={stats['paper_net_quote']:.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
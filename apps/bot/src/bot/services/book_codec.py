@@ -0,0 +1,101 @@
+"""Binair formaat voor ``ob:{exchange}:{symbol}`` (moet gelijk blijven in bot en api).
+
+Layout (little-endian), 32 bytes header gevolgd door float64-levels:
+
+    magic "OB" | format-versie u8 | flags u8 | ts ms i64 | sequence u64 | n_asks u32 | n_bids u32 | 4x pad
+    asks: n_asks × (price f8, size f8)  low->high
+    bids: n_bids × (price f8, size f8)  high->low
+
+De levels staan 8-byte aligned, dus ``np.frombuffer`` kan ze zonder kopie lezen.
+JSON (oude writers) wordt herkend en blijft werken tijdens de rollout.
+"""
+import struct
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+import orjson
+
+MAGIC = b"OB"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<2sBBqQII4x")
+HEADER_SIZE = _HEADER.size  # 32
+_LEVEL = struct.Struct("<dd")
+
+Levels = List[Tuple[float, float]]
+
+class DecodedBook(NamedTuple):
+    ts: int
+    seq: int
+    asks: Levels  # low->high
+    bids: Levels  # high->low
+
+def is_binary(data) -> bool:
+    return bool(data) and bytes(data[:2]) == MAGIC
+
+def encode_book(asks: Sequence[Tuple[float, float]], bids: Sequence[Tuple[float, float]], ts: int, seq: int = 0) -> bytes:
+    """Gesorteerde levels → binaire snapshot (sortering wordt niet gecontroleerd)."""
+    na, nb = len(asks), len(bids)
+    flat = [x for lvl in asks for x in lvl[:2]]
+    flat.extend(x for lvl in bids for x in lvl[:2])
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, 0, int(ts), int(seq), na, nb) + struct.pack(f"<{2 * (na + nb)}d", *flat)
+
+def _header(data) -> Tuple[int, int, int, int]:
+    magic, version, _flags, ts, seq, na, nb = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"unsupported orderbook format: {bytes(magic)!r} v{version}")
+    if len(data) < HEADER_SIZE + 16 * (na + nb):
+        raise ValueError("truncated orderbook payload")
+    return ts, seq, na, nb
+
+def decode_book(data) -> DecodedBook:
+    """Binair of JSON → levels als lijsten van (price, size)-tuples, gesorteerd."""
+    if not is_binary(data):
+        return _decode_json(data)
+    ts, seq, na, nb = _header(data)
+    asks_end = HEADER_SIZE + 16 * na
+    mv = memoryview(data)
+    asks = list(_LEVEL.iter_unpack(mv[HEADER_SIZE:asks_end]))
+    bids = list(_LEVEL.iter_unpack(mv[asks_end:asks_end + 16 * nb]))
+    return DecodedBook(ts, seq, asks, bids)
+
+def decode_arrays(data):
+    """Binair → (ts, seq, asks, bids) met asks/bids als (n, 2) float64 views op ``data`` (geen kopie).
+
+    Vereist numpy; JSON-payloads worden wel gekopieerd.
+    """
+    import numpy as np
+
+    if not is_binary(data):
+        book = _decode_json(data)
+        return book.ts, book.seq, np.array(book.asks, dtype="<f8").reshape(-1, 2), np.array(book.bids, dtype="<f8").reshape(-1, 2)
+    ts, seq, na, nb = _header(data)
+    asks = np.frombuffer(data, dtype="<f8", count=2 * na, offset=HEADER_SIZE).reshape(na, 2)
+    bids = np.frombuffer(data, dtype="<f8", count=2 * nb, offset=HEADER_SIZE + 16 * na).reshape(nb, 2)
+    return ts, seq, asks, bids
+
+def read_ts(data) -> int:
+    """Alleen de timestamp (ms) — voor staleness-checks zonder de levels te decoderen."""
+    if is_binary(data):
+        return _header(data)[0]
+    return int(orjson.loads(data).get("ts") or 0)
+
+def _decode_json(data) -> DecodedBook:
+    snap = orjson.loads(data)
+    asks = [(float(p), float(a)) for p, a in snap.get("asks", [])]
+    bids = [(float(p), float(a)) for p, a in snap.get("bids", [])]
+    asks.sort(key=lambda x: x[0])
+    bids.sort(key=lambda x: x[0], reverse=True)
+    return DecodedBook(int(snap.get("ts") or 0), int(snap.get("version") or 0), asks, bids)
+
+def to_dict(data) -> Dict[str, Any]:
+    """Leesbare weergave (diagnostiek): JSON zoals hij is, binair als dict met dezelfde velden."""
+    if not is_binary(data):
+        return orjson.loads(data)
+    book = decode_book(data)
+    return {
+        "format": f"bin{FORMAT_VERSION}",
+        "bytes": len(data),
+        "ts": book.ts,
+        "version": book.seq,
+        "asks": book.asks,
+        "bids": book.bids,
+    }
@@ -0,0 +1,153 @@
+"""Incrementele orderboeken via Redis Streams (moet gelijk blijven in bot en api).
+
+Per boek één stream ``obd:{exchange}:{symbol}`` met entries:
+
+    t=s  seq            b=<book_codec snapshot>       volledige top-N
+    t=d  seq, prev      b=<book_codec snapshot>       alleen gewijzigde levels; size 0 = verwijderd
+
+De writer (``DeltaEncoder``) stuurt een snapshot bij de eerste publicatie, elke ``snapshot_every``
+updates, na ``snapshot_ms`` en na een mislukte write. Lezers (``DeltaBookFollower``) passen een
+delta alleen toe als ``prev`` gelijk is aan hun eigen seq; bij een gat wachten ze op de volgende
+snapshot. ``ob:*`` blijft (minder vaak) gezet voor lezers die geen deltas volgen.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .book_codec import decode_book, encode_book
+
+Levels = List[Tuple[float, float]]
+
+def stream_key(exchange: str, symbol: str) -> str:
+    return f"obd:{exchange}:{symbol}"
+
+def diff_levels(prev: Dict[float, float], cur: Levels) -> Levels:
+    """Levels die in ``cur`` nieuw of gewijzigd zijn, plus (price, 0.0) voor verdwenen prijzen."""
+    changed = [(p, s) for p, s in cur if prev.get(p) != s]
+    if len(prev) > len(cur) - len(changed):
+        seen = {p for p, _ in cur}
+        changed.extend((p, 0.0) for p in prev if p not in seen)
+    return changed
+
+class DeltaEncoder:
+    """Writer-state per boek: laatst gepubliceerde levels en wanneer de volgende snapshot moet."""
+
+    def __init__(self, snapshot_every: int = 50, snapshot_ms: int = 1000):
+        self.snapshot_every = snapshot_every
+        self.snapshot_ms = snapshot_ms
+        self._last: Dict[str, Tuple[Dict[float, float], Dict[float, float], int, int, int]] = {}
+
+    def encode(self, key: str, asks: Levels, bids: Levels, ts: int, seq: int) -> Tuple[bool, Dict[str, bytes]]:
+        """(is_snapshot, stream-fields) voor deze versie van het boek."""
+        prev = self._last.get(key)
+        now = int(time.time() * 1000)
+        cur_asks, cur_bids = dict(asks), dict(bids)
+        if prev is not None:
+            p_asks, p_bids, p_seq, since, snap_at = prev
+            if since + 1 < self.snapshot_every and now - snap_at < self.snapshot_ms and seq > p_seq:
+                self._last[key] = (cur_asks, cur_bids, seq, since + 1, snap_at)
+                body = encode_book(diff_levels(p_asks, asks), diff_levels(p_bids, bids), ts, seq)
+                return False, {"t": b"d", "seq": str(seq).encode(), "prev": str(p_seq).encode(), "b": body}
+        self._last[key] = (cur_asks, cur_bids, seq, 0, now)
+        return True, {"t": b"s", "seq": str(seq).encode(), "b": encode_book(asks, bids, ts, seq)}
+
+    def reset(self, key: Optional[str] = None) -> None:
+        """Forceer een snapshot (bv. na een mislukte write: lezers zouden anders een gat zien)."""
+        if key is None:
+            self._last.clear()
+        else:
+            self._last.pop(key, None)
+
+class _LocalBook:
+    __slots__ = ("asks", "bids", "ts", "seq", "_sorted")
+
+    def __init__(self):
+        self.asks: Dict[float, float] = {}
+        self.bids: Dict[float, float] = {}
+        self.ts = 0
+        self.seq = -1  # -1: nog geen snapshot gezien
+        self._sorted: Optional[Tuple[Levels, Levels]] = None
+
+    def snapshot(self, asks: Levels, bids: Levels, ts: int, seq: int) -> None:
+        self.asks, self.bids = dict(asks), dict(bids)
+        self.ts, self.seq = ts, seq
+        self._sorted = (asks, bids)  # komt al gesorteerd uit de codec
+
+    def apply(self, asks: Levels, bids: Levels, ts: int, seq: int, prev: int) -> bool:
+        if self.seq < 0 or prev != self.seq:
+            self.seq = -1  # gat: wachten op de volgende snapshot
+            self._sorted = None
+            return False
+        for side, levels in ((self.asks, asks), (self.bids, bids)):
+            for p, s in levels:
+                if s > 0:
+                    side[p] = s
+                else:
+                    side.pop(p, None)
+        self.ts, self.seq = ts, seq
+        self._sorted = None
+        return True
+
+    def levels(self) -> Optional[Tuple[Levels, Levels]]:
+        if self.seq < 0:
+            return None
+        if self._sorted is None:
+            self._sorted = (sorted(self.asks.items()), sorted(self.bids.items(), reverse=True))
+        return self._sorted
+
+class DeltaBookFollower:
+    """Houdt lokale boeken bij door de delta-streams te volgen (één XREAD voor alle boeken).
+
+    ``follow`` registreert een boek; de eerste read begint bij het begin van de stream, zodat de
+    laatste snapshot plus alle latere deltas worden toegepast. ``get`` geeft (ts, asks, bids) of None.
+    """
+
+    def __init__(self, redis, block_ms: int = 1000, count: int = 1000):
+        self.redis = redis
+        self.block_ms = block_ms
+        self.count = count
+        self._books: Dict[str, _LocalBook] = {}
+        self._ids: Dict[str, str] = {}
+        self._wake = asyncio.Event()
+
+    def follow(self, exchange: str, symbol: str) -> None:
+        key = stream_key(exchange, symbol)
+        if key not in self._ids:
+            self._ids[key] = "0-0"
+            self._books[key] = _LocalBook()
+            self._wake.set()
+
+    def get(self, exchange: str, symbol: str) -> Optional[Tuple[int, Levels, Levels]]:
+        book = self._books.get(stream_key(exchange, symbol))
+        levels = book.levels() if book is not None else None
+        if levels is None:
+            return None
+        return book.ts, levels[0], levels[1]
+
+    def _apply(self, key: str, fields: Dict[bytes, bytes]) -> None:
+        book = self._books[key]
+        body = decode_book(fields[b"b"])
+        seq = int(fields[b"seq"])
+        if fields.get(b"t") == b"s":
+            book.snapshot(body.asks, body.bids, body.ts, seq)
+        else:
+            book.apply(body.asks, body.bids, body.ts, seq, int(fields.get(b"prev") or -1))
+
+    async def run(self):
+        while True:
+            if not self._ids:
+                self._wake.clear()
+                await self._wake.wait()
+            try:
+                resp = await self.redis.xread(dict(self._ids), count=self.count, block=self.block_ms)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("[deltas] xread error:", e)
+                await asyncio.sleep(0.5)
+                continue
+            for stream, entries in resp or []:
+                key = stream.decode() if isinstance(stream, bytes) else stream
+                for entry_id, fields in entries:
+                    self._apply(key, fields)
+                    self._ids[key] = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
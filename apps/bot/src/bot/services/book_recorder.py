@@ -0,0 +1,146 @@
+"""Recorder: elke ``publish_orderbook`` als compact record in roterende, append-only bestanden.
+
+Bestandsformaat (little-endian, alles 8-byte aligned zodat ``mmap`` + ``np.frombuffer`` zonder kopie kan):
+
+    file header   "OBREC1\\0\\0"                                   8 bytes
+    record        length u32 | type u8 | pad u8 | book-id u16     8 bytes, dan ``length`` bytes payload
+      type 0 (define)   orjson {"exchange", "symbol", "meta"} aangevuld tot een veelvoud van 8
+      type 1 (update)   book_codec-snapshot (header + float64-levels)
+
+Elk bestand is op zichzelf leesbaar: een boek wordt per bestand opnieuw gedefinieerd voor zijn
+eerste update. ``meta`` is de market-meta op het moment van opnemen (fees/precisie), zodat replay
+zonder netwerk kan.
+"""
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from .book_codec import decode_book, encode_book
+
+FILE_MAGIC = b"OBREC1\0\0"
+_REC = struct.Struct("<IBxH")
+REC_DEFINE = 0
+REC_UPDATE = 1
+
+RECORD_DIR = os.getenv("RECORD_DIR", "")  # leeg = recorder uit
+RECORD_ROTATE_MB = float(os.getenv("RECORD_ROTATE_MB", "256"))
+RECORD_FLUSH_SEC = float(os.getenv("RECORD_FLUSH_SEC", "1"))
+
+def _pad8(b: bytes) -> bytes:
+    return b + b" " * (-len(b) % 8)
+
+class BookRecorder:
+    def __init__(self, directory: str, rotate_bytes: int, flush_sec: float = 1.0, meta_fn=None):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.flush_sec = flush_sec
+        self.meta_fn = meta_fn
+        self._ids: Dict[Tuple[str, str], int] = {}
+        self._defined: set = set()
+        self._fh = None
+        self._size = 0
+        self._last_flush = 0.0
+        self.records = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self) -> None:
+        self.close()
+        name = os.path.join(self.directory, f"books-{int(time.time() * 1000)}.obr")
+        self._fh = open(name, "ab", buffering=1 << 20)
+        self._fh.write(FILE_MAGIC)
+        self._size = len(FILE_MAGIC)
+        self._defined = set()
+
+    def _write(self, rtype: int, book_id: int, payload: bytes) -> None:
+        self._fh.write(_REC.pack(len(payload), rtype, book_id))
+        self._fh.write(payload)
+        self._size += _REC.size + len(payload)
+
+    def record(self, exchange: str, symbol: str, asks, bids, ts: int, seq: int) -> None:
+        if self._fh is None or self._size >= self.rotate_bytes:
+            self._open()
+        key = (exchange, symbol)
+        book_id = self._ids.get(key)
+        if book_id is None:
+            book_id = self._ids[key] = len(self._ids)
+        if book_id not in self._defined:
+            meta = None
+            if self.meta_fn is not None:
+                try:
+                    meta = self.meta_fn(exchange, symbol)
+                except Exception:
+                    meta = None
+            self._write(REC_DEFINE, book_id, _pad8(orjson.dumps({"exchange": exchange, "symbol": symbol, "meta": meta})))
+            self._defined.add(book_id)
+        self._write(REC_UPDATE, book_id, encode_book(asks, bids, ts, seq))
+        self.records += 1
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_sec:
+            self._fh.flush()
+            self._last_flush = now
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+def _offline_meta(exchange: str, symbol: str) -> Optional[Dict[str, Any]]:
+    # alleen als de markets al geladen zijn: de recorder mag nooit netwerk/blokkerende calls doen
+    from .markets import get_exchange, get_market_meta
+    if get_exchange(exchange).markets:
+        return get_market_meta(exchange, symbol)
+    return None
+
+def recorder_from_env() -> Optional[BookRecorder]:
+    if not RECORD_DIR:
+        return None
+    return BookRecorder(RECORD_DIR, int(RECORD_ROTATE_MB * 1024 * 1024), RECORD_FLUSH_SEC, meta_fn=_offline_meta)
+
+def list_recordings(paths: List[str]) -> List[str]:
+    """Bestanden en mappen → ``.obr``-bestanden in opnamevolgorde (naam bevat de starttijd)."""
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            out.extend(os.path.join(p, f) for f in os.listdir(p) if f.endswith(".obr"))
+        else:
+            out.append(p)
+    return sorted(out, key=lambda f: os.path.basename(f))
+
+def read_recording(path: str) -> Iterator[Tuple[int, Any, Any]]:
+    """Yield ``(REC_DEFINE, book_id, dict)`` en ``(REC_UPDATE, book_id, DecodedBook)`` via mmap.
+
+    Een afgebroken laatste record (recorder liep nog) wordt overgeslagen.
+    """
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size <= len(FILE_MAGIC):
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(FILE_MAGIC)] != FILE_MAGIC:
+                raise ValueError(f"{path}: not an orderbook recording")
+            mv = memoryview(mm)
+            try:
+                off, end = len(FILE_MAGIC), len(mm)
+                while off + _REC.size <= end:
+                    length, rtype, book_id = _REC.unpack_from(mm, off)
+                    start = off + _REC.size
+                    if start + length > end:
+                        break
+                    body = mv[start:start + length]
+                    try:
+                        if rtype == REC_DEFINE:
+                            rec = orjson.loads(bytes(body).rstrip(b" "))
+                        elif rtype == REC_UPDATE:
+                            rec = decode_book(body)
+                        else:
+                            rec = None
+                    finally:
+                        body.release()  # mmap mag pas dicht zonder openstaande views
+                    off = start + length
+                    if rec is not None:
+                        yield rtype, book_id, rec
+            finally:
+                mv.release()
@@ -0,0 +1,113 @@
+"""Achtergrond-refresh van stale of ontbrekende boeken via REST, zonder de strategy te laten wachten.
+
+``request`` zet een boek in de wachtrij en keert direct terug. Een boek dat al wacht, al onderweg is
+of minder dan ``STRAT_REFRESH_MIN_INTERVAL_MS`` geleden is opgevraagd, telt niet dubbel. De worker
+start hoogstens ``STRAT_REFRESH_RATE`` fetches per seconde (de per-exchange limiet van ``async_rest``
+geldt daarbovenop). De wachtrij is begrensd tot ``STRAT_REFRESH_MAX_PENDING``; wat niet past, valt af.
+Opgehaalde boeken staan met hun ophaalmoment in ``get``, tot de stream weer iets verser heeft.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from .markets import fetch_orderbook_async
+from .metrics import REST_FALLBACKS
+from . import orderbook_store
+from .orderbook_store import AgedBook
+
+STRAT_REFRESH_RATE = float(os.getenv("STRAT_REFRESH_RATE", "5"))
+STRAT_REFRESH_MIN_INTERVAL_MS = int(float(os.getenv("STRAT_REFRESH_MIN_INTERVAL_MS", "2000")))
+STRAT_REFRESH_MAX_PENDING = int(os.getenv("STRAT_REFRESH_MAX_PENDING", "100"))
+
+Key = Tuple[str, str]
+
+class BookRefresher:
+    def __init__(self, rate: float = STRAT_REFRESH_RATE, min_interval_ms: int = STRAT_REFRESH_MIN_INTERVAL_MS,
+                 max_pending: int = STRAT_REFRESH_MAX_PENDING):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.min_interval_ms = min_interval_ms
+        self.max_pending = max(max_pending, 1)
+        self._pending: Dict[Key, None] = {}  # op volgorde van aanvraag
+        self._inflight: Set[Key] = set()
+        self._last_request: Dict[Key, int] = {}
+        self._books: Dict[Key, AgedBook] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._fetches: Set[asyncio.Task] = set()
+        self.requested = self.deduped = self.dropped = self.fetched = self.failed = 0
+
+    def request(self, exchange: str, symbol: str) -> bool:
+        """Refresh aanvragen; False als hij al loopt, net gedaan is of de wachtrij vol zit."""
+        key = (exchange, symbol)
+        now = int(time.time() * 1000)
+        if key in self._pending or key in self._inflight or now - self._last_request.get(key, 0) < self.min_interval_ms:
+            self.deduped += 1
+            return False
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._pending[key] = None
+        self._last_request[key] = now
+        self.requested += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wake.set()
+        return True
+
+    def get(self, exchange: str, symbol: str, max_age_ms: Optional[int] = None) -> Optional[AgedBook]:
+        book = self._books.get((exchange, symbol))
+        if book is None:
+            return None
+        if time.time() * 1000 - book[2] > (orderbook_store.STALE_MS if max_age_ms is None else max_age_ms):
+            del self._books[(exchange, symbol)]
+            return None
+        return book
+
+    async def _fetch(self, key: Key) -> None:
+        ex, sym = key
+        try:
+            asks, bids = await fetch_orderbook_async(ex, sym, limit=50)
+            self._books[key] = (asks, bids, int(time.time() * 1000))
+            self.fetched += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"[refresh] {ex} {sym} failed:", type(e).__name__, e)
+        finally:
+            self._inflight.discard(key)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            key = next(iter(self._pending))
+            del self._pending[key]
+            self._inflight.add(key)
+            REST_FALLBACKS.labels(*key).inc()
+            task = asyncio.create_task(self._fetch(key))
+            self._fetches.add(task)
+            task.add_done_callback(self._fetches.discard)
+            await asyncio.sleep(self.interval)  # rate limit over alle exchanges samen
+
+    async def close(self) -> None:
+        tasks = [t for t in (self._task, *self._fetches) if t is not None]
+        for t in tasks:
+            t.cancel()
+        for t in tasks:
+            with contextlib.suppress(BaseException):
+                await t
+        self._task = None
+        self._pending.clear()
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending), "inflight": len(self._inflight), "cached": len(self._books),
+            "requested": self.requested, "deduped": self.deduped, "dropped": self.dropped,
+            "fetched": self.fetched, "failed": self.failed,
+        }
+
+refresher = BookRefresher()
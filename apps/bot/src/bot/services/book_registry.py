@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+class BookSnapshot(NamedTuple):
+    exchange: str
+    symbol: str
+    asks: List[Tuple[float, float]]  # low->high
+    bids: List[Tuple[float, float]]  # high->low
+    ts: int
+    version: int
+
+class BookRegistry:
+    """In-process orderboeken per (exchange, symbol), gedeeld tussen stream- en strategy-worker.
+
+    De stream zet gesorteerde, afgekapte lijsten neer; lezers krijgen exact die objecten terug
+    (geen kopie), dus niemand mag ze na ``put`` nog muteren. Elke ``put`` verhoogt de versie en
+    meldt (exchange, symbol, version) aan alle subscribers.
+
+    Met ``keep_history`` bewaart de registry per boek ook de versies van de laatste ``history_ms``
+    (op de lokale klok van ``put``), zodat ``at`` het boek teruggeeft zoals het op een moment gold.
+    """
+
+    def __init__(self):
+        self._books: Dict[Tuple[str, str], BookSnapshot] = {}
+        self._subscribers: List[asyncio.Queue] = []
+        # True zodra een stream-worker in dit proces boeken schrijft
+        self.has_writer = False
+        # True: de registry is de enige bron (replay) — lezers vallen nooit terug op Redis
+        self.exclusive = False
+        self.history_ms = 0  # 0: geen historie
+        self.history_max = 1000
+        self._history: Dict[Tuple[str, str], Deque[Tuple[int, BookSnapshot]]] = {}
+
+    def keep_history(self, history_ms: int, max_versions: int = 1000) -> None:
+        """Per boek de versies van de laatste ``history_ms`` bewaren (hoogstens ``max_versions``)."""
+        self.history_ms = max(self.history_ms, int(history_ms))
+        self.history_max = max(self.history_max, int(max_versions))
+
+    def put(self, exchange: str, symbol: str, asks, bids, ts: int, recv_ms: Optional[int] = None) -> BookSnapshot:
+        prev = self._books.get((exchange, symbol))
+        snap = BookSnapshot(exchange, symbol, asks, bids, ts, (prev.version if prev else 0) + 1)
+        self._books[(exchange, symbol)] = snap
+        if self.history_ms:
+            self._remember(snap, int(time.time() * 1000) if recv_ms is None else recv_ms)
+        event = (exchange, symbol, snap.version)
+        for q in self._subscribers:
+            try:
+                q.put_nowait(event)
+            except asyncio.QueueFull:
+                pass  # trage lezer: de volgende versie komt vanzelf
+        return snap
+
+    def _remember(self, snap: BookSnapshot, now_ms: int) -> None:
+        h = self._history.get((snap.exchange, snap.symbol))
+        if h is None or h.maxlen != self.history_max:
+            h = self._history[(snap.exchange, snap.symbol)] = deque(h or (), maxlen=self.history_max)
+        h.append((now_ms, snap))
+        # de oudste blijft staan zolang hij nog gold aan het begin van het venster
+        while len(h) > 1 and h[1][0] <= now_ms - self.history_ms:
+            h.popleft()
+
+    def get(self, exchange: str, symbol: str) -> Optional[BookSnapshot]:
+        return self._books.get((exchange, symbol))
+
+    def at(self, exchange: str, symbol: str, ts_ms: int) -> Optional[BookSnapshot]:
+        """Versie die op ``ts_ms`` (lokale klok) gold; None als de historie niet zo ver teruggaat."""
+        h = self._history.get((exchange, symbol))
+        if not h:
+            return None
+        for recv_ms, snap in reversed(h):  # lookups liggen vrijwel altijd vlak bij het einde
+            if recv_ms <= ts_ms:
+                return snap
+        return None
+
+    def keys(self) -> List[Tuple[str, str]]:
+        return list(self._books)
+
+    def subscribe(self, maxsize: int = 10000) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        try:
+            self._subscribers.remove(q)
+        except ValueError:
+            pass
+
+registry = BookRegistry()
@@ -1,7 +1,11 @@
+import asyncio, os
 import ccxt
-from functools import lru_cache
+from .async_rest import call, ensure_markets, reload_markets
+from .market_index import index_for
 from .symbols import resolve_symbol_for_exchange
 
+MARKETS_REFRESH_SEC = float(os.getenv("MARKETS_REFRESH_SEC", "3600"))
+
 SUPPORTED = {
     "bitvavo": ccxt.bitvavo,
     "coinbase": ccxt.coinbase,  # Advanced Trade
@@ -25,38 +29,65 @@ def _sanitize_levels(levels):
             continue
     return out
 
-@lru_cache(maxsize=16)
+_EXCHANGES = {}
+
 def get_exchange(name: str):
     name = name.lower()
-    if name not in SUPPORTED:
-        raise ValueError(f"Exchange '{name}' not supported")
-    klass = SUPPORTED[name]
-    return klass({"enableRateLimit": True, "timeout": 15000})
+    ex = _EXCHANGES.get(name)
+    if ex is None:
+        if name not in SUPPORTED:
+            raise ValueError(f"Exchange '{name}' not supported")
+        ex = _EXCHANGES[name] = SUPPORTED[name]({"enableRateLimit": True, "timeout": 15000})
+    return ex
 
-def fetch_orderbook(name: str, symbol: str, limit: int = 50):
-    ex = get_exchange(name)
-    sym = resolve_symbol_for_exchange(ex, symbol)
-    ob = ex.fetch_order_book(sym, limit=limit)
+def _book_from_ccxt(ob):
     asks = _sanitize_levels(ob.get("asks"))
     bids = _sanitize_levels(ob.get("bids"))
     asks.sort(key=lambda x: x[0])
     bids.sort(key=lambda x: x[0], reverse=True)
     return asks, bids
 
-def get_market_meta(name: str, symbol: str):
+def fetch_orderbook(name: str, symbol: str, limit: int = 50):
+    # blokkerend: alleen buiten de event loop gebruiken (scripts, sync endpoints)
+    ex = get_exchange(name)
+    sym = resolve_symbol_for_exchange(ex, symbol)
+    return _book_from_ccxt(ex.fetch_order_book(sym, limit=limit))
+
+async def fetch_ccxt_orderbook_async(name: str, symbol: str, limit: int = 50, timeout: float = None):
+    """Ruw ccxt-orderboek zonder de loop te blokkeren; deadline via ``async_rest`` (asyncio.TimeoutError)."""
     ex = get_exchange(name)
+    await ensure_markets(name, ex)
     sym = resolve_symbol_for_exchange(ex, symbol)
-    markets = ex.load_markets()
-    m = markets[sym]
-    taker = m.get("taker", ex.fees.get("trading", {}).get("taker", 0.001))
-    precision = (m.get("precision") or {})
-    limits = (m.get("limits") or {})
-    base_step = precision.get("amount")
-    min_base = (limits.get("amount") or {}).get("min")
-    min_cost = (limits.get("cost") or {}).get("min")
-    return {
-        "taker_fee": float(taker if taker is not None else 0.001),
-        "base_step": float(base_step) if base_step else None,
-        "min_base": float(min_base) if min_base else None,
-        "min_notional": float(min_cost) if min_cost else None,
-    }
+    return await call(name, ex, "fetch_order_book", sym, limit=limit, timeout=timeout)
+
+async def fetch_orderbook_async(name: str, symbol: str, limit: int = 50, timeout: float = None):
+    return _book_from_ccxt(await fetch_ccxt_orderbook_async(name, symbol, limit, timeout))
+
+def get_market_meta(name: str, symbol: str):
+    # O(1): record is vooraf opgebouwd bij het laden van de markets (gedeeld, niet muteren)
+    meta = index_for(get_exchange(name)).meta(symbol)
+    if meta["taker_fee"] is None:
+        return {**meta, "taker_fee": 0.001}
+    return meta
+
+async def get_market_meta_async(name: str, symbol: str):
+    """Als ``get_market_meta``, maar laadt markets (eerste keer) zonder de loop te blokkeren."""
+    await ensure_markets(name, get_exchange(name))
+    return get_market_meta(name, symbol)
+
+async def refresh_markets() -> None:
+    """Markets van alle gebruikte exchanges herladen (in de thread-pool) en hun index opnieuw opbouwen.
+
+    Markets (sync én async) en index wisselen samen op de loop, zonder await ertussen.
+    """
+    for name, ex in list(_EXCHANGES.items()):
+        try:
+            await reload_markets(name, ex)
+            index_for(ex)
+        except Exception as e:
+            print(f"[markets] refresh failed for {name}:", e)
+
+async def refresh_markets_loop():
+    while True:
+        await asyncio.sleep(MARKETS_REFRESH_SEC)
+        await refresh_markets()
@@ -0,0 +1,94 @@
+"""Prometheus-metrics per pijplijn-stap (moet gelijk blijven in bot en api).
+
+Stappen van tick tot trade, elk als histogram in seconden:
+
+    exchange-ts ──► publish_orderbook     arb_exchange_to_publish_seconds{exchange,symbol}
+    boek gelezen door strategy/API        arb_book_age_seconds{exchange,symbol,source}
+    depth-simulatie                       arb_simulate_seconds{mode}
+    publish_opportunities                 arb_publish_seconds, arb_opportunity_to_publish_seconds
+    paper fill                            arb_opportunity_to_fill_seconds{symbol}, arb_paper_batch_seconds
+
+Plus tellers per exchange (updates, bytes naar Redis, REST-calls en REST-fallbacks voor boeken die
+niet in de cache stonden), de WebSocket-hub van de API (clients, wachtrijen, gedropte berichten) en de
+scan-cache van de API (hit, miss, coalesced).
+``prometheus_client`` is optioneel: zonder het pakket zijn alle metrics no-ops en geeft ``/metrics`` 503.
+"""
+import time
+from typing import Optional, Tuple
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+
+# latencies van sub-ms (registry) tot seconden (REST, trage venue)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# één simulatie of batch: µs tot tientallen ms
+SIM_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1)
+
+class _Noop:
+    def labels(self, *args, **kwargs) -> "_Noop":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, amount: float) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+def _counter(name: str, doc: str, labels=()):
+    return Counter(name, doc, labels) if METRICS_AVAILABLE else _Noop()
+
+def _gauge(name: str, doc: str, labels=()):
+    return Gauge(name, doc, labels) if METRICS_AVAILABLE else _Noop()
+
+def _histogram(name: str, doc: str, labels=(), buckets=LATENCY_BUCKETS):
+    return Histogram(name, doc, labels, buckets=buckets) if METRICS_AVAILABLE else _Noop()
+
+EXCHANGE_TO_PUBLISH = _histogram(
+    "arb_exchange_to_publish_seconds", "Exchange timestamp to publish_orderbook", ("exchange", "symbol"))
+BOOK_AGE = _histogram(
+    "arb_book_age_seconds", "Age of a book when read (registry, deltas or redis)", ("exchange", "symbol", "source"))
+SIMULATE = _histogram(
+    "arb_simulate_seconds", "Depth simulation duration (scalar: per pair, batch: per batch)", ("mode",), SIM_BUCKETS)
+SIMULATED_PAIRS = _counter("arb_simulated_pairs_total", "Pairs run through the depth simulation", ("mode",))
+PUBLISH = _histogram("arb_publish_seconds", "publish_opportunities round-trip to Redis")
+OPPORTUNITY_TO_PUBLISH = _histogram(
+    "arb_opportunity_to_publish_seconds", "Opportunity computed to published", ("symbol",))
+OPPORTUNITY_TO_FILL = _histogram(
+    "arb_opportunity_to_fill_seconds", "Opportunity computed to paper fill written", ("symbol",))
+PAPER_FILLS = _counter("arb_paper_fills_total", "Paper fills written", ("symbol",))
+PAPER_BATCH = _histogram("arb_paper_batch_seconds", "Paper execution of one published message (dedup + fills)")
+PAPER_SKIPPED = _counter("arb_paper_skipped_total", "Paper items not filled, by reason", ("reason",))
+
+BOOK_UPDATES = _counter("arb_book_updates_total", "Orderbook updates published", ("exchange", "symbol"))
+BOOK_BYTES = _counter("arb_book_bytes_total", "Orderbook bytes written to Redis", ("exchange", "kind"))
+REST_CALLS = _counter("arb_rest_calls_total", "REST calls to exchanges", ("exchange", "method", "outcome"))
+REST_SECONDS = _histogram("arb_rest_seconds", "REST call duration", ("exchange", "method"))
+REST_FALLBACKS = _counter(
+    "arb_rest_fallback_total", "Books fetched over REST because the cache had none", ("exchange", "symbol"))
+STALE_BOOKS = _counter(
+    "arb_stale_books_total", "Stale or missing books seen by the strategy, by policy action", ("exchange", "action"))
+
+WS_CLIENTS = _gauge("arb_ws_clients", "Connected WebSocket clients")
+WS_QUEUE_DEPTH = _gauge("arb_ws_queue_depth", "Messages queued over all WebSocket clients")
+WS_QUEUE_MAX = _gauge("arb_ws_queue_depth_max", "Deepest WebSocket client queue")
+WS_MESSAGES = _counter("arb_ws_messages_total", "Messages received from Redis by the WebSocket hub")
+WS_DROPS = _counter("arb_ws_drops_total", "Messages dropped for slow WebSocket clients", ("reason",))
+
+SCAN_CACHE = _counter("arb_scan_cache_total", "Scan requests by cache outcome (hit, miss, coalesced)", ("result",))
+
+def observe_age(hist, ts_ms: Optional[int], *labels) -> None:
+    """Leeftijd t.o.v. nu voor een ms-timestamp; 0/None (onbekend) wordt overgeslagen."""
+    if ts_ms:
+        hist.labels(*labels).observe(max(time.time() - ts_ms / 1000.0, 0.0))
+
+def render() -> Tuple[bytes, str, int]:
+    """(body, content-type, status) voor een ``/metrics``-endpoint."""
+    if not METRICS_AVAILABLE:
+        return b"prometheus_client not installed\n", "text/plain; charset=utf-8", 503
+    return generate_latest(), CONTENT_TYPE_LATEST, 200
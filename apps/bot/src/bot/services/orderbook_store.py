@@ -1,27 +1,109 @@
-import os, time, orjson
-from typing import Optional, Tuple, List
-from redis.asyncio import from_url as redis_from_url
+import asyncio, contextlib, os, time
+from typing import Dict, Iterable, Optional, Tuple, List
+from .book_codec import decode_book
+from .book_deltas import DeltaBookFollower
+from .book_registry import registry
+from .metrics import BOOK_AGE, observe_age
+from .redis_pool import get_redis
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 STALE_MS = int(float(os.getenv("ORDERBOOK_STALE_MS", "5000")))
+# 1: boeken lokaal bijhouden via de delta-streams (obd:*) van de stream-worker
+ORDERBOOK_DELTAS = os.getenv("ORDERBOOK_DELTAS", "0").lower() in ("1", "true", "yes")
+
+_follower: Optional[DeltaBookFollower] = None
+_follower_task: Optional[asyncio.Task] = None
 
 def _key(exchange: str, symbol: str) -> str:
     return f"ob:{exchange}:{symbol}"
 
+# (asks, bids, ts): boek met zijn exchange-/stream-timestamp in ms (0 = onbekend)
+AgedBook = Tuple[List[tuple], List[tuple], int]
+
+def _is_stale(ts: int, max_age_ms: Optional[int] = None) -> bool:
+    return bool(ts) and (time.time()*1000 - ts) > (STALE_MS if max_age_ms is None else max_age_ms)
+
+def _decode(data, exchange: str, symbol: str, max_age_ms: Optional[int] = None) -> Optional[AgedBook]:
+    # binair (stream) of JSON (oudere writers); beide komen gesorteerd terug
+    if not data:
+        return None
+    book = decode_book(data)
+    observe_age(BOOK_AGE, book.ts, exchange, symbol, "redis")
+    if _is_stale(book.ts, max_age_ms):
+        return None
+    return book.asks, book.bids, book.ts
+
+def _from_registry(exchange: str, symbol: str, max_age_ms: Optional[int] = None):
+    """(gevonden, boek): gevonden=True betekent dat Redis niet meer geraadpleegd hoeft te worden."""
+    snap = registry.get(exchange, symbol)
+    if snap is not None and not _is_stale(snap.ts, max_age_ms):
+        observe_age(BOOK_AGE, snap.ts, exchange, symbol, "registry")
+        return True, (snap.asks, snap.bids, snap.ts)
+    if registry.exclusive or (registry.has_writer and snap is not None):
+        return True, None  # eigen stream (of replay) is leidend; Redis bevat niets nieuwers
+    return False, None
+
+def _get_follower() -> DeltaBookFollower:
+    global _follower, _follower_task
+    if _follower is None:
+        _follower = DeltaBookFollower(get_redis())
+        _follower_task = asyncio.create_task(_follower.run())
+    return _follower
+
+async def close_follower() -> None:
+    global _follower, _follower_task
+    if _follower_task is not None:
+        _follower_task.cancel()
+        with contextlib.suppress(BaseException):
+            await _follower_task
+    _follower = _follower_task = None
+
+def _from_deltas(exchange: str, symbol: str, max_age_ms: Optional[int] = None):
+    """(gevonden, boek) uit de gevolgde delta-streams; eerste aanvraag registreert het boek."""
+    if not ORDERBOOK_DELTAS:
+        return False, None
+    follower = _get_follower()
+    follower.follow(exchange, symbol)
+    got = follower.get(exchange, symbol)
+    if got is None or _is_stale(got[0], max_age_ms):
+        return False, None
+    observe_age(BOOK_AGE, got[0], exchange, symbol, "deltas")
+    return True, (got[1], got[2], got[0])
+
 async def get_cached_orderbook(exchange: str, symbol: str) -> Optional[Tuple[List[tuple], List[tuple]]]:
-    r = redis_from_url(REDIS_URL, decode_responses=False)
-    try:
-        data = await r.get(_key(exchange, symbol))
-        if not data:
-            return None
-        snap = orjson.loads(data)
-        ts = int(snap.get("ts") or 0)
-        if ts and (time.time()*1000 - ts) > STALE_MS:
-            return None
-        asks = [(float(p), float(a)) for p, a in snap.get("asks", [])]
-        bids = [(float(p), float(a)) for p, a in snap.get("bids", [])]
-        asks.sort(key=lambda x: x[0])
-        bids.sort(key=lambda x: x[0], reverse=True)
-        return asks, bids
-    finally:
-        await r.close()
+    # 1) in-process registry (stream-worker in dit proces): geen netwerk, geen decode, geen kopie
+    found, book = _from_registry(exchange, symbol)
+    if not found:
+        # 2) lokaal bijgehouden boek uit de delta-streams
+        found, book = _from_deltas(exchange, symbol)
+    if not found:
+        # 3) Redis snapshot (stream draait in een ander proces)
+        book = _decode(await get_redis().get(_key(exchange, symbol)), exchange, symbol)
+    return book[:2] if book else None
+
+async def get_cached_orderbooks_aged(books: Iterable[Tuple[str, str]],
+                                     max_age_ms: Optional[int] = None) -> Dict[Tuple[str, str], Optional[AgedBook]]:
+    """Snapshot van meerdere (exchange, symbol)-boeken: registry en delta-boeken eerst, de rest in één MGET.
+
+    Elk boek wordt hooguit één keer gedecodeerd en komt terug als (asks, bids, ts); ontbrekende boeken
+    en boeken ouder dan ``max_age_ms`` (standaard ``ORDERBOOK_STALE_MS``) zijn None.
+    """
+    out: Dict[Tuple[str, str], Optional[AgedBook]] = {}
+    missing = []
+    for book in dict.fromkeys(books):
+        found, val = _from_registry(*book, max_age_ms)
+        if not found:
+            found, val = _from_deltas(*book, max_age_ms)
+        if found:
+            out[book] = val
+        else:
+            missing.append(book)
+    if missing:
+        raw = await get_redis().mget([_key(ex, sym) for ex, sym in missing])
+        for book, data in zip(missing, raw):
+            out[book] = _decode(data, *book, max_age_ms)
+    return out
+
+async def get_cached_orderbooks(books: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[Tuple[List[tuple], List[tuple]]]]:
+    """Als ``get_cached_orderbooks_aged`` met ``ORDERBOOK_STALE_MS``, zonder timestamps: stale boeken zijn None."""
+    aged = await get_cached_orderbooks_aged(books)
+    return {book: val[:2] if val else None for book, val in aged.items()}
@@ -0,0 +1,42 @@
+import os
+from typing import Any, Dict, Optional
+from redis.asyncio import Redis, BlockingConnectionPool
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "32"))
+# Hoe lang een aanvraag op een vrije connectie wacht voordat hij faalt (s)
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+
+_pool: Optional[BlockingConnectionPool] = None
+_client: Optional[Redis] = None
+
+def get_redis() -> Redis:
+    """Gedeelde client (bytes, geen decode) op één connection pool per proces."""
+    global _pool, _client
+    if _client is None:
+        _pool = BlockingConnectionPool.from_url(
+            REDIS_URL, max_connections=REDIS_POOL_SIZE, timeout=REDIS_POOL_TIMEOUT,
+        )
+        _client = Redis(connection_pool=_pool)
+    return _client
+
+async def close_redis() -> None:
+    global _pool, _client
+    client, pool = _client, _pool
+    _client = _pool = None
+    if client is not None:
+        await client.close()
+    if pool is not None:
+        await pool.disconnect()
+
+def pool_stats() -> Dict[str, Any]:
+    if _pool is None:
+        return {"initialized": False, "max_connections": REDIS_POOL_SIZE}
+    in_use = len(getattr(_pool, "_in_use_connections", ()))
+    idle = len([c for c in getattr(_pool, "_available_connections", ()) if c is not None])
+    return {
+        "initialized": True,
+        "max_connections": _pool.max_connections,
+        "in_use": in_use,
+        "idle": idle,
+    }
@@ -0,0 +1,187 @@
+"""Verdeling van symbolen over bot-replica's: leases in Redis, consistent hashing en een lock per symbool.
+
+Elke replica heeft een lease in de sorted set ``SHARD_KEY`` (score = verloopmoment in ms) en vernieuwt
+die elke ``SHARD_RENEW_MS``. Uit de levende replica's bouwt iedereen dezelfde hash-ring
+(``SHARD_VNODES`` virtuele knopen per replica); de eigenaar van een symbool is de eerste knoop na
+``hash(symbool)``. Een join of een verlopen lease verplaatst alleen de symbolen van dat segment.
+
+Geen dubbele kansen tijdens een rebalance: wie een symbool wil draaien moet ook de lock
+``{SHARD_KEY}:lock:{symbool}`` houden (zelfde TTL). Een replica die een symbool kwijtraakt stopt eerst
+zijn werk en geeft de lock pas bij de volgende heartbeat vrij; de nieuwe eigenaar neemt hem daarna
+over. Zonder geldige lease (Redis weg, lange pauze) geldt een replica als eigenaar van niets.
+"""
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Iterable, List, Optional, Set, Tuple
+
+SHARD_ENABLED = os.getenv("SHARD_ENABLED", "0").lower() in ("1", "true", "yes")
+SHARD_ID = os.getenv("SHARD_ID") or f"{socket.gethostname()}-{os.getpid()}"
+SHARD_KEY = os.getenv("SHARD_KEY", "bot:replicas")
+SHARD_LEASE_MS = int(float(os.getenv("SHARD_LEASE_MS", "6000")))
+SHARD_RENEW_MS = int(float(os.getenv("SHARD_RENEW_MS", "2000")))
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "64"))
+
+# taak die niet per symbool te splitsen is (cycli lopen over alle boeken): één replica draait hem
+CYCLES_KEY = "@cycles"
+
+_RENEW_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+_RELEASE_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+def _hash(key: str) -> int:
+    # stabiel over processen heen (Python's hash() is per proces gezouten)
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    def __init__(self, members: Iterable[str], vnodes: int = SHARD_VNODES):
+        points = sorted((_hash(f"{m}#{i}"), m) for m in members for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._members = [m for _, m in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        return self._members[bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)]
+
+class ShardManager:
+    def __init__(self, redis, replica_id: str = SHARD_ID, lease_ms: int = SHARD_LEASE_MS,
+                 renew_ms: int = SHARD_RENEW_MS, vnodes: int = SHARD_VNODES):
+        self.redis = redis
+        self.id = replica_id
+        self.lease_ms = lease_ms
+        self.renew_ms = renew_ms
+        self.vnodes = vnodes
+        self.keys: Set[str] = set()
+        self.members: List[str] = []
+        self.held: Set[str] = set()
+        self._releasing: Set[str] = set()
+        self._valid_until = 0.0  # monotonic; daarna zijn de locks mogelijk verlopen
+        self._changed = asyncio.Event()
+        self._kick = asyncio.Event()
+
+    def _lock(self, key: str) -> str:
+        return f"{SHARD_KEY}:lock:{key}"
+
+    def add_keys(self, keys: Iterable[str]) -> None:
+        new = set(keys) - self.keys
+        if new:
+            self.keys |= new
+            self._kick.set()  # niet wachten tot de volgende heartbeat
+
+    def owns(self, key: str) -> bool:
+        return key in self.held and time.monotonic() < self._valid_until
+
+    def current(self, keys: Iterable[str]) -> Tuple[List[str], asyncio.Event]:
+        """(eigen keys uit ``keys`` in hun volgorde, event dat afgaat bij de volgende wijziging)."""
+        return [k for k in keys if self.owns(k)], self._changed
+
+    def _notify(self) -> None:
+        ev, self._changed = self._changed, asyncio.Event()
+        ev.set()
+
+    async def _beat(self) -> None:
+        t0 = time.monotonic()
+        now_ms = int(time.time() * 1000)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(SHARD_KEY, {self.id: now_ms + self.lease_ms})
+        pipe.zremrangebyscore(SHARD_KEY, "-inf", now_ms)
+        pipe.zrangebyscore(SHARD_KEY, now_ms, "+inf")
+        for key in self._releasing:
+            pipe.eval(_RELEASE_LUA, 1, self._lock(key), self.id)
+        _, _, members, *_ = await pipe.execute()
+        self._releasing = set()
+        self.members = sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+
+        ring = HashRing(self.members, self.vnodes)
+        desired = {k for k in self.keys if ring.owner(k) == self.id}
+        lost = self.held - desired
+        if lost:
+            # eerst het werk stoppen; vrijgeven pas bij de volgende beat
+            self.held -= lost
+            self._releasing = lost
+            self._notify()
+
+        keep = sorted(desired & self.held)
+        want = sorted(desired - self.held)
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keep:
+            pipe.eval(_RENEW_LUA, 1, self._lock(key), self.id, self.lease_ms)
+        for key in want:
+            pipe.set(self._lock(key), self.id, nx=True, px=self.lease_ms)
+        res = await pipe.execute() if keep or want else []
+        held = {k for k, ok in zip(keep + want, res) if ok}
+        # locks zijn gezet na t0: tot ruim voor hun verloop zijn ze van ons
+        self._valid_until = t0 + self.lease_ms / 1000.0 * 0.8
+        if held != self.held:
+            self.held = held
+            self._notify()
+
+    async def run(self) -> None:
+        print(f"[shard] replica {self.id} (lease {self.lease_ms}ms, renew {self.renew_ms}ms)")
+        last_members: List[str] = []
+        while True:
+            self._kick.clear()
+            try:
+                await self._beat()
+                if self.members != last_members:
+                    last_members = list(self.members)
+                    print(f"[shard] {len(self.members)} replicas, own {len(self.held)}/{len(self.keys)} keys")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("[shard] heartbeat error:", e)
+                if self.held and time.monotonic() >= self._valid_until:
+                    self.held = set()  # lease mogelijk verlopen: een andere replica kan al eigenaar zijn
+                    self._notify()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._kick.wait(), self.renew_ms / 1000.0)
+
+    async def close(self) -> None:
+        """Lease en locks direct vrijgeven, zodat de rest niet op het verlopen hoeft te wachten."""
+        held, self.held = self.held | self._releasing, set()
+        self._notify()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrem(SHARD_KEY, self.id)
+        for key in held:
+            pipe.eval(_RELEASE_LUA, 1, self._lock(key), self.id)
+        with contextlib.suppress(Exception):
+            await pipe.execute()
+
+_shard: Optional[ShardManager] = None
+
+def get_shard() -> Optional[ShardManager]:
+    """Gedeelde manager als ``SHARD_ENABLED``, anders None (deze replica draait alles)."""
+    global _shard
+    if _shard is None and SHARD_ENABLED:
+        from .redis_pool import get_redis
+        _shard = ShardManager(get_redis())
+    return _shard
+
+async def close_shard() -> None:
+    global _shard
+    if _shard is not None:
+        await _shard.close()
+        _shard = None
+
+async def run_sharded(keys: List[str], start: Callable[[List[str]], Awaitable], name: str) -> None:
+    """``start(eigen keys)`` draaien en bij elke rebalance herstarten; zonder sharding één keer met alles."""
+    shard = get_shard()
+    if shard is None:
+        await start(keys)
+        return
+    shard.add_keys(keys)
+    while True:
+        owned, changed = shard.current(keys)
+        print(f"[{name}] shard: {len(owned)}/{len(keys)} keys {owned}")
+        task = asyncio.create_task(start(owned)) if owned else None
+        try:
+            await changed.wait()
+        finally:
+            if task is not None:
+                task.cancel()
+                with contextlib.suppress(BaseException):
+                    await task
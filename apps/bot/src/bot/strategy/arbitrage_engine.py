@@ -1,56 +1,98 @@
 import os, time, orjson, asyncio
 import traceback
 from typing import Dict, Any, List
-from ..services.orderbook_store import get_cached_orderbook
-from ..services.markets import fetch_orderbook, get_market_meta
-from .depth_sim import simulate_cross_fill
-from redis.asyncio import from_url as redis_from_url
+from ..services import orderbook_store
+from ..services.orderbook_store import get_cached_orderbook, get_cached_orderbooks_aged
+from ..services.book_refresher import refresher
+from ..services.markets import fetch_orderbook_async, get_market_meta_async
+from .depth_sim import simulate_cross_fill, solve_optimal_size
+from .depth_batch import simulate_many
+from ..services import opp_index, spread_series
+from ..services.redis_pool import get_redis
+from ..services.sharding import CYCLES_KEY, get_shard
+from ..services.metrics import (OPPORTUNITY_TO_PUBLISH, PUBLISH, REST_FALLBACKS, SIMULATE,
+                                SIMULATED_PAIRS, STALE_BOOKS, observe_age)
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 PUBLISH_CHANNEL = os.getenv("PUBLISH_CHANNEL", "opps")
 PUBLISH_STREAM = os.getenv("PUBLISH_STREAM", "opps_stream")
+# 1: ook de query-indexen van de API bijwerken (services/opp_index)
+PUBLISH_INDEX = os.getenv("PUBLISH_INDEX", "1") not in ("0", "false", "False")
+# 1: OHLC-buckets van spread/net per route bijhouden voor alle geëvalueerde paren (services/spread_series)
+STRAT_SPREAD_SERIES = os.getenv("STRAT_SPREAD_SERIES", "1") not in ("0", "false", "False")
+# Vectorized batch-simulatie (depth_batch) zodra een cyclus minstens zoveel paren heeft
+STRAT_BATCH_SIM = os.getenv("STRAT_BATCH_SIM", "1") not in ("0", "false", "False")
+STRAT_BATCH_MIN_PAIRS = int(os.getenv("STRAT_BATCH_MIN_PAIRS", "32"))
+# Boek ouder dan ORDERBOOK_STALE_MS of ontbrekend:
+#   skip      paar overslaan (reason=stale_book)
+#   penalize  stale boek tot STRAT_STALE_MAX_MS gebruiken, net - spent·PENALTY_BPS_PER_SEC·(leeftijd boven STALE_MS)
+#   refresh   paar overslaan en het boek op de achtergrond via REST verversen (services/book_refresher)
+#   rest      blokkerend via REST ophalen in de cyclus (oud gedrag)
+# penalize vraagt voor stale en ontbrekende boeken ook een refresh aan.
+STRAT_STALE_POLICY = os.getenv("STRAT_STALE_POLICY", "refresh").lower()
+STRAT_STALE_MAX_MS = int(float(os.getenv("STRAT_STALE_MAX_MS", "30000")))
+STRAT_STALE_PENALTY_BPS_PER_SEC = float(os.getenv("STRAT_STALE_PENALTY_BPS_PER_SEC", "1"))
 
 def _now_ms() -> int:
     return int(time.time() * 1000)
 
-async def compute_pair(
+async def _fill_missing(books: Dict[tuple, Any]) -> None:
+    """Ontbrekende boeken parallel via REST, elk met eigen deadline; een fout wordt per boek bewaard."""
+    missing = [book for book, val in books.items() if not val]
+    for ex, sym in missing:
+        REST_FALLBACKS.labels(ex, sym).inc()
+    if missing:
+        got = await asyncio.gather(*(fetch_orderbook_async(ex, sym, limit=50) for ex, sym in missing),
+                                   return_exceptions=True)
+        books.update(zip(missing, got))
+
+async def _book_from_snapshot(books: Dict[tuple, Any], exchange: str, symbol: str):
+    """Boek uit de scan-snapshot; een ontbrekend boek wordt één keer via REST gehaald en bewaard."""
+    book = books.get((exchange, symbol))
+    if not book:
+        REST_FALLBACKS.labels(exchange, symbol).inc()
+        book = books[(exchange, symbol)] = await fetch_orderbook_async(exchange, symbol, limit=50)
+    if isinstance(book, BaseException):
+        raise book
+    return book
+
+async def _prepare_pair(
     symbol: str, buy_ex: str, sell_ex: str,
-    budget_quote: float, withdraw_fee_base: float
+    budget_quote: float, withdraw_fee_base: float,
+    books: Dict[tuple, Any] = None,
+    metas: Dict[tuple, Dict[str, Any]] = None
 ) -> Dict[str, Any]:
-    cached_buy = await get_cached_orderbook(buy_ex, symbol)
-    cached_sell = await get_cached_orderbook(sell_ex, symbol)
-    if cached_buy:
-        asks, _ = cached_buy
-    else:
-        asks, _ = fetch_orderbook(buy_ex, symbol, limit=50)
-    if cached_sell:
-        _, bids = cached_sell
+    """Boeken + meta ophalen. Geeft ``{"result": ...}`` als er niets te simuleren valt,
+    anders de vaste velden van het resultaat plus de kwargs voor ``simulate_cross_fill`` onder ``"sim"``.
+
+    ``books`` is een snapshot uit ``get_cached_orderbooks``; zonder snapshot wordt per boek gelezen.
+    ``metas`` ({(exchange, symbol): meta}) maakt de evaluatie offline (replay): geen markets-lookup
+    en geen REST-fallback; een ontbrekend boek geldt dan als leeg.
+    """
+    if books is None:
+        books = {
+            (buy_ex, symbol): await get_cached_orderbook(buy_ex, symbol),
+            (sell_ex, symbol): await get_cached_orderbook(sell_ex, symbol),
+        }
+    if metas is not None:
+        asks, _ = books.get((buy_ex, symbol)) or ([], [])
+        _, bids = books.get((sell_ex, symbol)) or ([], [])
     else:
-        _, bids = fetch_orderbook(sell_ex, symbol, limit=50)
+        asks, _ = await _book_from_snapshot(books, buy_ex, symbol)
+        _, bids = await _book_from_snapshot(books, sell_ex, symbol)
     if not asks or not bids:
-        return {"ok": 0, "reason": "empty_orderbook", "symbol": symbol, "buy": buy_ex, "sell": sell_ex}
+        return {"result": {"ok": 0, "reason": "empty_orderbook", "symbol": symbol, "buy": buy_ex, "sell": sell_ex}}
 
-    buy_meta = get_market_meta(buy_ex, symbol)
-    sell_meta = get_market_meta(sell_ex, symbol)
+    if metas is not None:
+        buy_meta, sell_meta = metas[(buy_ex, symbol)], metas[(sell_ex, symbol)]
+    else:
+        buy_meta = await get_market_meta_async(buy_ex, symbol)
+        sell_meta = await get_market_meta_async(sell_ex, symbol)
     fee_buy, fee_sell = buy_meta["taker_fee"], sell_meta["taker_fee"]
 
     best_ask, best_bid = asks[0][0], bids[0][0]
     gross_spread = (best_bid - best_ask) / best_ask
 
-    res = simulate_cross_fill(
-        asks=asks, bids=bids,
-        fee_buy=fee_buy, fee_sell=fee_sell,
-        withdraw_fee_base=withdraw_fee_base,
-        max_quote_buy=budget_quote,
-        base_step=buy_meta.get("base_step") or sell_meta.get("base_step"),
-        min_base=buy_meta.get("min_base") or sell_meta.get("min_base"),
-        min_notional_buy=buy_meta.get("min_notional"),
-        min_notional_sell=sell_meta.get("min_notional"),
-    )
-
     return {
-        "ok": res.get("ok", 0),
-        "ts": _now_ms(),
         "symbol": symbol,
         "buy": buy_ex,
         "sell": sell_ex,
@@ -59,77 +101,256 @@ async def compute_pair(
         "gross_spread": gross_spread,
         "fee_buy": fee_buy,
         "fee_sell": fee_sell,
+        "sim": dict(
+            asks=asks, bids=bids,
+            fee_buy=fee_buy, fee_sell=fee_sell,
+            withdraw_fee_base=withdraw_fee_base,
+            max_quote_buy=budget_quote,
+            base_step=buy_meta.get("base_step") or sell_meta.get("base_step"),
+            min_base=buy_meta.get("min_base") or sell_meta.get("min_base"),
+            min_notional_buy=buy_meta.get("min_notional"),
+            min_notional_sell=sell_meta.get("min_notional"),
+        ),
+    }
+
+def _finish_pair(prep: Dict[str, Any], res: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "ok": res.get("ok", 0),
+        "ts": _now_ms(),
+        "symbol": prep["symbol"],
+        "buy": prep["buy"],
+        "sell": prep["sell"],
+        "best_ask": prep["best_ask"],
+        "best_bid": prep["best_bid"],
+        "gross_spread": prep["gross_spread"],
+        "fee_buy": prep["fee_buy"],
+        "fee_sell": prep["fee_sell"],
+        # market-limits van de simulatie: de paper-executor vult met dezelfde grenzen
+        "limits": {k: prep["sim"][k] for k in ("base_step", "min_base", "min_notional_buy", "min_notional_sell")},
         "depth": res,
     }
 
+def _error_item(symbol, bx, sx, e: Exception) -> Dict[str, Any]:
+    return {
+        "ok": 0,
+        "symbol": symbol,
+        "buy": bx,
+        "sell": sx,
+        "error_type": type(e).__name__,
+        "error": str(e),
+        # desgewenst heel kort stack-fragment (laatste regel):
+        "error_tail": traceback.format_exc().strip().splitlines()[-1],
+    }
+
+async def compute_pair(
+    symbol: str, buy_ex: str, sell_ex: str,
+    budget_quote: float, withdraw_fee_base: float,
+    with_curve: bool = False
+) -> Dict[str, Any]:
+    """Eén paar op aanvraag, met dezelfde boekbron en ``STRAT_STALE_POLICY`` als de cyclus: zonder
+    ``rest`` nooit een blokkerende REST-fetch (stale/ontbrekend → ``reason: stale_book``), en
+    ``book_age_ms`` zoals bij ``evaluate_pairs``."""
+    books, ages = await _load_books([(symbol, buy_ex, sell_ex)], offline=False)
+    book_age_ms = {"buy": ages.get((buy_ex, symbol)), "sell": ages.get((sell_ex, symbol))}
+    if STRAT_STALE_POLICY != "rest" and (books[(buy_ex, symbol)] is None or books[(sell_ex, symbol)] is None):
+        return {"ok": 0, "reason": "stale_book", "symbol": symbol, "buy": buy_ex, "sell": sell_ex,
+                "book_age_ms": book_age_ms}
+    prep = await _prepare_pair(symbol, buy_ex, sell_ex, budget_quote, withdraw_fee_base, books)
+    if "result" in prep:
+        return {**prep["result"], "book_age_ms": book_age_ms}
+    out = _finish_pair(prep, _with_stale_penalty(_simulate_one(prep["sim"]), prep, ages))
+    if with_curve:
+        # winst-vs-size curve en winstmaximaliserende size, los van het budget
+        sim = {k: v for k, v in prep["sim"].items() if k != "max_quote_buy"}
+        out["curve"] = solve_optimal_size(**sim)
+    out["book_age_ms"] = book_age_ms
+    return out
+
+def _simulate_one(sim: Dict[str, Any]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    res = simulate_cross_fill(**sim)
+    SIMULATE.labels("scalar").observe(time.perf_counter() - t0)
+    SIMULATED_PAIRS.labels("scalar").inc()
+    return res
+
+def _simulate_batch(jobs: List[Dict[str, Any]]):
+    """Batch-simulatie voor grote cycli; None = per paar de scalar referentie gebruiken."""
+    if not STRAT_BATCH_SIM or len(jobs) < STRAT_BATCH_MIN_PAIRS:
+        return None
+    try:
+        t0 = time.perf_counter()
+        res = simulate_many(jobs)
+        SIMULATE.labels("batch").observe(time.perf_counter() - t0)
+        SIMULATED_PAIRS.labels("batch").inc(len(jobs))
+        return res
+    except Exception as e:
+        print("[strategy] batch sim failed, falling back to scalar:", e)
+        return None
+
+async def _load_books(pairs, offline: bool):
+    """(books, leeftijden in ms) voor alle paren volgens ``STRAT_STALE_POLICY``; None = niet bruikbaar."""
+    now = _now_ms()
+    penalize = STRAT_STALE_POLICY == "penalize" and not offline
+    keys = [(ex, sym) for sym, bx, sx in pairs for ex in (bx, sx)]
+    aged = await get_cached_orderbooks_aged(keys, STRAT_STALE_MAX_MS if penalize else None)
+    books: Dict[tuple, Any] = {}
+    ages: Dict[tuple, Any] = {}
+    for key, val in aged.items():
+        if val is None and not offline and STRAT_STALE_POLICY not in ("rest", "skip"):
+            val = refresher.get(*key)  # eerder op de achtergrond opgehaald
+        if val is not None:
+            books[key] = val[:2]
+            ages[key] = now - val[2] if val[2] else None
+            if penalize and ages[key] is not None and ages[key] > orderbook_store.STALE_MS:
+                STALE_BOOKS.labels(key[0], "penalize").inc()
+                refresher.request(*key)
+            continue
+        books[key] = ages[key] = None
+        if offline:
+            continue
+        STALE_BOOKS.labels(key[0], STRAT_STALE_POLICY).inc()
+        if STRAT_STALE_POLICY in ("refresh", "penalize"):
+            refresher.request(*key)
+    if not offline and STRAT_STALE_POLICY == "rest":
+        await _fill_missing(books)
+        for key, val in books.items():
+            if ages[key] is None and val and not isinstance(val, BaseException):
+                ages[key] = 0  # net via REST opgehaald
+    return books, ages
+
+def _penalize(res: Dict[str, Any], age_ms: int) -> Dict[str, Any]:
+    """Leeftijdsboete op een simulatie met een stale boek (alleen de leeftijd boven STALE_MS telt)."""
+    spent = float(res.get("spent_quote") or 0.0)
+    penalty = spent * STRAT_STALE_PENALTY_BPS_PER_SEC / 10000.0 * (age_ms - orderbook_store.STALE_MS) / 1000.0
+    res = dict(res)
+    res["net_profit_quote"] = float(res.get("net_profit_quote") or 0.0) - penalty
+    res["stale_penalty_quote"] = penalty
+    if spent > 0:
+        res["roi"] = res["net_profit_quote"] / spent
+    if res["net_profit_quote"] <= 0:
+        res["ok"] = 0
+    return res
+
+def _with_stale_penalty(res: Dict[str, Any], prep: Dict[str, Any], ages: Dict[tuple, Any]) -> Dict[str, Any]:
+    if STRAT_STALE_POLICY != "penalize":
+        return res
+    age = max(ages[(prep["buy"], prep["symbol"])] or 0, ages[(prep["sell"], prep["symbol"])] or 0)
+    return _penalize(res, age) if age > orderbook_store.STALE_MS else res
+
+async def evaluate_pairs(pairs, budget_quote, withdraw_fee_base, metas=None) -> List[Dict[str, Any]]:
+    """Evalueer (symbol, buy, sell)-paren; alle simulaties samen in één batch. Volgorde blijft behouden.
+
+    Alle benodigde boeken worden vooraf in één keer gelezen (registry + één MGET), zodat elk boek
+    één keer gedecodeerd wordt en alle paren hetzelfde moment zien. Stale of ontbrekende boeken volgen
+    ``STRAT_STALE_POLICY``; elk resultaat krijgt ``book_age_ms`` ({buy, sell}, None = onbekend).
+    """
+    offline = metas is not None
+    books, ages = await _load_books(pairs, offline)
+    out: List[Dict[str, Any]] = [None] * len(pairs)
+    ready = []
+    for i, (sym, bx, sx) in enumerate(pairs):
+        if not offline and STRAT_STALE_POLICY != "rest" and (books[(bx, sym)] is None or books[(sx, sym)] is None):
+            # nooit REST in de cyclus: het paar wacht op de stream of de achtergrond-refresh
+            out[i] = {"ok": 0, "reason": "stale_book", "symbol": sym, "buy": bx, "sell": sx}
+            continue
+        try:
+            prep = await _prepare_pair(sym, bx, sx, budget_quote, withdraw_fee_base, books, metas)
+        except Exception as e:
+            out[i] = _error_item(sym, bx, sx, e)
+            continue
+        if "result" in prep:
+            out[i] = prep["result"]
+        else:
+            ready.append((i, prep))
+
+    results = _simulate_batch([prep["sim"] for _, prep in ready])
+    for n, (i, prep) in enumerate(ready):
+        try:
+            res = results[n] if results is not None else _simulate_one(prep["sim"])
+            out[i] = _finish_pair(prep, res if offline else _with_stale_penalty(res, prep, ages))
+        except Exception as e:
+            out[i] = _error_item(prep["symbol"], prep["buy"], prep["sell"], e)
+    for (sym, bx, sx), item in zip(pairs, out):
+        item["book_age_ms"] = {"buy": ages.get((bx, sym)), "sell": ages.get((sx, sym))}
+    return out
+
+def _sort_by_net(items: List[Dict[str, Any]]) -> None:
+    items.sort(key=lambda x: (x.get("depth", {}).get("net_profit_quote") or -1e18), reverse=True)
+
+def _all_pairs(symbol, exchanges) -> List[tuple]:
+    return [(symbol, bx, sx) for i, bx in enumerate(exchanges) for j, sx in enumerate(exchanges) if i != j]
+
 async def scan_all(symbol, exchanges, budget_quote, withdraw_fee_base):
-    out = []
-    for i, bx in enumerate(exchanges):
-        for j, sx in enumerate(exchanges):
-            if i == j:
-                continue
-            try:
-                out.append(await compute_pair(symbol, bx, sx, budget_quote, withdraw_fee_base))
-            except Exception as e:
-                out.append({
-                    "ok": 0,
-                    "symbol": symbol,
-                    "buy": bx,
-                    "sell": sx,
-                    "error_type": type(e).__name__,
-                    "error": str(e),
-                    # desgewenst heel kort stack-fragment (laatste regel):
-                    "error_tail": traceback.format_exc().strip().splitlines()[-1],
-                })
-    out.sort(key=lambda x: (x.get("depth", {}).get("net_profit_quote") or -1e18), reverse=True)
+    out = await evaluate_pairs(_all_pairs(symbol, exchanges), budget_quote, withdraw_fee_base)
+    _sort_by_net(out)
     return out
 
+def _pairs_touching(books: List[str], exchanges) -> List[tuple]:
+    """Geordende paren (buy, sell) die minstens één van de gegeven exchanges raken: 2·(N−1) per boek."""
+    out: Dict[tuple, None] = {}
+    for ex in books:
+        for other in exchanges:
+            if other == ex:
+                continue
+            out[(ex, other)] = None
+            out[(other, ex)] = None
+    return list(out)
+
 async def publish_opportunities(items: List[Dict[str, Any]], topn: int = 5):
+    shard = get_shard()
+    if shard is not None:
+        # tijdens een rebalance of zonder geldige lease: niets publiceren voor andermans symbolen
+        items = [it for it in items if shard.owns(CYCLES_KEY if it.get("kind") == "cycle" else it.get("symbol"))]
     if not items:
         return
-    r = redis_from_url(REDIS_URL, decode_responses=False)
-    try:
-        payload = orjson.dumps({"ts": _now_ms(), "items": items[:topn]})
-        await r.publish(PUBLISH_CHANNEL, payload)  # Pub/Sub realtime
-        await r.xadd(PUBLISH_STREAM, {"payload": payload}, maxlen=1000, approximate=True)  # Stream history
-    finally:
-        await r.close()
+    items = items[:topn]
+    payload = orjson.dumps({"ts": _now_ms(), "items": items})
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.publish(PUBLISH_CHANNEL, payload)  # Pub/Sub realtime
+    pipe.xadd(PUBLISH_STREAM, {"payload": payload}, maxlen=1000, approximate=True)  # Stream history
+    indexed = opp_index.add_to_pipeline(pipe, items) if PUBLISH_INDEX else 0
+    t0 = time.perf_counter()
+    res = await pipe.execute()
+    PUBLISH.observe(time.perf_counter() - t0)
+    if indexed and opp_index.needs_trim(res[-1]):
+        try:
+            await opp_index.trim(get_redis())
+        except Exception as e:
+            print("[strategy] opp index trim error:", e)
+    for it in items:
+        observe_age(OPPORTUNITY_TO_PUBLISH, it.get("ts"), it.get("symbol") or it.get("kind") or "")
 
 import os
 PUBLISH_FALLBACK_WHEN_EMPTY = os.getenv("PUBLISH_FALLBACK_WHEN_EMPTY", "1") not in ("0", "false", "False")
 
-async def run_strategy_once(symbols, exchanges, budget_quote, withdraw_fee_base,
-                            min_net_quote, min_roi_pct, topn):
-    blocks = []
+def _build_block(sym, pairs, min_net_quote, min_roi_pct, topn) -> Dict[str, Any]:
+    # ongefilterd top
+    debug_top = pairs[:topn]
+    debug_best_any = next((p for p in pairs if p.get("ok") is not None), None)
 
-    for sym in symbols:
-        pairs = await scan_all(sym, exchanges, budget_quote, withdraw_fee_base)
-        # ongefilterd top
-        debug_top = pairs[:topn]
-        debug_best_any = next((p for p in pairs if p.get("ok") is not None), None)
-
-        # gefilterd op thresholds
-        filtered = []
-        for p in pairs:
-            if not p.get("ok"):
-                continue
-            d = p.get("depth", {}) or {}
-            net = float(d.get("net_profit_quote") or 0.0)
-            roi = float(d.get("roi") or 0.0) * 100.0
-            if net >= min_net_quote and roi >= min_roi_pct:
-                filtered.append(p)
-        filtered.sort(key=lambda x: (x.get("depth", {}).get("net_profit_quote") or -1e18), reverse=True)
-
-        block = {
-            "symbol": sym,
-            "top": filtered[:topn],
-            "debug_top": debug_top,
-            "debug_best_any": debug_best_any,
-        }
-        if filtered:
-            block["best"] = filtered[0]
-        blocks.append(block)
+    # gefilterd op thresholds
+    filtered = []
+    for p in pairs:
+        if not p.get("ok"):
+            continue
+        d = p.get("depth", {}) or {}
+        net = float(d.get("net_profit_quote") or 0.0)
+        roi = float(d.get("roi") or 0.0) * 100.0
+        if net >= min_net_quote and roi >= min_roi_pct:
+            filtered.append(p)
+    _sort_by_net(filtered)
+
+    block = {
+        "symbol": sym,
+        "top": filtered[:topn],
+        "debug_top": debug_top,
+        "debug_best_any": debug_best_any,
+    }
+    if filtered:
+        block["best"] = filtered[0]
+    return block
 
+def select_published(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     # standaard: publiceer alleen gefilterde items
     flat = []
     for b in blocks:
@@ -140,6 +361,70 @@ async def run_strategy_once(symbols, exchanges, budget_quote, withdraw_fee_base,
             cand = b.get("debug_best_any") or (b.get("debug_top") or [None])[0]
             if cand:
                 flat.append(cand)
+    return flat
+
+async def _record_series(results: List[Dict[str, Any]]) -> None:
+    if STRAT_SPREAD_SERIES:
+        spread_series.recorder.observe(results)
+        spread_series.recorder.start(get_redis())  # flush en retentie op een eigen timer
+
+async def _publish_blocks(blocks: List[Dict[str, Any]], topn: int):
+    await publish_opportunities(select_published(blocks), topn=topn)
+
+async def run_strategy_once(symbols, exchanges, budget_quote, withdraw_fee_base,
+                            min_net_quote, min_roi_pct, topn, pair_cache=None,
+                            metas=None, publish=True):
+    """Volledige scan: elk symbool × elk geordend exchange-paar.
+
+    Met ``pair_cache`` ({symbol: {(buy, sell): pair}}) worden alle uitkomsten bewaard,
+    zodat de event-driven modus daarna incrementeel verder kan. ``metas``/``publish`` zijn voor replay
+    (offline meta, niets naar Redis).
+    """
+    requested = [p for sym in symbols for p in _all_pairs(sym, exchanges)]
+    results = await evaluate_pairs(requested, budget_quote, withdraw_fee_base, metas)
+    if publish:
+        await _record_series(results)
+    by_symbol: Dict[str, List[Dict[str, Any]]] = {sym: [] for sym in symbols}
+    for (sym, _, _), res in zip(requested, results):
+        by_symbol[sym].append(res)
+
+    blocks = []
+    for sym in symbols:
+        pairs = by_symbol[sym]
+        _sort_by_net(pairs)
+        if pair_cache is not None:
+            pair_cache[sym] = {(p["buy"], p["sell"]): p for p in pairs}
+        blocks.append(_build_block(sym, pairs, min_net_quote, min_roi_pct, topn))
+
+    if publish:
+        await _publish_blocks(blocks, topn)
+    return {"ts": _now_ms(), "blocks": blocks}
+
+async def run_strategy_for_books(touched, pair_cache, exchanges, budget_quote, withdraw_fee_base,
+                                 min_net_quote, min_roi_pct, topn, metas=None, publish=True):
+    """Event-driven: herbereken alleen de paren van de gewijzigde boeken.
+
+    ``touched`` is een iterable van (exchange, symbol); de overige paren van het symbool
+    komen ongewijzigd uit ``pair_cache``. Alleen geraakte symbolen worden gepubliceerd.
+    """
+    by_symbol: Dict[str, List[str]] = {}
+    for ex, sym in touched:
+        if ex in exchanges and ex not in by_symbol.setdefault(sym, []):
+            by_symbol[sym].append(ex)
+
+    requested = [(sym, bx, sx) for sym, exs in by_symbol.items() for bx, sx in _pairs_touching(exs, exchanges)]
+    results = await evaluate_pairs(requested, budget_quote, withdraw_fee_base, metas)
+    for (sym, bx, sx), res in zip(requested, results):
+        pair_cache.setdefault(sym, {})[(bx, sx)] = res
+    if publish:
+        await _record_series(results)
+
+    blocks = []
+    for sym in by_symbol:
+        pairs = list(pair_cache.get(sym, {}).values())  # leeg zolang er maar één exchange is
+        _sort_by_net(pairs)
+        blocks.append(_build_block(sym, pairs, min_net_quote, min_roi_pct, topn))
 
-    await publish_opportunities(flat, topn=topn)
+    if blocks and publish:
+        await _publish_blocks(blocks, topn)
     return {"ts": _now_ms(), "blocks": blocks}
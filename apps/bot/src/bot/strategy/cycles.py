@@ -0,0 +1,260 @@
+"""Multi-leg (o.a. driehoeks-)cycli over alle gecachte boeken, incrementeel per boek-update.
+
+Graaf: knopen zijn ``exchange:CURRENCY``; elk boek BASE/QUOTE geeft twee kanten op zijn exchange
+(verkopen tegen de bid, kopen tegen de ask, beide na taker-fee) met gewicht ``-log(rate)``.
+Dezelfde currency op twee exchanges is verbonden via een transfer-kant (``CYCLE_TRANSFER_BPS``).
+Een winstgevende cyclus is een negatieve cyclus.
+
+Incrementeel: een nieuwe negatieve cyclus moet door een gewijzigde kant ``u→v`` lopen, dus per
+update zoeken we alleen vanaf ``v`` terug naar ``u`` met een begrensde Bellman-Ford (hooguit
+``CYCLE_MAX_LEGS-1`` rondes, en per ronde alleen vanuit knopen die in de vorige ronde verbeterden).
+Kandidaten worden met volledige boekdiepte nagerekend en via ``publish_opportunities`` gepubliceerd.
+Een boek dat ontbreekt of stale wordt, verdwijnt uit de graaf (beide kanten) en uit de diepte-check.
+"""
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..services.book_registry import registry
+from ..services.markets import get_exchange, get_market_meta
+from ..services.orderbook_store import get_cached_orderbooks
+from ..services.redis_pool import get_redis
+
+CYCLE_MAX_LEGS = int(os.getenv("CYCLE_MAX_LEGS", "4"))
+CYCLE_MIN_EDGE_BPS = float(os.getenv("CYCLE_MIN_EDGE_BPS", "1"))
+# kosten per transfer tussen exchanges; <0 = geen cross-exchange kanten
+CYCLE_TRANSFER_BPS = float(os.getenv("CYCLE_TRANSFER_BPS", "0"))
+CYCLE_DEFAULT_FEE = float(os.getenv("CYCLE_DEFAULT_FEE", "0.001"))
+# SCAN over ob:* naar nieuwe boeken hoogstens zo vaak; tussendoor herbouwt refresh() de bekende boeken
+CYCLE_DISCOVER_MS = int(float(os.getenv("CYCLE_DISCOVER_MS", "30000")))
+
+def _parse_budgets(raw: str) -> Dict[str, float]:
+    out = {}
+    for part in raw.split(","):
+        if ":" in part:
+            ccy, amount = part.split(":", 1)
+            out[ccy.strip().upper()] = float(amount)
+    return out
+
+# startbedrag per currency voor de diepte-check; cycli zonder zo'n currency worden niet gepubliceerd
+CYCLE_BUDGETS = _parse_budgets(os.getenv("CYCLE_BUDGETS", "EUR:250,USD:250,USDT:250,USDC:250"))
+
+Book = Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]
+# (kind, exchange, symbol, fee): kind = "buy" (quote→base) | "sell" (base→quote) | "transfer"
+Edge = Tuple[str, str, str, float]
+
+def _node(exchange: str, ccy: str) -> str:
+    return f"{exchange}:{ccy}"
+
+def _taker_fee(exchange: str, symbol: str) -> float:
+    try:
+        if get_exchange(exchange).markets:  # geen load_markets in het hete pad
+            return float(get_market_meta(exchange, symbol)["taker_fee"])
+    except Exception:
+        pass
+    return CYCLE_DEFAULT_FEE
+
+class RateGraph:
+    def __init__(self, transfer_bps: float = CYCLE_TRANSFER_BPS):
+        self.transfer_w = -math.log(1 - transfer_bps / 10000.0) if transfer_bps >= 0 else None
+        self.adj: Dict[str, Dict[str, Tuple[float, Edge]]] = {}
+        self._by_ccy: Dict[str, List[str]] = {}
+
+    def _set(self, u: str, v: str, w: float, edge: Edge, changed: List[Tuple[str, str]]) -> None:
+        cur = self.adj.setdefault(u, {}).get(v)
+        if cur is None or cur[0] != w:
+            self.adj[u][v] = (w, edge)
+            changed.append((u, v))
+
+    def _add_node(self, exchange: str, ccy: str, changed: List[Tuple[str, str]]) -> str:
+        n = _node(exchange, ccy)
+        if n not in self.adj:
+            self.adj[n] = {}
+            peers = self._by_ccy.setdefault(ccy, [])
+            if self.transfer_w is not None:
+                for p in peers:
+                    self._set(n, p, self.transfer_w, ("transfer", p.split(":", 1)[0], ccy, 0.0), changed)
+                    self._set(p, n, self.transfer_w, ("transfer", exchange, ccy, 0.0), changed)
+            peers.append(n)
+        return n
+
+    def update(self, exchange: str, symbol: str, best_ask: float, best_bid: float, fee: float) -> List[Tuple[str, str]]:
+        """Zet de twee kanten van één boek; geeft de gewijzigde kanten (u, v) terug."""
+        changed: List[Tuple[str, str]] = []
+        base, quote = symbol.upper().split("/", 1)
+        b = self._add_node(exchange, base, changed)
+        q = self._add_node(exchange, quote, changed)
+        if best_bid > 0:
+            self._set(b, q, -math.log(best_bid * (1 - fee)), ("sell", exchange, symbol, fee), changed)
+        if best_ask > 0:
+            self._set(q, b, -math.log((1 - fee) / best_ask), ("buy", exchange, symbol, fee), changed)
+        return changed
+
+    def remove(self, exchange: str, symbol: str) -> None:
+        """Haalt de twee kanten van één boek weg (knopen en transfer-kanten blijven staan)."""
+        base, quote = symbol.upper().split("/", 1)
+        b, q = _node(exchange, base), _node(exchange, quote)
+        self.adj.get(b, {}).pop(q, None)
+        self.adj.get(q, {}).pop(b, None)
+
+    def cycles_through(self, u: str, v: str, max_legs: int, min_edge: float) -> List[List[str]]:
+        """Negatieve cycli ``u→v→…→u`` van hooguit ``max_legs`` kanten (begrensde BF vanaf v)."""
+        if v not in self.adj.get(u, {}):
+            return []  # kant is inmiddels weggehaald
+        w_uv = self.adj[u][v][0]
+        dist: Dict[str, float] = {v: 0.0}
+        layers: List[Dict[str, str]] = []  # per ronde: knoop → voorganger
+        frontier = {v}
+        found: List[List[str]] = []
+        for k in range(max_legs - 1):
+            parent: Dict[str, str] = {}
+            nxt: Dict[str, float] = {}
+            for a in frontier:
+                da = dist[a]
+                for c, (w, _) in self.adj.get(a, {}).items():
+                    if c == v:
+                        continue
+                    nd = da + w
+                    if nd < nxt.get(c, dist.get(c, math.inf)) - 1e-15:
+                        nxt[c] = nd
+                        parent[c] = a
+            if not nxt:
+                break
+            layers.append(parent)
+            dist.update(nxt)
+            if u in nxt and nxt[u] + w_uv < -min_edge:
+                path = [u]
+                for layer in reversed(layers):
+                    node = layer.get(path[-1])
+                    if node is None:
+                        break
+                    path.append(node)
+                path.reverse()  # v … u
+                if path[0] == v and len(set(path)) == len(path):
+                    found.append([u] + path[:-1])
+            frontier = set(nxt) - {u}
+        return found
+
+    def legs(self, cycle: List[str]) -> List[Edge]:
+        return [self.adj[a][cycle[(i + 1) % len(cycle)]][1] for i, a in enumerate(cycle)]
+
+def _walk(levels: List[Tuple[float, float]], amount: float, buy: bool) -> Optional[float]:
+    """Volledige-diepte fill: buy = quote→base over asks, anders base→quote over bids (None = te ondiep)."""
+    out = 0.0
+    for px, sz in levels:
+        if buy:
+            cost = px * sz
+            if cost >= amount:
+                return out + amount / px
+            out += sz
+            amount -= cost
+        else:
+            if sz >= amount:
+                return out + amount * px
+            out += sz * px
+            amount -= sz
+    return None
+
+def simulate_cycle(legs: List[Edge], books: Dict[Tuple[str, str], Book], start_amount: float) -> Dict[str, Any]:
+    amount = start_amount
+    for kind, exchange, symbol, fee in legs:
+        if kind == "transfer":
+            amount *= 1 - CYCLE_TRANSFER_BPS / 10000.0
+            continue
+        book = books.get((exchange, symbol))
+        if not book:
+            return {"ok": 0, "reason": "missing_book", "book": f"{exchange}:{symbol}"}
+        filled = _walk(book[0] if kind == "buy" else book[1], amount, kind == "buy")
+        if filled is None:
+            return {"ok": 0, "reason": "insufficient_depth", "book": f"{exchange}:{symbol}"}
+        amount = filled * (1 - fee)
+    net = amount - start_amount
+    return {
+        "start_amount": start_amount,
+        "end_amount": amount,
+        "net_profit": net,
+        "roi": net / start_amount if start_amount > 0 else 0.0,
+        "ok": 1 if net > 0 else 0,
+    }
+
+def _rotate(cycle: List[str]) -> Optional[List[str]]:
+    """Laat de cyclus beginnen bij een currency met budget (voorkeur: grootste budget)."""
+    starts = [i for i, n in enumerate(cycle) if n.split(":", 1)[1] in CYCLE_BUDGETS]
+    if not starts:
+        return None
+    i = max(starts, key=lambda i: (CYCLE_BUDGETS[cycle[i].split(":", 1)[1]], -i))
+    return cycle[i:] + cycle[:i]
+
+class CycleScanner:
+    """Houdt de graaf bij over alle gecachte boeken en levert diepte-gecheckte cycli."""
+
+    def __init__(self, max_legs: int = CYCLE_MAX_LEGS, min_edge_bps: float = CYCLE_MIN_EDGE_BPS,
+                 discover_ms: int = CYCLE_DISCOVER_MS):
+        self.graph = RateGraph()
+        self.books: Dict[Tuple[str, str], Book] = {}
+        self.max_legs = max_legs
+        self.min_edge = min_edge_bps / 10000.0
+        self.discover_ms = discover_ms
+        self._known: Dict[Tuple[str, str], None] = {}
+        self._last_discover = 0.0
+
+    async def _discover(self) -> List[Tuple[str, str]]:
+        """Alle bekende boeken; de SCAN over ``ob:*`` loopt hoogstens elke ``discover_ms``."""
+        now = time.monotonic()
+        if not self._known or (now - self._last_discover) * 1000 >= self.discover_ms:
+            self._last_discover = now
+            async for key in get_redis().scan_iter(match="ob:*", count=1000):
+                parts = (key.decode() if isinstance(key, bytes) else key).split(":", 2)
+                if len(parts) == 3 and "/" in parts[2]:
+                    self._known[(parts[1], parts[2])] = None
+        self._known.update(dict.fromkeys(registry.keys()))
+        return list(self._known)
+
+    def _apply(self, books: Dict[Tuple[str, str], Optional[Book]]) -> List[Tuple[str, str]]:
+        changed: List[Tuple[str, str]] = []
+        for (ex, sym), book in books.items():
+            if "/" not in sym:
+                continue
+            if not book or not book[0] or not book[1]:
+                # ontbrekend, leeg of stale: geen cycli meer op een oude prijs
+                if self.books.pop((ex, sym), None) is not None:
+                    self.graph.remove(ex, sym)
+                continue
+            self.books[(ex, sym)] = book
+            changed.extend(self.graph.update(ex, sym, book[0][0][0], book[1][0][0], _taker_fee(ex, sym)))
+        return changed
+
+    def _cycles(self, changed: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        seen = set()
+        out = []
+        for u, v in dict.fromkeys(changed):
+            for cycle in self.graph.cycles_through(u, v, self.max_legs, self.min_edge):
+                cycle = _rotate(cycle)
+                if cycle is None or tuple(cycle) in seen:
+                    continue
+                seen.add(tuple(cycle))
+                legs = self.graph.legs(cycle)
+                start_ccy = cycle[0].split(":", 1)[1]
+                depth = simulate_cycle(legs, self.books, CYCLE_BUDGETS[start_ccy])
+                out.append({
+                    "kind": "cycle",
+                    "ok": depth.get("ok", 0),
+                    "ts": int(time.time() * 1000),
+                    "start": cycle[0],
+                    "path": cycle + [cycle[0]],
+                    "legs": [{"side": k, "exchange": ex, "symbol": sym, "fee": fee} for k, ex, sym, fee in legs],
+                    "edge": math.exp(-sum(self.graph.adj[a][cycle[(i + 1) % len(cycle)]][0]
+                                          for i, a in enumerate(cycle))) - 1.0,
+                    "depth": depth,
+                })
+        out.sort(key=lambda x: x["depth"].get("roi", -1e18), reverse=True)
+        return out
+
+    async def refresh(self) -> List[Dict[str, Any]]:
+        """Volledige (her)opbouw uit alle bekende boeken; cycli door alle gewijzigde kanten."""
+        return self._cycles(self._apply(await get_cached_orderbooks(await self._discover())))
+
+    async def on_books(self, touched) -> List[Dict[str, Any]]:
+        """Incrementeel: alleen de kanten van de gewijzigde (exchange, symbol)-boeken."""
+        return self._cycles(self._apply(await get_cached_orderbooks(touched)))
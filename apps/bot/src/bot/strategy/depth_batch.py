@@ -0,0 +1,250 @@
+"""Gevectoriseerde variant van ``depth_sim.simulate_cross_fill`` voor veel paren tegelijk.
+
+De scalar functie blijft de referentie: elke rij hier volgt exact dezelfde stappen
+(zelfde volgorde van float-operaties, zelfde min-notional/min-base/step-takken),
+alleen lopen we per orderboek-niveau over alle paren tegelijk i.p.v. per paar.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Levels = Sequence[Tuple[float, float]]
+
+def pack_levels(books: Sequence[Levels], side: str = "asks", depth: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Zet lijsten [(price, size)] om naar (n_books, L) prijs/size-arrays.
+
+    Net als de referentie: levels met size <= 0 vallen weg en er wordt stabiel gesorteerd
+    (asks oplopend, bids aflopend). Lege plekken krijgen size 0 en gelden als einde van het boek.
+    """
+    lens = np.fromiter((len(levels) for levels in books), dtype=np.int64, count=len(books))
+    flat = np.array([lvl for levels in books for lvl in levels], dtype=np.float64).reshape(-1, 2)
+    row = np.repeat(np.arange(len(books)), lens)
+    keep = flat[:, 1] > 0
+    flat, row = flat[keep], row[keep]
+    key = flat[:, 0] if side == "asks" else -flat[:, 0]
+    order = np.lexsort((key, row))  # stabiel: per boek gesorteerd, gelijke prijzen in invoervolgorde
+    flat, row = flat[order], row[order]
+    counts = np.bincount(row, minlength=len(books))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    col = np.arange(len(row)) - starts[row]
+    if depth is not None:
+        keep = col < depth
+        flat, row, col = flat[keep], row[keep], col[keep]
+    width = int(col.max()) + 1 if len(col) else 0
+    px = np.zeros((len(books), width), dtype=np.float64)
+    sz = np.zeros((len(books), width), dtype=np.float64)
+    px[row, col] = flat[:, 0]
+    sz[row, col] = flat[:, 1]
+    return px, sz
+
+def _col(value: Any, n: int, none_value: float) -> np.ndarray:
+    """Scalar of per-paar lijst (None toegestaan) → float64-vector van lengte n."""
+    if value is None or np.isscalar(value):
+        return np.full(n, none_value if value is None else float(value), dtype=np.float64)
+    return np.array([none_value if v is None else float(v) for v in value], dtype=np.float64)
+
+def _floor_step(v: np.ndarray, step: np.ndarray, has_step: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(has_step, np.floor(v / step) * step, v)
+
+def _ceil_step(v: np.ndarray, step: np.ndarray, has_step: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(has_step, np.ceil(v / step) * step, v)
+
+def simulate_cross_fill_batch(
+    ask_px: np.ndarray, ask_sz: np.ndarray,  # (P, La) low->high, size 0 = geen level
+    bid_px: np.ndarray, bid_sz: np.ndarray,  # (P, Lb) high->low, size 0 = geen level
+    fee_buy: Any = 0.001,
+    fee_sell: Any = 0.001,
+    withdraw_fee_base: Any = 0.0,
+    max_quote_buy: Any = None,
+    max_base_sell: Any = None,
+    base_step: Any = None,
+    min_base: Any = None,
+    min_notional_buy: Any = None,
+    min_notional_sell: Any = None,
+) -> List[Dict[str, float]]:
+    """Batch-versie van ``simulate_cross_fill``: één dict per paar, identiek aan de referentie.
+
+    Alle parameters mogen scalar of per-paar (lengte P, None toegestaan) zijn.
+    """
+    P = ask_px.shape[0]
+    fb = _col(fee_buy, P, 0.001)
+    fs = _col(fee_sell, P, 0.001)
+    wf = _col(withdraw_fee_base, P, 0.0)
+    # None ≡ +inf voor de budgetten, None ≡ 0 voor de (falsy) filters — zelfde semantiek als de referentie
+    mq = _col(max_quote_buy, P, np.inf)
+    mbs = _col(max_base_sell, P, np.inf)
+    step = _col(base_step, P, 0.0)
+    mb = _col(min_base, P, 0.0)
+    mnb = _col(min_notional_buy, P, 0.0)
+    mns = _col(min_notional_sell, P, 0.0)
+    has_step = step > 0
+    has_mb = mb > 0
+
+    nonempty = (ask_sz > 0).any(axis=1) & (bid_sz > 0).any(axis=1)
+
+    spent = np.zeros(P)
+    acquired = np.zeros(P)
+    buy_fee = np.zeros(P)
+
+    # BUY across asks
+    active = nonempty.copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k in range(ask_px.shape[1]):
+            px, sz = ask_px[:, k], ask_sz[:, k]
+            active &= sz > 0  # einde van het boek
+            if not active.any():
+                break
+            max_aff = np.maximum(0.0, (mq - spent) / px)
+            take = _floor_step(np.minimum(sz, max_aff), step, has_step)
+            active &= take > 0
+            notional = take * px
+
+            cond = active & (mnb > 0) & (notional < mnb)
+            need = _ceil_step(np.maximum(mnb / px, mb), step, has_step)
+            fits = (need <= sz) & (spent + need * px <= mq)
+            take = np.where(cond & fits, need, take)
+            skip = cond & ~fits
+
+            cond = active & ~skip & has_mb & (take < mb)
+            tb = _ceil_step(np.minimum(np.minimum(sz, max_aff), mb), step, has_step)
+            fits = (tb <= sz) & (spent + tb * px <= mq)
+            take = np.where(cond & fits, tb, take)
+            skip |= cond & ~fits
+
+            add = active & ~skip
+            notional = take * px
+            spent = np.where(add, spent + notional, spent)
+            buy_fee = np.where(add, buy_fee + notional * fb, buy_fee)
+            acquired = np.where(add, acquired + take, acquired)
+            active &= ~(add & (spent >= mq - 1e-12))
+
+    acquired = np.minimum(acquired, mbs)
+    transferable = np.maximum(0.0, acquired - wf)
+
+    # SELL across bids
+    remaining = transferable.copy()
+    received = np.zeros(P)
+    sell_fee = np.zeros(P)
+    sold = np.zeros(P)
+
+    active = nonempty.copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k in range(bid_px.shape[1]):
+            px, sz = bid_px[:, k], bid_sz[:, k]
+            active &= (sz > 0) & (remaining > 0)
+            if not active.any():
+                break
+            take = np.minimum(sz, remaining)
+            notional = take * px
+
+            cond = active & (mns > 0) & (notional < mns)
+            need = _ceil_step(mns / px, step, has_step)
+            need = np.minimum(np.minimum(need, remaining), sz)
+            skip = cond & ((need <= 0) | (has_mb & (need < mb)))
+            take = np.where(cond & ~skip, need, take)
+
+            floored = _floor_step(take, step, has_step)
+            skip |= active & has_step & (floored <= 0)
+            take = floored
+
+            add = active & ~skip
+            notional = take * px
+            fee = notional * fs
+            received = np.where(add, received + (notional - fee), received)
+            sell_fee = np.where(add, sell_fee + fee, sell_fee)
+            remaining = np.where(add, remaining - take, remaining)
+            sold = np.where(add, sold + take, sold)
+
+    best_ask = (ask_px[:, 0] if ask_px.shape[1] else np.zeros(P)).tolist()
+    best_bid = (bid_px[:, 0] if bid_px.shape[1] else np.zeros(P)).tolist()
+    nonempty_l = nonempty.tolist()
+    acquired_l, sold_l, transferable_l = acquired.tolist(), sold.tolist(), transferable.tolist()
+    spent_l, received_l = spent.tolist(), received.tolist()
+    buy_fee_l, sell_fee_l, wf_l = buy_fee.tolist(), sell_fee.tolist(), wf.tolist()
+
+    out: List[Dict[str, float]] = []
+    for i in range(P):
+        if not nonempty_l[i]:
+            out.append({"qty_base_bought": 0.0, "qty_base_sold": 0.0, "net_profit_quote": 0.0, "ok": 0})
+            continue
+        acq, qs = acquired_l[i], sold_l[i]
+        sq, rq = spent_l[i], received_l[i]
+        bfq, sfq = buy_fee_l[i], sell_fee_l[i]
+        if acq <= 0 or qs <= 0:
+            out.append({
+                "qty_base_bought": acq,
+                "qty_base_sold": qs,
+                "avg_buy_px": best_ask[i],
+                "avg_sell_px": best_bid[i],
+                "spent_quote": sq,
+                "received_quote": rq,
+                "buy_fee_quote": bfq,
+                "sell_fee_quote": sfq,
+                "withdraw_fee_base": wf_l[i],
+                "net_profit_quote": rq - sq - bfq,
+                "ok": 0
+            })
+            continue
+        avg_buy_px = sq / acq
+        avg_sell_px = (rq + sfq) / qs
+        net_profit = rq - sq - bfq
+        roi = net_profit / sq if sq > 0 else 0.0
+        effective_spread = (avg_sell_px - avg_buy_px) / avg_buy_px if avg_buy_px > 0 else 0.0
+        out.append({
+            "qty_base_bought": acq,
+            "qty_base_after_withdraw": transferable_l[i],
+            "qty_base_sold": qs,
+            "spent_quote": sq,
+            "received_quote": rq,
+            "buy_fee_quote": bfq,
+            "sell_fee_quote": sfq,
+            "withdraw_fee_base": wf_l[i],
+            "avg_buy_px": avg_buy_px,
+            "avg_sell_px": avg_sell_px,
+            "effective_spread": effective_spread,
+            "net_profit_quote": net_profit,
+            "roi": roi,
+            "ok": 1 if net_profit > 0 else 0
+        })
+    return out
+
+def simulate_many(jobs: Sequence[Dict[str, Any]]) -> List[Dict[str, float]]:
+    """Gemak: ``jobs`` zijn kwargs-dicts zoals voor ``simulate_cross_fill`` (asks/bids als lijsten).
+
+    Boeken die door meerdere paren gedeeld worden (zelfde list-object) worden één keer verpakt.
+    """
+    if not jobs:
+        return []
+    ask_ids: Dict[int, int] = {}
+    bid_ids: Dict[int, int] = {}
+    ask_books: List[Levels] = []
+    bid_books: List[Levels] = []
+    ai, bi = [], []
+    for j in jobs:
+        for levels, ids, books, idx in ((j["asks"], ask_ids, ask_books, ai), (j["bids"], bid_ids, bid_books, bi)):
+            slot = ids.get(id(levels))
+            if slot is None:
+                slot = ids[id(levels)] = len(books)
+                books.append(levels)
+            idx.append(slot)
+    apx, asz = pack_levels(ask_books, "asks")
+    bpx, bsz = pack_levels(bid_books, "bids")
+    ai_arr, bi_arr = np.asarray(ai), np.asarray(bi)
+
+    def col(name, default=None):
+        return [j.get(name, default) for j in jobs]
+
+    return simulate_cross_fill_batch(
+        apx[ai_arr], asz[ai_arr], bpx[bi_arr], bsz[bi_arr],
+        fee_buy=col("fee_buy", 0.001),
+        fee_sell=col("fee_sell", 0.001),
+        withdraw_fee_base=col("withdraw_fee_base", 0.0),
+        max_quote_buy=col("max_quote_buy"),
+        max_base_sell=col("max_base_sell"),
+        base_step=col("base_step"),
+        min_base=col("min_base"),
+        min_notional_buy=col("min_notional_buy"),
+        min_notional_sell=col("min_notional_sell"),
+    )
@@ -1,5 +1,6 @@
+import bisect
 import math
-from typing import List, Tuple, Optional, Dict
+from typing import Any, List, Tuple, Optional, Dict
 
 def _floor_step(value: float, step: Optional[float]) -> float:
     if not step or step <= 0:
@@ -11,6 +12,13 @@ def _ceil_step(value: float, step: Optional[float]) -> float:
         return value
     return math.ceil(value / step) * step
 
+def _grid_floor(value: float, step: float) -> float:
+    # als _floor_step, maar een waarde die al op het raster ligt blijft staan (1.18 / 0.01 = 117.99999...)
+    return math.floor(value / step + 1e-9) * step
+
+def _grid_ceil(value: float, step: float) -> float:
+    return math.ceil(value / step - 1e-9) * step
+
 def simulate_cross_fill(
     asks: List[Tuple[float, float]],  # [(price, size_base)] low->high
     bids: List[Tuple[float, float]],  # [(price, size_base)] high->low
@@ -145,3 +153,178 @@ def simulate_cross_fill(
         "roi": float(roi),
         "ok": 1 if (qty_sold > 0 and net_profit > 0) else 0
     }
+
+def _ladder(levels: List[Tuple[float, float]]) -> Tuple[List[float], List[float], List[float]]:
+    """(prices, cumulatieve qty, cumulatieve notional); de cumulatieven beginnen bij 0."""
+    px, qcum, ncum = [], [0.0], [0.0]
+    for p, s in levels:
+        px.append(p)
+        qcum.append(qcum[-1] + s)
+        ncum.append(ncum[-1] + s * p)
+    return px, qcum, ncum
+
+def _notional_for_qty(lad, q: float) -> float:
+    px, qcum, ncum = lad
+    k = bisect.bisect_right(qcum, q) - 1
+    if k >= len(px):
+        return ncum[-1]
+    return ncum[k] + (q - qcum[k]) * px[k]
+
+def _qty_for_notional(lad, n: float) -> float:
+    px, qcum, ncum = lad
+    k = bisect.bisect_right(ncum, n) - 1
+    if k >= len(px):
+        return qcum[-1]
+    return qcum[k] + (n - ncum[k]) / px[k]
+
+def solve_optimal_size(
+    asks: List[Tuple[float, float]],  # [(price, size_base)] low->high
+    bids: List[Tuple[float, float]],  # [(price, size_base)] high->low
+    fee_buy: float = 0.001,
+    fee_sell: float = 0.001,
+    withdraw_fee_base: float = 0.0,
+    max_quote_buy: Optional[float] = None,
+    base_step: Optional[float] = None,
+    min_base: Optional[float] = None,
+    min_notional_buy: Optional[float] = None,
+    min_notional_sell: Optional[float] = None
+) -> Dict[str, Any]:
+    """Netto winst als functie van de gekochte hoeveelheid, in één pass over beide ladders.
+
+    Kopen en verkopen zijn stuksgewijs lineair in qty; knikken liggen op de cumulatieve
+    ask-sizes en op (cumulatieve bid-sizes + withdraw fee). ``curve`` bevat precies die
+    knikpunten, dus lineaire interpolatie ertussen is exact (zie ``curve_at_budget``).
+    ``best`` is het winstmaximum op het ``base_step``-raster binnen min_base/min-notional. Het mag
+    voorbij ``max_qty_base`` kopen als het raster of min_base dat vraagt, nooit voorbij asks of budget.
+    """
+    asks = sorted([(float(p), float(s)) for p, s in asks if s > 0], key=lambda x: x[0])
+    bids = sorted([(float(p), float(s)) for p, s in bids if s > 0], key=lambda x: x[0], reverse=True)
+    if not asks or not bids:
+        return {"ok": 0, "best": None, "curve": [], "min_qty_base": None, "max_qty_base": 0.0, "base_step": base_step}
+    a_lad, b_lad = _ladder(asks), _ladder(bids)
+    w = withdraw_fee_base or 0.0
+
+    def point(q: float, step: Optional[float] = None) -> Dict[str, float]:
+        sold = max(0.0, min(q - w, b_lad[1][-1]))
+        if step:
+            sold = min(_grid_floor(sold, step), q - w)
+        spent = _notional_for_qty(a_lad, q)
+        gross = _notional_for_qty(b_lad, sold)
+        buy_fee, sell_fee = spent * fee_buy, gross * fee_sell
+        net = gross - sell_fee - spent - buy_fee
+        return {
+            "qty_base": q,
+            "qty_base_sold": sold,
+            "spent_quote": spent,
+            "buy_fee_quote": buy_fee,
+            "received_quote": gross - sell_fee,
+            "sell_fee_quote": sell_fee,
+            "net_profit_quote": net,
+            "roi": net / spent if spent > 0 else 0.0,
+        }
+
+    # harde grens: asks en budget; meer kopen dan de bids (plus withdraw fee) kunnen opnemen levert
+    # niets meer op, dus de curve stopt bij q_max
+    q_cap = a_lad[1][-1]
+    if max_quote_buy is not None:
+        q_cap = min(q_cap, _qty_for_notional(a_lad, max_quote_buy))
+    q_max = min(q_cap, b_lad[1][-1] + w)
+
+    # merge van beide ladders: alle knikpunten t/m q_max
+    knots, i, j = [0.0], 1, 1
+    while True:
+        qa = a_lad[1][i] if i < len(a_lad[1]) else float("inf")
+        qb = b_lad[1][j] + w if j < len(b_lad[1]) else float("inf")
+        q = min(qa, qb)
+        if q >= q_max:
+            break
+        if q > knots[-1]:
+            knots.append(q)
+        if qa <= qb:
+            i += 1
+        else:
+            j += 1
+    if w > 0 and 0.0 < w < q_max and w not in knots:
+        knots.append(w)
+        knots.sort()
+    if q_max > knots[-1]:
+        knots.append(q_max)
+    curve = [point(q) for q in knots]
+
+    # ondergrens uit min_base en min-notional (kopen én verkopen)
+    q_min = max(
+        min_base or 0.0,
+        _qty_for_notional(a_lad, min_notional_buy) if min_notional_buy else 0.0,
+        (_qty_for_notional(b_lad, min_notional_sell) + w) if min_notional_sell else 0.0,
+    )
+    q_min = _grid_ceil(q_min, base_step) if base_step else q_min
+
+    # winstmaximum ligt op een knikpunt; op het step-raster op de buur eronder of erboven.
+    # n * step kan één ulp naast het knikpunt uitkomen (4.475 → 4.4750000000000005): begrenzen op
+    # q_max, anders valt het echte maximum weg
+    candidates = {q_min}
+    for q in knots:
+        if base_step:
+            candidates.add(min(_grid_floor(q, base_step), q_max))
+            candidates.add(_grid_ceil(q, base_step))
+        else:
+            candidates.add(q)
+    if base_step:
+        # kleinste verkoop (verlies beperken) en de hele bid-kant op het raster, ook als dat een
+        # stap boven q_max kopen vraagt
+        candidates.add(_grid_ceil(w + base_step, base_step))
+        candidates.add(_grid_ceil(w + _grid_floor(b_lad[1][-1], base_step), base_step))
+    best = None
+    for q in sorted(candidates):
+        if q <= 0 or q < q_min or q > q_cap:
+            continue
+        p = point(q, base_step)
+        if p["qty_base_sold"] <= 0:
+            continue
+        if min_notional_sell and p["received_quote"] + p["sell_fee_quote"] < min_notional_sell:
+            continue
+        if best is None or p["net_profit_quote"] > best["net_profit_quote"]:
+            best = p
+    if best is not None:
+        best["avg_buy_px"] = best["spent_quote"] / best["qty_base"]
+        best["avg_sell_px"] = (best["received_quote"] + best["sell_fee_quote"]) / best["qty_base_sold"]
+
+    return {
+        "ok": 1 if (best and best["net_profit_quote"] > 0) else 0,
+        "best": best,
+        "curve": curve,
+        "min_qty_base": q_min if q_min <= q_cap else None,
+        "max_qty_base": q_max,
+        "base_step": base_step,
+    }
+
+def curve_at_budget(curve: List[Dict[str, float]], budget_quote: float,
+                    base_step: Optional[float] = None,
+                    min_qty_base: Optional[float] = None) -> Optional[Dict[str, float]]:
+    """Lees een budget af van een ``solve_optimal_size``-curve zonder opnieuw te simuleren.
+
+    Alleen waar interpolatie gelijk is aan ``simulate_cross_fill``; anders None, en dan moet de
+    aanroeper exact simuleren: buiten het bemonsterde bereik (budget voorbij het laatste punt, waar de
+    simulatie verder koopt dan de bids opnemen), onder ``min_qty_base``, en met ``base_step`` (de
+    simulatie rondt per prijsniveau af, de curve alleen het totaal).
+    """
+    if not curve or base_step:
+        return None
+    keys = ("qty_base", "qty_base_sold", "spent_quote", "buy_fee_quote",
+            "received_quote", "sell_fee_quote", "net_profit_quote")
+    if budget_quote < 0 or budget_quote > curve[-1]["spent_quote"] + 1e-9:
+        return None
+    p = None
+    for lo, hi in zip(curve, curve[1:]):
+        if lo["spent_quote"] <= budget_quote <= hi["spent_quote"]:
+            span = hi["spent_quote"] - lo["spent_quote"]
+            t = (budget_quote - lo["spent_quote"]) / span if span > 0 else 0.0
+            p = {k: lo[k] + t * (hi[k] - lo[k]) for k in keys}
+            break
+    if p is None:
+        p = {k: curve[-1][k] for k in keys}  # één punt, of afrondingsrest boven het laatste
+    if min_qty_base and p["qty_base"] < min_qty_base:
+        return None
+    p["budget_quote"] = budget_quote
+    p["roi"] = p["net_profit_quote"] / p["spent_quote"] if p["spent_quote"] > 0 else 0.0
+    return p
@@ -1,25 +1,169 @@
 import os, asyncio, time
-from typing import List
-from ..strategy.arbitrage_engine import run_strategy_once
+from typing import Dict, List, Tuple
+import orjson
+from ..services.book_registry import registry
+from ..services.redis_pool import get_redis
+from ..services.sharding import CYCLES_KEY, run_sharded
+from ..strategy.arbitrage_engine import run_strategy_once, run_strategy_for_books, publish_opportunities
+from ..strategy.cycles import CycleScanner
 
 def _env_list(key: str, default: str) -> List[str]:
     return [x.strip() for x in os.getenv(key, default).split(",") if x.strip()]
 
+OB_EVENTS_CHANNEL = os.getenv("OB_EVENTS_CHANNEL", "ob_events")
 PRINT_TOPN = int(os.getenv("PRINT_TOPN", "3"))
+# event: herbereken per boek-update (polling blijft fallback bij stilte) | poll: vaste interval-scan
+STRAT_MODE = os.getenv("STRAT_MODE", "event").lower()
+# auto: in-process registry als de stream in dit proces draait, anders Redis pub/sub | local | redis
+STRAT_EVENT_SOURCE = os.getenv("STRAT_EVENT_SOURCE", "auto").lower()
+# 1: ook multi-leg cycli (driehoeks-arbitrage) over alle gecachte boeken zoeken
+STRAT_CYCLES = os.getenv("STRAT_CYCLES", "0").lower() in ("1", "true", "yes")
 
-async def run():
-    exchanges = _env_list("STRAT_EXCHANGES", os.getenv("STREAM_EXCHANGES", "bitvavo,coinbase,kraken"))
-    symbols = _env_list("STRAT_SYMBOLS", os.getenv("STREAM_SYMBOLS", "BTC/EUR,ETH/EUR"))
-    budget_quote = float(os.getenv("STRAT_BUDGET_QUOTE", "250"))
-    withdraw_fee_base = float(os.getenv("STRAT_WITHDRAW_FEE_BASE", "0"))
-    min_net_quote = float(os.getenv("STRAT_MIN_NET_QUOTE", "0"))
-    min_roi_pct = float(os.getenv("STRAT_MIN_ROI_PCT", "0"))
-    interval_ms = int(float(os.getenv("STRAT_INTERVAL_MS", "1500")))
-    topn = int(os.getenv("STRAT_TOPN", "5"))
+def _print_blocks(res):
+    for block in (res.get("blocks") or []):
+        sym = block["symbol"]
 
-    print(f"[strategy] start — ex={exchanges} symbols={symbols} budget={budget_quote} "
-          f"minNet={min_net_quote} minRoiPct={min_roi_pct} intervalMs={interval_ms} topN={topn}, PRINT_TOPN={PRINT_TOPN}")
+        # Beste na filters
+        best = block.get("best")
+        if best:
+            d = best.get("depth", {}) or {}
+            print(f"[strategy] BEST {sym}: {best['buy']}→{best['sell']} "
+                  f"net={d.get('net_profit_quote',0):.2f} roi={(d.get('roi',0)*100):.2f}% "
+                  f"ask={best.get('best_ask')} bid={best.get('best_bid')}")
+
+        # TopN ongefilterd (toon ook foutmeldingen)
+        debug_top = block.get("debug_top") or []
+        if debug_top:
+            lines = []
+            for i, p in enumerate(debug_top[:PRINT_TOPN], 1):
+                d = p.get("depth", {}) or {}
+                net = float(d.get("net_profit_quote") or 0.0)
+                roi = float(d.get("roi") or 0.0) * 100.0
+                gross_bps = float(p.get("gross_spread") or 0.0) * 10000.0
+                tag = "OK" if p.get("ok") else ("ERR" if p.get("error") else "NO")
+                line = f"{i}. {p['buy']}→{p['sell']} [{tag}] gross={gross_bps:.1f}bps net={net:.2f} roi={roi:.2f}%"
+                err_type = p.get("error_type")
+                err_msg  = p.get("error")
+                if err_type or err_msg:
+                    line += f" (err={err_type or 'Error'}: {err_msg})"
+                lines.append(line)
+            print(f"[strategy] TOP{min(PRINT_TOPN,len(debug_top))} {sym}: " + " | ".join(lines))
+        else:
+            print(f"[strategy] no pairs computed for {sym}")
+
+async def _run_cycles(scanner, touched, topn):
+    """Cycli zoeken (``touched`` None = volledige herbouw) en diepte-gecheckte kansen publiceren."""
+    if scanner is None:
+        return
+    try:
+        items = await (scanner.refresh() if touched is None else scanner.on_books(touched))
+        hits = [x for x in items if x.get("ok")]
+        if hits:
+            await publish_opportunities(hits, topn=topn)
+            best = hits[0]
+            print(f"[strategy] CYCLE {' → '.join(best['path'])} "
+                  f"net={best['depth']['net_profit']:.4f} roi={best['depth']['roi']*100:.3f}%")
+    except Exception as e:
+        print("[strategy] cycle scan error:", e)
+
+class _LocalEvents:
+    """Boek-events uit de in-process registry (stream-worker draait in dit proces)."""
+    name = "local"
+
+    def __init__(self):
+        self.q = registry.subscribe()
+
+    async def get(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self.q.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def drain(self):
+        out = []
+        while not self.q.empty():
+            out.append(self.q.get_nowait())
+        return out
+
+    async def close(self):
+        registry.unsubscribe(self.q)
+
+class _RedisEvents:
+    """Boek-events via Redis pub/sub (stream-worker in een ander proces)."""
+    name = "redis"
+
+    def __init__(self):
+        self.pub = get_redis().pubsub(ignore_subscribe_messages=True)
+
+    async def open(self):
+        await self.pub.subscribe(OB_EVENTS_CHANNEL)
+
+    @staticmethod
+    def _parse(msg):
+        if not msg or msg.get("type") != "message":
+            return None
+        try:
+            ev = orjson.loads(msg.get("data"))
+            return ev.get("exchange"), ev.get("symbol"), int(ev.get("version") or 0)
+        except Exception:
+            return None
+
+    async def get(self, timeout: float):
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            ev = self._parse(await self.pub.get_message(ignore_subscribe_messages=True, timeout=remaining))
+            if ev:
+                return ev
+
+    async def drain(self):
+        out = []
+        while True:
+            msg = await self.pub.get_message(ignore_subscribe_messages=True, timeout=0)
+            if msg is None:
+                return out
+            ev = self._parse(msg)
+            if ev:
+                out.append(ev)
+
+    async def close(self):
+        try:
+            await self.pub.unsubscribe(OB_EVENTS_CHANNEL)
+        except Exception:
+            pass
+        await self.pub.close()
 
+async def _open_events():
+    if STRAT_EVENT_SOURCE == "local" or (STRAT_EVENT_SOURCE == "auto" and registry.has_writer):
+        return _LocalEvents()
+    src = _RedisEvents()
+    try:
+        await src.open()
+    except Exception:
+        await src.close()
+        raise
+    return src
+
+def _coalesce(events, symbols, exchanges, seen: Dict[Tuple[str, str], int]):
+    """Per boek alleen de nieuwste versie; al verwerkte versies vallen weg."""
+    latest: Dict[Tuple[str, str], int] = {}
+    for ex, sym, version in events:
+        if ex not in exchanges or sym not in symbols:
+            continue
+        latest[(ex, sym)] = max(version, latest.get((ex, sym), 0))
+    touched = []
+    for book, version in latest.items():
+        # zelfde versie = al verwerkt; een lagere versie betekent een herstarte stream
+        if version != seen.get(book):
+            seen[book] = version
+            touched.append(book)
+    return touched
+
+async def _run_polling(symbols, exchanges, budget_quote, withdraw_fee_base,
+                       min_net_quote, min_roi_pct, interval_ms, topn, cycles=STRAT_CYCLES):
+    scanner = CycleScanner() if cycles else None
     while True:
         t0 = time.time()
         try:
@@ -27,40 +171,90 @@ async def run():
                 symbols, exchanges, budget_quote, withdraw_fee_base,
                 min_net_quote, min_roi_pct, topn
             )
-
-            for block in (res.get("blocks") or []):
-                sym = block["symbol"]
-
-                # Beste na filters
-                best = block.get("best")
-                if best:
-                    d = best.get("depth", {}) or {}
-                    print(f"[strategy] BEST {sym}: {best['buy']}→{best['sell']} "
-                          f"net={d.get('net_profit_quote',0):.2f} roi={(d.get('roi',0)*100):.2f}% "
-                          f"ask={best.get('best_ask')} bid={best.get('best_bid')}")
-
-                # TopN ongefilterd (toon ook foutmeldingen)
-                debug_top = block.get("debug_top") or []
-                if debug_top:
-                    lines = []
-                    for i, p in enumerate(debug_top[:PRINT_TOPN], 1):
-                        d = p.get("depth", {}) or {}
-                        net = float(d.get("net_profit_quote") or 0.0)
-                        roi = float(d.get("roi") or 0.0) * 100.0
-                        gross_bps = float(p.get("gross_spread") or 0.0) * 10000.0
-                        tag = "OK" if p.get("ok") else ("ERR" if p.get("error") else "NO")
-                        line = f"{i}. {p['buy']}→{p['sell']} [{tag}] gross={gross_bps:.1f}bps net={net:.2f} roi={roi:.2f}%"
-                        err_type = p.get("error_type")
-                        err_msg  = p.get("error")
-                        if err_type or err_msg:
-                            line += f" (err={err_type or 'Error'}: {err_msg})"
-                        lines.append(line)
-                    print(f"[strategy] TOP{min(PRINT_TOPN,len(debug_top))} {sym}: " + " | ".join(lines))
-                else:
-                    print(f"[strategy] no pairs computed for {sym}")
-
+            _print_blocks(res)
         except Exception as e:
             print("[strategy] error:", e)
+        await _run_cycles(scanner, None, topn)
 
         dt_ms = int((time.time() - t0) * 1000)
         await asyncio.sleep(max(0, (interval_ms - dt_ms) / 1000))
+
+async def _run_event_driven(symbols, exchanges, budget_quote, withdraw_fee_base,
+                            min_net_quote, min_roi_pct, interval_ms, topn, cycles=STRAT_CYCLES):
+    """Herbereken alleen de paren van gewijzigde boeken; na ``interval_ms`` stilte volgt een volledige scan."""
+    # ook onder constante events af en toe alles herberekenen (stale boeken, nieuwe paren)
+    full_scan_ms = int(float(os.getenv("STRAT_FULL_SCAN_MS", str(interval_ms * 10))))
+    pair_cache: Dict[str, Dict[tuple, dict]] = {}
+    scanner = CycleScanner() if cycles else None
+    seen: Dict[Tuple[str, str], int] = {}
+    last_full = 0.0
+    last_print = 0.0
+    while True:
+        events = None
+        try:
+            events = await _open_events()
+            print(f"[strategy] event-driven via {events.name} events (fallback scan every {interval_ms}ms)")
+            while True:
+                ev = await events.get(interval_ms / 1000)
+                now = time.time()
+                try:
+                    if ev is None or (now - last_full) * 1000 >= full_scan_ms:
+                        # fallback: geen events (of full-scan interval verstreken) → volledige scan, cache opnieuw gevuld
+                        await events.drain()
+                        res = await run_strategy_once(
+                            symbols, exchanges, budget_quote, withdraw_fee_base,
+                            min_net_quote, min_roi_pct, topn, pair_cache=pair_cache
+                        )
+                        await _run_cycles(scanner, None, topn)
+                        last_full = now
+                    else:
+                        touched = _coalesce([ev] + await events.drain(), symbols, exchanges, seen)
+                        if not touched:
+                            continue
+                        res = await run_strategy_for_books(
+                            touched, pair_cache, exchanges, budget_quote, withdraw_fee_base,
+                            min_net_quote, min_roi_pct, topn
+                        )
+                        await _run_cycles(scanner, touched, topn)
+                    if (now - last_print) * 1000 >= interval_ms:
+                        _print_blocks(res)
+                        last_print = now
+                except Exception as e:
+                    print("[strategy] error:", e)
+        except Exception as e:
+            print("[strategy] event source error, polling until reconnect:", e)
+        finally:
+            if events is not None:
+                await events.close()
+        # back-off: één polling-ronde terwijl Redis pub/sub herstelt
+        try:
+            _print_blocks(await run_strategy_once(
+                symbols, exchanges, budget_quote, withdraw_fee_base,
+                min_net_quote, min_roi_pct, topn, pair_cache=pair_cache
+            ))
+        except Exception as e:
+            print("[strategy] error:", e)
+        await asyncio.sleep(interval_ms / 1000)
+
+async def run():
+    exchanges = _env_list("STRAT_EXCHANGES", os.getenv("STREAM_EXCHANGES", "bitvavo,coinbase,kraken"))
+    symbols = _env_list("STRAT_SYMBOLS", os.getenv("STREAM_SYMBOLS", "BTC/EUR,ETH/EUR"))
+    budget_quote = float(os.getenv("STRAT_BUDGET_QUOTE", "250"))
+    withdraw_fee_base = float(os.getenv("STRAT_WITHDRAW_FEE_BASE", "0"))
+    min_net_quote = float(os.getenv("STRAT_MIN_NET_QUOTE", "0"))
+    min_roi_pct = float(os.getenv("STRAT_MIN_ROI_PCT", "0"))
+    interval_ms = int(float(os.getenv("STRAT_INTERVAL_MS", "1500")))
+    topn = int(os.getenv("STRAT_TOPN", "5"))
+
+    print(f"[strategy] start — mode={STRAT_MODE} ex={exchanges} symbols={symbols} budget={budget_quote} "
+          f"minNet={min_net_quote} minRoiPct={min_roi_pct} intervalMs={interval_ms} topN={topn}, PRINT_TOPN={PRINT_TOPN}")
+
+    loop = _run_event_driven if STRAT_MODE == "event" else _run_polling
+
+    async def start(keys):
+        # met SHARD_ENABLED: alleen eigen symbolen; cycli (over alle boeken) op één replica
+        syms = [k for k in keys if k != CYCLES_KEY]
+        await loop(syms, exchanges, budget_quote, withdraw_fee_base, min_net_quote, min_roi_pct,
+                   interval_ms, topn, cycles=CYCLES_KEY in keys)
+
+    await run_sharded(symbols + ([CYCLES_KEY] if STRAT_CYCLES else []), start, "strategy")
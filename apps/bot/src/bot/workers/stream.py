@@ -2,17 +2,32 @@ import asyncio
 import os
 import time
 import importlib.util
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 import orjson
-from redis.asyncio import from_url as redis_from_url
-from ..services.markets import get_exchange
+from ..services.async_rest import ensure_markets
+from ..services.book_codec import encode_book
+from ..services.book_deltas import DeltaEncoder, stream_key
+from ..services.book_recorder import BookRecorder, recorder_from_env
+from ..services.book_registry import registry, BookSnapshot
+from ..services.markets import fetch_ccxt_orderbook_async, get_exchange
+from ..services.metrics import BOOK_BYTES, BOOK_UPDATES, EXCHANGE_TO_PUBLISH, observe_age
+from ..services.redis_pool import get_redis
+from ..services.sharding import run_sharded
 from ..services.symbols import resolve_symbol_for_exchange
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 STREAM_EXCHANGES = [x.strip().lower() for x in os.getenv("STREAM_EXCHANGES", "bitvavo,coinbase,kraken").split(",") if x.strip()]
 STREAM_SYMBOLS = [x.strip() for x in os.getenv("STREAM_SYMBOLS", "BTC/EUR,ETH/EUR").split(",") if x.strip()]
 ORDERBOOK_DEPTH = int(float(os.getenv("ORDERBOOK_DEPTH", "50")))
 REST_POLL_SEC = float(os.getenv("REST_POLL_SEC", "2.0"))
+# Kanaal waarop elke boek-update een change-notificatie krijgt (event-driven strategy)
+OB_EVENTS_CHANNEL = os.getenv("OB_EVENTS_CHANNEL", "ob_events")
+# bin: compacte binaire snapshot (book_codec) | json: oud formaat; lezers accepteren beide
+ORDERBOOK_FORMAT = os.getenv("ORDERBOOK_FORMAT", "bin").lower()
+# 1: diffs per boek naar obd:{ex}:{sym} (Redis Stream) i.p.v. elke update een volledige SET
+ORDERBOOK_DELTAS = os.getenv("ORDERBOOK_DELTAS", "0").lower() in ("1", "true", "yes")
+ORDERBOOK_SNAPSHOT_EVERY = int(os.getenv("ORDERBOOK_SNAPSHOT_EVERY", "50"))
+ORDERBOOK_SNAPSHOT_MS = int(float(os.getenv("ORDERBOOK_SNAPSHOT_MS", "1000")))
+ORDERBOOK_DELTA_MAXLEN = int(os.getenv("ORDERBOOK_DELTA_MAXLEN", "500"))
 
 def _sanitize_levels(levels):
     out = []
@@ -34,48 +49,178 @@ def _sanitize_levels(levels):
 def _key(exchange: str, symbol: str) -> str:
     return f"ob:{exchange}:{symbol}"
 
+def _encode_data(snap: BookSnapshot) -> bytes:
+    if ORDERBOOK_FORMAT == "json":
+        return orjson.dumps({
+            "exchange": snap.exchange,
+            "symbol": snap.symbol,
+            "ts": snap.ts,
+            "version": snap.version,
+            "asks": snap.asks,
+            "bids": snap.bids,
+        })
+    return encode_book(snap.asks, snap.bids, snap.ts, snap.version)
+
+def _encode_event(snap: BookSnapshot) -> bytes:
+    return orjson.dumps({"exchange": snap.exchange, "symbol": snap.symbol, "version": snap.version, "ts": snap.ts})
+
+class _RedisBookWriter:
+    """Schrijft boeken asynchroon naar Redis voor de API en andere processen.
+
+    Per key telt alleen de laatste versie: bij een burst wordt één keer geserialiseerd en
+    gaat alles in één pipeline, zonder dat de stream op Redis hoeft te wachten.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._pending: Dict[str, BookSnapshot] = {}
+        self._wake = asyncio.Event()
+
+    def submit(self, snap: BookSnapshot) -> None:
+        self._pending[_key(snap.exchange, snap.symbol)] = snap
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            batch, self._pending = self._pending, {}
+            try:
+                await _write_books(self.redis, batch)
+            except Exception as e:
+                print("[stream] redis write error:", e)
+                await asyncio.sleep(0.5)
+
+async def _write_books(redis, books: Dict[str, BookSnapshot]):
+    # SET + change-notificatie in één round-trip; TTL kort, zodat API staleness kan herkennen
+    pipe = redis.pipeline(transaction=False)
+    for key, snap in books.items():
+        if _deltas is not None:
+            # delta-modus: XADD van alleen gewijzigde levels; ob:* alleen bij een snapshot
+            is_snap, fields = _deltas.encode(key, snap.asks, snap.bids, snap.ts, snap.version)
+            pipe.xadd(stream_key(snap.exchange, snap.symbol), fields,
+                      maxlen=ORDERBOOK_DELTA_MAXLEN, approximate=True)
+            BOOK_BYTES.labels(snap.exchange, "delta").inc(len(fields["b"]))
+            if is_snap:
+                pipe.set(key, fields["b"], ex=10)
+                BOOK_BYTES.labels(snap.exchange, "snapshot").inc(len(fields["b"]))
+        else:
+            data = _encode_data(snap)
+            pipe.set(key, data, ex=10)
+            BOOK_BYTES.labels(snap.exchange, "snapshot").inc(len(data))
+        pipe.publish(OB_EVENTS_CHANNEL, _encode_event(snap))
+    try:
+        await pipe.execute()
+    except Exception:
+        if _deltas is not None:
+            _deltas.reset()  # onbekend wat er is aangekomen → volgende write is een snapshot
+        raise
+
+_writer: _RedisBookWriter | None = None
+_recorder: BookRecorder | None = None
+_deltas = DeltaEncoder(ORDERBOOK_SNAPSHOT_EVERY, ORDERBOOK_SNAPSHOT_MS) if ORDERBOOK_DELTAS else None
+
 async def publish_orderbook(redis, exchange: str, symbol: str, asks: List[Tuple[float,float]], bids: List[Tuple[float,float]], ts_ms: int | None):
-    payload = {
-        "exchange": exchange,
-        "symbol": symbol,
-        "ts": int(ts_ms or time.time()*1000),
-        "asks": asks[:ORDERBOOK_DEPTH],
-        "bids": bids[:ORDERBOOK_DEPTH],
-    }
-    data = orjson.dumps(payload)
-    # TTL kort, zodat API staleness kan herkennen
-    await redis.set(_key(exchange, symbol), data, ex=10)
-
-async def stream_with_ccxtpro(r, exchange: str, symbol: str):
-    import importlib.util, time
+    """Boek direct in de in-process registry (strategy leest zonder kopie); Redis volgt asynchroon.
+
+    Neemt de lijsten over: ze worden in-place gesorteerd en mogen daarna niet meer muteren.
+    """
+    asks.sort(key=lambda x: x[0])
+    bids.sort(key=lambda x: x[0], reverse=True)
+    observe_age(EXCHANGE_TO_PUBLISH, ts_ms, exchange, symbol)  # alleen met exchange-timestamp
+    BOOK_UPDATES.labels(exchange, symbol).inc()
+    ts = int(ts_ms or time.time()*1000)
+    if len(asks) > ORDERBOOK_DEPTH:
+        asks = asks[:ORDERBOOK_DEPTH]
+    if len(bids) > ORDERBOOK_DEPTH:
+        bids = bids[:ORDERBOOK_DEPTH]
+    snap = registry.put(exchange, symbol, asks, bids, ts)
+    if _recorder is not None:
+        _recorder.record(exchange, symbol, asks, bids, ts, snap.version)  # RECORD_DIR: opname voor replay
+    if _writer is not None:
+        _writer.submit(snap)
+    else:
+        await _write_books(redis, {_key(exchange, symbol): snap})
+
+async def _publish_ccxt(r, exchange: str, symbol: str, ob):
+    asks = _sanitize_levels(ob.get("asks"))
+    bids = _sanitize_levels(ob.get("bids"))
+    await publish_orderbook(r, exchange, symbol, asks, bids, ob.get("timestamp"))
+
+async def _resolve_symbols(exchange: str, symbols: List[str]) -> Dict[str, str]:
+    """native → canoniek voor alle symbolen die de exchange kent (BTC/EUR → XBT/EUR op Kraken)."""
+    sync_ex = get_exchange(exchange)
+    await ensure_markets(exchange, sync_ex)
+    native: Dict[str, str] = {}
+    for sym in symbols:
+        try:
+            native[resolve_symbol_for_exchange(sync_ex, sym)] = sym
+        except ValueError as e:
+            print(f"[stream] {exchange}: skip {sym}: {e}")
+    return native
+
+async def stream_with_ccxtpro(r, exchange: str, symbols: List[str]):
+    """Eén ccxt.pro-client per exchange voor alle symbolen; bij een fout reconnect + resubscribe als geheel."""
     spec = importlib.util.find_spec("ccxt.pro")
     if spec is None:
         return False  # ccxt.pro niet geïnstalleerd → REST fallback
     import ccxt.pro as ccxtpro
 
     ex = getattr(ccxtpro, exchange)({"enableRateLimit": True, "timeout": 20000})
+    backoff = 1.0
     try:
-        real_sym = resolve_symbol_for_exchange(ex, symbol)  # bv. BTC/EUR → XBT/EUR op Kraken
         while True:
-            ob = await ex.watch_order_book(real_sym, limit=ORDERBOOK_DEPTH)
-            asks = _sanitize_levels(ob.get("asks"))
-            bids = _sanitize_levels(ob.get("bids"))
-            ts = ob.get("timestamp") or int(time.time() * 1000)
-            await publish_orderbook(r, exchange, symbol, asks, bids, ts)
+            try:
+                native = await _resolve_symbols(exchange, symbols)
+                if not native:
+                    return True
+                if not ex.markets:
+                    sync_ex = get_exchange(exchange)
+                    ex.set_markets(sync_ex.markets, sync_ex.currencies)  # geen tweede load_markets
+                if ex.has.get("watchOrderBookForSymbols"):
+                    # één subscription voor alle symbolen; elke update is het boek van één symbool
+                    while True:
+                        ob = await ex.watch_order_book_for_symbols(list(native), limit=ORDERBOOK_DEPTH)
+                        sym = native.get(ob.get("symbol"))
+                        if sym is not None:
+                            await _publish_ccxt(r, exchange, sym, ob)
+                        backoff = 1.0
+                else:
+                    async def watch(real_sym, sym):
+                        nonlocal backoff
+                        while True:
+                            await _publish_ccxt(r, exchange, sym, await ex.watch_order_book(real_sym, limit=ORDERBOOK_DEPTH))
+                            backoff = 1.0
+                    # zelfde client (en websocket) voor alle symbolen; één fout → alles opnieuw, en de
+                    # andere watchers gaan eerst dicht (anders stapelen ze zich op per reconnect)
+                    watchers = [asyncio.create_task(watch(real_sym, sym)) for real_sym, sym in native.items()]
+                    try:
+                        await asyncio.gather(*watchers)
+                    finally:
+                        for t in watchers:
+                            t.cancel()
+                        await asyncio.gather(*watchers, return_exceptions=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[stream] {exchange} ws error, reconnect in {backoff:.0f}s:", e)
+                try:
+                    await ex.close()
+                except Exception:
+                    pass
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
     finally:
         try:
             await ex.close()
         except Exception:
             pass
-    return True
 
 async def poll_with_ccxt(r, exchange: str, symbol: str):
-    import ccxt, time, asyncio
-    ex = getattr(ccxt, exchange)({"enableRateLimit": True, "timeout": 15000})
-    real_sym = resolve_symbol_for_exchange(ex, symbol)
+    # via de async REST-laag: een trage exchange houdt de loop (en de andere workers) niet op
     while True:
         try:
-            ob = ex.fetch_order_book(real_sym, limit=ORDERBOOK_DEPTH)
+            ob = await fetch_ccxt_orderbook_async(exchange, symbol, limit=ORDERBOOK_DEPTH)
             asks = _sanitize_levels(ob.get("asks"))
             bids = _sanitize_levels(ob.get("bids"))
             ts = ob.get("timestamp") or int(time.time() * 1000)
@@ -84,18 +229,32 @@ async def poll_with_ccxt(r, exchange: str, symbol: str):
             await asyncio.sleep(REST_POLL_SEC * 2)
         await asyncio.sleep(REST_POLL_SEC)
 
-async def run_pair(r, exchange: str, symbol: str):
-    if not await stream_with_ccxtpro(r, exchange, symbol):
-        await poll_with_ccxt(r, exchange, symbol)
+async def run_exchange(r, exchange: str, symbols: List[str]):
+    if not await stream_with_ccxtpro(r, exchange, symbols):
+        await asyncio.gather(*(poll_with_ccxt(r, exchange, sym) for sym in symbols))
+
+async def _run_exchanges(r, symbols: List[str]):
+    await asyncio.gather(*(run_exchange(r, ex, symbols) for ex in STREAM_EXCHANGES))
 
 async def run():
-    redis = redis_from_url(REDIS_URL, decode_responses=False)
-    tasks = []
-    for ex in STREAM_EXCHANGES:
-        for sym in STREAM_SYMBOLS:
-            tasks.append(asyncio.create_task(run_pair(redis, ex, sym)))
+    global _writer, _recorder
+    redis = get_redis()
+    _recorder = recorder_from_env()
+    registry.has_writer = True
+    _writer = _RedisBookWriter(redis)
+    tasks = [
+        asyncio.create_task(_writer.run()),
+        # met SHARD_ENABLED alleen de symbolen van deze replica; herstart bij een rebalance
+        asyncio.create_task(run_sharded(STREAM_SYMBOLS, lambda syms: _run_exchanges(redis, syms), "stream")),
+    ]
     try:
         await asyncio.gather(*tasks)
     finally:
-        await redis.close()
+        for t in tasks:
+            t.cancel()
+        _writer = None
+        registry.has_writer = False
+        if _recorder is not None:
+            _recorder.close()
+            _recorder = None
     
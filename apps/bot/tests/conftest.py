@@ -0,0 +1,12 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# zelfde import-pad als in de container (PYTHONPATH=src)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+@pytest.fixture
+def redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.aioredis.FakeRedis()
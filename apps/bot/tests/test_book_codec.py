@@ -0,0 +1,76 @@
+import random
+
+import orjson
+import pytest
+
+from bot.services.book_codec import (HEADER_SIZE, decode_arrays, decode_book, encode_book, is_binary, read_ts,
+                                     to_dict)
+
+ASKS = [(100.5, 0.25), (100.75, 1.5), (101.0, 3.0)]
+BIDS = [(100.25, 0.5), (100.0, 2.0)]
+
+def test_roundtrip_exact():
+    data = encode_book(ASKS, BIDS, 1_700_000_000_123, 42)
+    assert is_binary(data)
+    assert len(data) == HEADER_SIZE + 16 * (len(ASKS) + len(BIDS))
+    book = decode_book(data)
+    assert (book.ts, book.seq) == (1_700_000_000_123, 42)
+    assert book.asks == ASKS
+    assert book.bids == BIDS
+    assert read_ts(data) == 1_700_000_000_123
+
+def test_roundtrip_random_floats_bit_exact():
+    rnd = random.Random(7)
+    asks = sorted((rnd.uniform(1, 1e5), rnd.uniform(0, 10)) for _ in range(50))
+    bids = sorted(((rnd.uniform(1, 1e5), rnd.uniform(0, 10)) for _ in range(50)), reverse=True)
+    book = decode_book(encode_book(asks, bids, 1, 2))
+    assert book.asks == asks
+    assert book.bids == bids
+
+def test_empty_sides():
+    book = decode_book(encode_book([], [], 5))
+    assert (book.ts, book.seq, book.asks, book.bids) == (5, 0, [], [])
+
+def test_extra_level_fields_are_dropped():
+    # ccxt levert soms [price, size, count]
+    book = decode_book(encode_book([(1.0, 2.0, 7)], [(0.5, 1.0, 3)], 1))
+    assert book.asks == [(1.0, 2.0)]
+    assert book.bids == [(0.5, 1.0)]
+
+def test_arrays_are_views_on_payload():
+    np = pytest.importorskip("numpy")
+    data = encode_book(ASKS, BIDS, 9, 3)
+    ts, seq, asks, bids = decode_arrays(data)
+    assert (ts, seq) == (9, 3)
+    assert asks.shape == (3, 2) and bids.shape == (2, 2)
+    assert np.array_equal(asks, np.array(ASKS))
+    assert np.array_equal(bids, np.array(BIDS))
+    assert not asks.flags.owndata
+
+def test_json_payload_still_decodes_sorted():
+    data = orjson.dumps({"ts": 77, "version": 4, "asks": [["101", "1"], ["100", "2"]], "bids": [[98, 1], [99, 3]]})
+    assert not is_binary(data)
+    book = decode_book(data)
+    assert (book.ts, book.seq) == (77, 4)
+    assert book.asks == [(100.0, 2.0), (101.0, 1.0)]
+    assert book.bids == [(99.0, 3.0), (98.0, 1.0)]
+    assert read_ts(data) == 77
+    _, _, asks, bids = decode_arrays(data)
+    assert asks.tolist() == [[100.0, 2.0], [101.0, 1.0]]
+    assert to_dict(data)["version"] == 4
+
+def test_truncated_payload_raises():
+    data = encode_book(ASKS, BIDS, 1)
+    with pytest.raises(ValueError):
+        decode_book(data[:-8])
+
+def test_unknown_version_raises():
+    data = bytearray(encode_book(ASKS, BIDS, 1))
+    data[2] = 99
+    with pytest.raises(ValueError):
+        decode_book(bytes(data))
+
+def test_to_dict_binary():
+    d = to_dict(encode_book(ASKS, BIDS, 11, 12))
+    assert d["format"] == "bin1"
+    assert (d["ts"], d["version"], d["asks"], d["bids"]) == (11, 12, ASKS, BIDS)
@@ -0,0 +1,100 @@
+import asyncio
+import random
+
+from bot.services.book_codec import decode_book
+from bot.services.book_deltas import DeltaBookFollower, DeltaEncoder, diff_levels, stream_key
+
+def _random_book(rnd, depth=20):
+    mid = 100.0 + rnd.randint(-20, 20) * 0.25
+    asks = [(mid + 0.25 * i, float(rnd.randint(1, 5))) for i in range(1, depth + 1) if rnd.random() > 0.2]
+    bids = [(mid - 0.25 * i, float(rnd.randint(1, 5))) for i in range(1, depth + 1) if rnd.random() > 0.2]
+    return asks, bids
+
+def test_diff_levels_changes_and_removals():
+    prev = {1.0: 1.0, 2.0: 2.0, 3.0: 3.0}
+    cur = [(1.0, 1.0), (2.0, 5.0), (4.0, 1.0)]
+    assert sorted(diff_levels(prev, cur)) == [(2.0, 5.0), (3.0, 0.0), (4.0, 1.0)]
+    assert diff_levels(prev, sorted(prev.items())) == []
+
+def test_encoder_snapshot_cadence():
+    enc = DeltaEncoder(snapshot_every=3, snapshot_ms=10**9)
+    asks, bids = [(2.0, 1.0)], [(1.0, 1.0)]
+    kinds = [enc.encode("k", asks, bids, seq, seq)[0] for seq in range(1, 8)]
+    assert kinds == [True, False, False, True, False, False, True]
+
+def test_encoder_snapshot_on_seq_reset_and_reset():
+    enc = DeltaEncoder(snapshot_every=100, snapshot_ms=10**9)
+    asks, bids = [(2.0, 1.0)], [(1.0, 1.0)]
+    assert enc.encode("k", asks, bids, 1, 5)[0]
+    assert not enc.encode("k", asks, bids, 2, 6)[0]
+    assert enc.encode("k", asks, bids, 3, 6)[0]  # seq niet hoger: nieuwe writer
+    enc.reset("k")
+    assert enc.encode("k", asks, bids, 4, 7)[0]
+
+def test_delta_body_only_holds_changes():
+    enc = DeltaEncoder(snapshot_every=100, snapshot_ms=10**9)
+    enc.encode("k", [(2.0, 1.0), (3.0, 1.0)], [(1.0, 1.0)], 1, 1)
+    is_snap, fields = enc.encode("k", [(2.0, 4.0)], [(1.0, 1.0)], 2, 2)
+    assert not is_snap
+    assert (fields["seq"], fields["prev"]) == (b"2", b"1")
+    body = decode_book(fields["b"])
+    assert body.asks == [(2.0, 4.0), (3.0, 0.0)]
+    assert body.bids == []
+
+def _fields(raw):
+    return {k.encode(): v for k, v in raw.items()}
+
+def test_follower_replays_to_same_book():
+    rnd = random.Random(3)
+    enc = DeltaEncoder(snapshot_every=7, snapshot_ms=10**9)
+    follower = DeltaBookFollower(redis=None)
+    follower.follow("kraken", "BTC/EUR")
+    key = stream_key("kraken", "BTC/EUR")
+    assert follower.get("kraken", "BTC/EUR") is None
+    for seq in range(1, 200):
+        asks, bids = _random_book(rnd)
+        _, raw = enc.encode(key, asks, bids, 1000 + seq, seq)
+        follower._apply(key, _fields(raw))
+        assert follower.get("kraken", "BTC/EUR") == (1000 + seq, asks, bids)
+
+def test_follower_waits_for_snapshot_after_gap():
+    rnd = random.Random(5)
+    enc = DeltaEncoder(snapshot_every=5, snapshot_ms=10**9)
+    follower = DeltaBookFollower(redis=None)
+    follower.follow("kraken", "BTC/EUR")
+    key = stream_key("kraken", "BTC/EUR")
+    books = [_random_book(rnd) for _ in range(11)]
+    raws = [enc.encode(key, a, b, seq, seq)[1] for seq, (a, b) in enumerate(books, 1)]
+    follower._apply(key, _fields(raws[0]))
+    follower._apply(key, _fields(raws[1]))
+    # seq 3 gaat verloren: 4 en 5 mogen niet worden toegepast
+    for raw in raws[3:5]:
+        follower._apply(key, _fields(raw))
+        assert follower.get("kraken", "BTC/EUR") is None
+    follower._apply(key, _fields(raws[5]))  # snapshot
+    assert raws[5]["t"] == b"s"
+    assert follower.get("kraken", "BTC/EUR") == (6, *books[5])
+    follower._apply(key, _fields(raws[6]))
+    assert follower.get("kraken", "BTC/EUR") == (7, *books[6])
+
+def test_follower_reads_stream_from_redis(redis):
+    async def go():
+        rnd = random.Random(9)
+        enc = DeltaEncoder(snapshot_every=4, snapshot_ms=10**9)
+        key = stream_key("bitvavo", "ETH/EUR")
+        books = [_random_book(rnd) for _ in range(10)]
+        for seq, (asks, bids) in enumerate(books, 1):
+            await redis.xadd(key, enc.encode(key, asks, bids, seq, seq)[1])
+        follower = DeltaBookFollower(redis, block_ms=10)
+        follower.follow("bitvavo", "ETH/EUR")
+        task = asyncio.create_task(follower.run())
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if follower.get("bitvavo", "ETH/EUR") == (10, *books[-1]):
+                    break
+            assert follower.get("bitvavo", "ETH/EUR") == (10, *books[-1])
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    asyncio.run(go())
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+from bot.strategy import arbitrage_engine as engine
+
+ASKS = [(100.0, 0.5), (100.5, 1.0)]
+BIDS = [(102.0, 0.4), (101.5, 1.0)]
+META = {"taker_fee": 0.001, "base_step": None, "min_base": None, "min_notional": None}
+
+class _Refresher:
+    def __init__(self):
+        self.requested = []
+
+    def get(self, exchange, symbol, max_age_ms=None):
+        return None
+
+    def request(self, exchange, symbol):
+        self.requested.append((exchange, symbol))
+        return True
+
+@pytest.fixture
+def refresher(monkeypatch):
+    ref = _Refresher()
+
+    async def no_rest(*args, **kwargs):
+        raise AssertionError("compute_pair mag niet blokkerend via REST ophalen")
+
+    async def meta(exchange, symbol):
+        return META
+
+    monkeypatch.setattr(engine, "refresher", ref)
+    monkeypatch.setattr(engine, "fetch_orderbook_async", no_rest)
+    monkeypatch.setattr(engine, "get_market_meta_async", meta)
+    monkeypatch.setattr(engine, "STRAT_STALE_POLICY", "refresh")
+    return ref
+
+def _books(monkeypatch, books):
+    async def aged(keys, max_age_ms=None):
+        return {key: books.get(key) for key in keys}
+    monkeypatch.setattr(engine, "get_cached_orderbooks_aged", aged)
+
+def test_missing_book_is_stale_not_fetched(refresher, monkeypatch):
+    now = int(time.time() * 1000)
+    _books(monkeypatch, {("kraken", "BTC/EUR"): (ASKS, [], now - 100)})
+    res = asyncio.run(engine.compute_pair("BTC/EUR", "kraken", "bitvavo", 100.0, 0.0, with_curve=True))
+    assert res["reason"] == "stale_book"
+    assert "curve" not in res
+    assert res["book_age_ms"]["sell"] is None
+    assert refresher.requested == [("bitvavo", "BTC/EUR")]
+
+def test_curve_and_book_age_from_snapshot(refresher, monkeypatch):
+    now = int(time.time() * 1000)
+    _books(monkeypatch, {("kraken", "BTC/EUR"): (ASKS, [], now - 100),
+                         ("bitvavo", "BTC/EUR"): ([], BIDS, now - 300)})
+    res = asyncio.run(engine.compute_pair("BTC/EUR", "kraken", "bitvavo", 100.0, 0.0, with_curve=True))
+    assert res["ok"] == 1
+    assert res["curve"]["best"] is not None
+    assert res["book_age_ms"]["buy"] >= 100
+    assert res["book_age_ms"]["sell"] >= 300
+    assert refresher.requested == []
+
+def test_penalize_applies_age_penalty(refresher, monkeypatch):
+    monkeypatch.setattr(engine, "STRAT_STALE_POLICY", "penalize")
+    stale = engine.orderbook_store.STALE_MS + 5000
+    now = int(time.time() * 1000)
+    _books(monkeypatch, {("kraken", "BTC/EUR"): (ASKS, [], now - stale),
+                         ("bitvavo", "BTC/EUR"): ([], BIDS, now)})
+    res = asyncio.run(engine.compute_pair("BTC/EUR", "kraken", "bitvavo", 100.0, 0.0))
+    assert res["depth"]["stale_penalty_quote"] > 0
+    assert res["book_age_ms"]["buy"] >= stale
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from bot.strategy.depth_sim import simulate_cross_fill, solve_optimal_size
+
+def _random_case(rnd):
+    asks, p = {}, 100.0
+    for _ in range(rnd.randint(1, 6)):
+        p = round(p + rnd.choice([0.0, 0.01, 0.05, 0.16, 0.3]), 2)
+        asks[p] = round(rnd.uniform(0.01, 2.0), 4)
+    bids, p = {}, 100.0 + rnd.uniform(-0.5, 2.0)
+    for _ in range(rnd.randint(1, 6)):
+        bids[round(p, 2)] = round(rnd.uniform(0.01, 3.0), 4)
+        p -= rnd.choice([0.01, 0.1, 0.3])
+    kw = {
+        "fee_buy": 0.001, "fee_sell": 0.001,
+        "withdraw_fee_base": rnd.choice([0.0, 0.003, 0.01]),
+        "base_step": rnd.choice([None, 0.001, 0.01, 0.1]),
+        "min_base": rnd.choice([None, 0.01, 0.05]),
+        "max_quote_buy": rnd.choice([None, rnd.uniform(1.0, 500.0)]),
+    }
+    return sorted(asks.items()), sorted(bids.items(), reverse=True), kw
+
+def _assert_not_worse(asks, bids, kw):
+    sim = simulate_cross_fill(asks, bids, **kw)
+    if sim["qty_base_sold"] <= 0 or (kw.get("min_base") and sim["qty_base_bought"] < kw["min_base"]):
+        return
+    best = solve_optimal_size(asks, bids, **kw)["best"]
+    assert best is not None
+    assert best["net_profit_quote"] >= sim["net_profit_quote"] - 1e-9
+
+def test_best_at_knot_equal_to_q_max():
+    # 4.475 valt op het raster één ulp boven q_max uit
+    asks = [(100.0, 0.1233), (100.16, 1.3207), (100.22, 0.4318), (100.27, 0.9586), (100.55, 1.6406)]
+    bids = [(101.5, 10.0)]
+    kw = {"fee_buy": 0.001, "fee_sell": 0.001, "withdraw_fee_base": 0.01, "base_step": 0.001, "min_base": 0.01}
+    res = solve_optimal_size(asks, bids, **kw)
+    assert res["best"]["qty_base"] == pytest.approx(4.475)
+    assert res["best"]["net_profit_quote"] >= simulate_cross_fill(asks, bids, **kw)["net_profit_quote"]
+
+@pytest.mark.parametrize("budget", [None, 1.0, 25.0, 100.0, 250.0, 448.0, 1000.0])
+def test_best_not_worse_than_simulator_at_budget(budget):
+    asks = [(100.0, 0.1233), (100.16, 1.3207), (100.22, 0.4318), (100.27, 0.9586), (100.55, 1.6406)]
+    bids = [(101.5, 10.0)]
+    _assert_not_worse(asks, bids, {"fee_buy": 0.001, "fee_sell": 0.001, "withdraw_fee_base": 0.01,
+                                   "base_step": 0.001, "min_base": 0.01, "max_quote_buy": budget})
+
+def test_best_not_worse_than_simulator_random():
+    rnd = random.Random(1)
+    for _ in range(5000):
+        _assert_not_worse(*_random_case(rnd))
+
+def test_best_respects_step_and_limits():
+    rnd = random.Random(2)
+    for _ in range(2000):
+        asks, bids, kw = _random_case(rnd)
+        res = solve_optimal_size(asks, bids, **kw)
+        best = res["best"]
+        if best is None:
+            continue
+        step = kw["base_step"]
+        if step:
+            assert best["qty_base"] / step == pytest.approx(round(best["qty_base"] / step), abs=1e-6)
+            assert best["qty_base_sold"] / step == pytest.approx(round(best["qty_base_sold"] / step), abs=1e-6)
+        assert best["qty_base"] >= (kw["min_base"] or 0.0) - 1e-12
+        assert best["qty_base_sold"] <= best["qty_base"] - kw["withdraw_fee_base"] + 1e-9
+        if kw["max_quote_buy"] is not None:
+            assert best["spent_quote"] <= kw["max_quote_buy"] + 1e-9
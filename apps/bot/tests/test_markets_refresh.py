@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+import pytest
+
+ccxt = pytest.importorskip("ccxt")
+ccxt_async = pytest.importorskip("ccxt.async_support")
+
+from bot.services import async_rest, markets  # noqa: E402
+from bot.services.market_index import index_for  # noqa: E402
+
+def _market(base, quote, taker):
+    return {
+        "id": f"{base}{quote}", "symbol": f"{base}/{quote}", "base": base, "quote": quote,
+        "baseId": base, "quoteId": quote, "active": True, "type": "spot", "spot": True,
+        "taker": taker, "maker": taker, "precision": {"amount": 0.0001, "price": 0.01},
+        "limits": {"amount": {"min": 0.0001}, "cost": {"min": 5.0}},
+    }
+
+class _Feed:
+    """Wat de (nep-)exchange bij de volgende load_markets teruggeeft; ``gate`` houdt de load vast."""
+    taker = 0.002
+    gate = None
+    loads = []
+
+def _fake(base):
+    class Fake(base):
+        def fetch_currencies(self, params={}):
+            return {}
+
+        def fetch_markets(self, params={}):
+            _Feed.loads.append(threading.current_thread().name)
+            if _Feed.gate is not None:
+                assert _Feed.gate.wait(5)
+            return [_market("BTC", "EUR", _Feed.taker), _market("ETH", "EUR", _Feed.taker)]
+    return Fake
+
+class _FakeAsync(ccxt_async.kraken):
+    async def load_markets(self, reload=False, params={}):
+        raise AssertionError("refresh mag de async-instantie niet zelf laten laden")
+
+@pytest.fixture
+def exchange(monkeypatch):
+    sync_ex = _fake(ccxt.kraken)({"enableRateLimit": False, "timeout": 1000})
+    sync_ex.load_markets()
+    async_ex = _FakeAsync({"enableRateLimit": False})
+    async_ex.set_markets(sync_ex.markets, sync_ex.currencies)
+    monkeypatch.setattr(markets, "_EXCHANGES", {"kraken": sync_ex})
+    monkeypatch.setattr(async_rest, "async_exchange", lambda name: async_ex)
+    monkeypatch.setattr(_Feed, "loads", [])
+    yield sync_ex, async_ex
+    asyncio.run(async_ex.close())
+
+def test_refresh_swaps_markets_and_index_together(exchange):
+    sync_ex, async_ex = exchange
+    assert index_for(sync_ex).meta("BTC/EUR")["taker_fee"] == 0.002
+
+    async def go():
+        _Feed.taker = 0.0015
+        _Feed.gate = threading.Event()
+        old = sync_ex.markets
+        task = asyncio.create_task(markets.refresh_markets())
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if _Feed.loads:
+                break
+        # laden loopt in de thread-pool; de loop ziet nog de oude markets en index
+        assert _Feed.loads and _Feed.loads[0].startswith("ccxt-rest")
+        assert sync_ex.markets is old
+        assert index_for(sync_ex).meta("BTC/EUR")["taker_fee"] == 0.002
+        _Feed.gate.set()
+        await task
+
+    try:
+        asyncio.run(go())
+    finally:
+        _Feed.gate = None
+        _Feed.taker = 0.002
+    assert sync_ex.markets["BTC/EUR"]["taker"] == 0.0015
+    assert async_ex.markets["BTC/EUR"]["taker"] == 0.0015
+    assert index_for(sync_ex).markets is sync_ex.markets
+    assert index_for(sync_ex).meta("ETH/EUR")["taker_fee"] == 0.0015
+
+def test_failed_refresh_keeps_old_markets(exchange, monkeypatch):
+    sync_ex, async_ex = exchange
+    old_sync, old_async = sync_ex.markets, async_ex.markets
+
+    def boom(self, params={}):
+        raise ccxt.NetworkError("down")
+
+    monkeypatch.setattr(type(sync_ex), "fetch_markets", boom)
+    asyncio.run(markets.refresh_markets())
+    assert sync_ex.markets is old_sync
+    assert async_ex.markets is old_async
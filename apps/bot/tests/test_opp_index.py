@@ -0,0 +1,163 @@
+import asyncio
+
+import orjson
+import pytest
+
+from bot.services import opp_index
+
+def _item(ts, net, spread_bps, symbol="BTC/EUR", buy="kraken", sell="bitvavo"):
+    return {
+        "symbol": symbol, "buy": buy, "sell": sell, "best_ask": 100.0, "ts": ts, "ok": net > 0,
+        "gross_spread": spread_bps / 10000.0,
+        "depth": {"qty_base_sold": 1.0, "net_profit_quote": net},
+    }
+
+async def _publish(redis, items):
+    pipe = redis.pipeline(transaction=False)
+    pipe.publish("opps", b"x")
+    n = opp_index.add_to_pipeline(pipe, items)
+    res = await pipe.execute()
+    assert len(res) == 1 + n
+    return res[-1]
+
+@pytest.fixture
+def small_index(monkeypatch):
+    monkeypatch.setattr(opp_index, "OPP_INDEX_MAXLEN", 20)
+    monkeypatch.setattr(opp_index, "OPP_INDEX_SYMBOL_MAXLEN", 20)
+    monkeypatch.setattr(opp_index, "OPP_INDEX_TRIM_BATCH", 5)
+
+async def _assert_consistent(redis):
+    ids = [raw.decode().split("|")[0] for raw in await redis.lrange(opp_index.key("ids"), 0, -1)]
+    assert len(set(ids)) == len(ids)
+    assert {k.decode() for k in await redis.hkeys(opp_index.key("items"))} == set(ids)
+    for idx in ("profit", "spread"):
+        members = [m.decode().split("|")[0] for m in await redis.zrange(opp_index.key(idx), 0, -1)]
+        assert sorted(members) == sorted(ids)
+        per_sym = []
+        for sym in ("BTC/EUR", "ETH/EUR"):
+            per_sym += [m.decode().split("|")[0] for m in await redis.zrange(opp_index.key(idx, sym), 0, -1)]
+        assert sorted(per_sym) == sorted(ids)
+    return ids
+
+def test_to_record_skips_cycles_and_empty_fills():
+    assert opp_index.to_record({"kind": "cycle", "symbol": "x"}) is None
+    assert opp_index.to_record({**_item(1, 1.0, 10.0), "depth": {"qty_base_sold": 0}}) is None
+    rec = opp_index.to_record(_item(5, 1.5, 12.0))
+    assert rec["spread_bps"] == pytest.approx(12.0)
+    assert (rec["net_profit_quote"], rec["ts"], rec["ok"]) == (1.5, 5, 1)
+
+def test_ids_unique_across_replicas_in_same_ms(redis, monkeypatch):
+    async def go():
+        monkeypatch.setattr(opp_index, "_ORIGIN", "bot-a")
+        monkeypatch.setattr(opp_index, "_seq", 0)
+        await _publish(redis, [_item(1000, 1.0, 10.0)])
+        monkeypatch.setattr(opp_index, "_ORIGIN", "bot-b")
+        monkeypatch.setattr(opp_index, "_seq", 0)  # verse replica: zelfde teller
+        await _publish(redis, [_item(1000, 2.0, 20.0)])
+        ids = sorted(k.decode() for k in await redis.hkeys(opp_index.key("items")))
+        assert ids == ["1000-bot-a-1", "1000-bot-b-1"]
+        assert await _assert_consistent(redis)
+    asyncio.run(go())
+
+def test_trim_keeps_indexes_consistent(redis, small_index):
+    async def go():
+        trimmed = False
+        for i in range(60):
+            ids_len = await _publish(redis, [_item(1000 + i, float(i % 7), float(i % 11), "BTC/EUR"),
+                                             _item(1000 + i, float(-i), float(i), "ETH/EUR")])
+            if opp_index.needs_trim(ids_len):
+                assert ids_len > 25
+                assert await opp_index.trim(redis) == ids_len - 20
+                trimmed = True
+        assert trimmed
+        ids = await _assert_consistent(redis)
+        assert 20 <= len(ids) <= 25 + 1
+        assert await opp_index.trim(redis) == len(ids) - 20
+        ids = await _assert_consistent(redis)
+        assert len(ids) == 20
+        # de nieuwste blijven over
+        assert all(int(oid.split("-")[0]) >= 1050 for oid in ids)
+        assert await opp_index.trim(redis) == 0
+    asyncio.run(go())
+
+def test_trim_rereads_after_concurrent_write(redis, small_index):
+    async def go():
+        for i in range(30):
+            await _publish(redis, [_item(1000 + i, 1.0, 1.0)])
+
+        class _Racing:
+            """Eerste LRANGE onder WATCH: een andere writer publiceert er net achteraan."""
+
+            def __init__(self, inner):
+                self.inner = inner
+                self.raced = False
+
+            def pipeline(self, transaction=True):
+                pipe = self.inner.pipeline(transaction=transaction)
+                lrange = pipe.lrange
+
+                async def racing_lrange(*args):
+                    out = await lrange(*args)
+                    if not self.raced:
+                        self.raced = True
+                        await _publish(self.inner, [_item(2000, 9.0, 9.0)])
+                    return out
+
+                pipe.lrange = racing_lrange
+                return pipe
+
+        racing = _Racing(redis)
+        assert await opp_index.trim(racing) == 11
+        assert racing.raced
+        ids = await _assert_consistent(redis)
+        assert len(ids) == 20
+        assert ids[0].startswith("2000-")
+    asyncio.run(go())
+
+def test_query_orders_and_filters(redis):
+    async def go():
+        rows = [(1000, 1.0, 50.0), (1001, 5.0, 10.0), (1002, -1.0, 30.0), (1003, 3.0, 40.0), (1004, 0.5, 5.0)]
+        for ts, net, spread in rows:
+            await _publish(redis, [_item(ts, net, spread)])
+        await _publish(redis, [_item(1005, 100.0, 100.0, "ETH/EUR")])
+
+        recent = await opp_index.query(redis, symbol="BTC/EUR", limit=10)
+        assert [r["ts"] for r in recent] == [1004, 1003, 1002, 1001, 1000]
+        assert [r["ts"] for r in await opp_index.query(redis, limit=2, offset=1)] == [1004, 1003]
+
+        # filters zonder order: nog steeds nieuwste eerst
+        got = await opp_index.query(redis, symbol="BTC/EUR", min_profit=1.0, order="recent")
+        assert [r["ts"] for r in got] == [1003, 1001, 1000]
+        got = await opp_index.query(redis, symbol="BTC/EUR", min_spread_bps=30.0)
+        assert [r["ts"] for r in got] == [1003, 1002, 1000]
+
+        got = await opp_index.query(redis, symbol="BTC/EUR", order="profit")
+        assert [r["net_profit_quote"] for r in got] == [5.0, 3.0, 1.0, 0.5, -1.0]
+        got = await opp_index.query(redis, symbol="BTC/EUR", order="spread", min_profit=1.0)
+        assert [r["ts"] for r in got] == [1000, 1003, 1001]
+        got = await opp_index.query(redis, order="profit", min_spread_bps=30.0, limit=2)
+        assert [r["ts"] for r in got] == [1005, 1003]
+        assert await opp_index.query(redis, symbol="BTC/EUR", min_profit=50.0) == []
+    asyncio.run(go())
+
+def test_filtered_recent_uses_index_not_list(redis):
+    async def go():
+        # 3 winnaars, daarna 300 verliezers: nieuwste eerst, zonder de lijst te lezen
+        for i in range(1, 4):
+            await _publish(redis, [_item(i, 10.0, float(i))])
+        for i in range(300):
+            await _publish(redis, [_item(100 + i, -1.0, 50.0)])
+        blobs = await redis.lrange(opp_index.key("recent"), 0, 0)
+        assert orjson.loads(blobs[0])["ts"] == 399
+        await redis.delete(opp_index.key("recent"))
+        got = await opp_index.query(redis, min_profit=0.0, limit=5)
+        assert [r["ts"] for r in got] == [3, 2, 1]
+        got = await opp_index.query(redis, min_profit=0.0, min_spread_bps=2.0, offset=1)
+        assert [r["ts"] for r in got] == [2]
+        got = await opp_index.query(redis, min_spread_bps=2.0, limit=3)
+        assert [r["ts"] for r in got] == [399, 398, 397]
+    asyncio.run(go())
+
+def test_filtered_recent_orders_by_id_time():
+    ids = ["5-bot-a-7", "12-host-1-3", "12-host-1-2", "9-bot-b-1"]
+    assert sorted(ids, key=opp_index._newest_first) == ["12-host-1-2", "12-host-1-3", "9-bot-b-1", "5-bot-a-7"]
@@ -0,0 +1,159 @@
+import asyncio
+
+import orjson
+import pytest
+
+from bot.execution import paper
+from bot.services.book_registry import BookRegistry
+from bot.strategy.depth_sim import simulate_cross_fill
+
+ASKS = [(100.0, 0.5), (100.5, 1.0), (101.0, 5.0)]      # kraken: kopen
+BIDS = [(102.0, 0.4), (101.5, 1.0), (100.0, 5.0)]      # bitvavo: verkopen
+WORSE_BIDS = [(101.2, 0.2), (100.8, 1.0), (99.0, 5.0)]
+
+class _Skipped:
+    def __init__(self):
+        self.counts = {}
+
+    def labels(self, reason):
+        self._reason = reason
+        return self
+
+    def inc(self):
+        self.counts[self._reason] = self.counts.get(self._reason, 0) + 1
+
+@pytest.fixture
+def books(monkeypatch):
+    reg = BookRegistry()
+    reg.keep_history(10_000)
+    monkeypatch.setattr(paper, "registry", reg)
+    monkeypatch.setattr(paper, "PAPER_FILL_MODEL", "book")
+    monkeypatch.setattr(paper, "PAPER_LATENCY_MS", {"*": 50})
+    monkeypatch.setattr(paper, "PAPER_LATENCY_PROBES_MS", [])
+    return reg
+
+@pytest.fixture
+def skipped(monkeypatch):
+    s = _Skipped()
+    monkeypatch.setattr(paper, "PAPER_SKIPPED", s)
+    return s
+
+def _item(ts=1000, budget=150.0, limits=None, asks=ASKS, bids=BIDS):
+    depth = simulate_cross_fill(asks, bids, 0.001, 0.001, max_quote_buy=budget, **(limits or {}))
+    return {
+        "symbol": "BTC/EUR", "buy": "kraken", "sell": "bitvavo", "ts": ts, "ok": 1,
+        "best_ask": asks[0][0], "best_bid": bids[0][0], "fee_buy": 0.001, "fee_sell": 0.001,
+        "depth": depth, "limits": limits or {},
+    }
+
+def _expected(asks, bids, item, **limits):
+    d = item["depth"]
+    return simulate_cross_fill(asks, bids, 0.001, 0.001, max_quote_buy=d["spent_quote"],
+                               max_base_sell=d["qty_base_sold"], **limits)
+
+def test_tob_fill_uses_top_of_book_and_slippage(monkeypatch):
+    monkeypatch.setattr(paper, "PAPER_FILL_MODEL", "tob")
+    monkeypatch.setattr(paper, "PAPER_SLIPPAGE_BPS", 10.0)
+    item = _item()
+    qty = item["depth"]["qty_base_sold"]
+    trade = paper._fill(item)
+    assert trade["fill_model"] == "tob"
+    assert trade["eff_ask"] == pytest.approx(100.0 * 1.001)
+    assert trade["eff_bid"] == pytest.approx(102.0 * 0.999)
+    spent = qty * 100.0 * 1.001 * 1.001
+    received = qty * 102.0 * 0.999 * 0.999
+    assert trade["net_profit_quote"] == pytest.approx(received - spent)
+
+def test_book_fill_walks_book_at_detection_plus_latency(books, skipped):
+    books.put("kraken", "BTC/EUR", ASKS, [(99.0, 1.0)], 0, recv_ms=1000)
+    books.put("bitvavo", "BTC/EUR", [(103.0, 1.0)], BIDS, 0, recv_ms=1000)
+    books.put("bitvavo", "BTC/EUR", [(103.0, 1.0)], WORSE_BIDS, 0, recv_ms=1030)  # binnen de latency
+    books.put("bitvavo", "BTC/EUR", [(103.0, 1.0)], [(150.0, 9.0)], 0, recv_ms=1051)  # te laat
+    item = _item()
+    trade = paper._fill(item)
+    exp = _expected(ASKS, WORSE_BIDS, item)
+    assert trade["fill_model"] == "book"
+    assert trade["qty_base"] == pytest.approx(exp["qty_base_sold"])
+    assert trade["net_profit_quote"] == pytest.approx(exp["net_profit_quote"])
+    assert trade["spent_quote"] == pytest.approx(exp["spent_quote"] + exp["buy_fee_quote"])
+    assert trade["latency_ms"] == {"buy": 50, "sell": 50}
+    assert trade["detected_net_quote"] == pytest.approx(item["depth"]["net_profit_quote"])
+    assert trade["latency_cost_quote"] == pytest.approx(item["depth"]["net_profit_quote"] - exp["net_profit_quote"])
+    assert trade["latency_cost_quote"] > 0
+    assert skipped.counts == {}
+
+def test_book_fill_latency_per_exchange(books, monkeypatch):
+    monkeypatch.setattr(paper, "PAPER_LATENCY_MS", {"kraken": 10, "*": 50})
+    books.put("kraken", "BTC/EUR", ASKS, [], 0, recv_ms=1000)
+    books.put("kraken", "BTC/EUR", [(200.0, 9.0)], [], 0, recv_ms=1020)  # kraken vult al op 1010
+    books.put("bitvavo", "BTC/EUR", [], BIDS, 0, recv_ms=1000)
+    books.put("bitvavo", "BTC/EUR", [], WORSE_BIDS, 0, recv_ms=1040)
+    item = _item()
+    trade = paper._fill(item)
+    assert trade["latency_ms"] == {"buy": 10, "sell": 50}
+    assert trade["net_profit_quote"] == pytest.approx(_expected(ASKS, WORSE_BIDS, item)["net_profit_quote"])
+
+def test_book_without_history_is_skipped_not_tob(books, skipped):
+    books.put("kraken", "BTC/EUR", ASKS, [], 0, recv_ms=1000)  # bitvavo wordt hier niet gestreamd
+    assert paper._fill(_item()) is None
+    # historie begint pas na detectie + latency
+    books.put("bitvavo", "BTC/EUR", [], BIDS, 0, recv_ms=1100)
+    assert paper._fill(_item()) is None
+    assert skipped.counts == {"no_book_history": 2}
+
+def test_zero_budget_is_not_unbounded(books, skipped):
+    books.put("kraken", "BTC/EUR", ASKS, [], 0, recv_ms=1000)
+    books.put("bitvavo", "BTC/EUR", [], BIDS, 0, recv_ms=1000)
+    item = _item()
+    item["depth"] = {**item["depth"], "spent_quote": 0.0}
+    assert paper._fill(item) is None
+    assert skipped.counts == {"no_fill": 1}
+
+def test_book_fill_applies_market_limits(books, skipped):
+    books.put("kraken", "BTC/EUR", ASKS, [], 0, recv_ms=1000)
+    books.put("bitvavo", "BTC/EUR", [], BIDS, 0, recv_ms=1000)
+    limits = {"base_step": 0.1, "min_base": 0.1, "min_notional_buy": None, "min_notional_sell": None}
+    item = _item(budget=137.0, limits=limits)
+    trade = paper._fill(item)
+    assert trade["qty_base"] == pytest.approx(_expected(ASKS, BIDS, item, **limits)["qty_base_sold"])
+    assert round(trade["qty_base"] / 0.1, 9) == int(round(trade["qty_base"] / 0.1))
+
+    # budget onder de minimale order van de buy-venue: geen fill
+    item["limits"] = {**limits, "min_notional_buy": 10_000.0}
+    assert paper._fill(item) is None
+    assert skipped.counts == {"no_fill": 1}
+
+def test_latency_probes(books, monkeypatch):
+    monkeypatch.setattr(paper, "PAPER_LATENCY_PROBES_MS", [0, 40, 100])
+    books.put("kraken", "BTC/EUR", ASKS, [], 0, recv_ms=1000)
+    books.put("bitvavo", "BTC/EUR", [], BIDS, 0, recv_ms=1000)
+    books.put("bitvavo", "BTC/EUR", [], WORSE_BIDS, 0, recv_ms=1030)
+    item = _item()
+    probes = paper._fill(item)["net_at_latency_ms"]
+    assert probes["0"] == pytest.approx(item["depth"]["net_profit_quote"])
+    assert probes["40"] == pytest.approx(_expected(ASKS, WORSE_BIDS, item)["net_profit_quote"])
+    assert probes["100"] == probes["40"]
+
+def test_execute_batch_writes_once_per_cooldown(redis, monkeypatch):
+    monkeypatch.setattr(paper, "PAPER_FILL_MODEL", "tob")
+    monkeypatch.setattr(paper, "PAPER_ROLLUPS", False)
+    monkeypatch.setattr(paper, "_dedup", paper._DedupCache(60_000, 100))
+
+    async def go():
+        item = _item()
+        assert len(await paper.execute_batch(redis, [item, dict(item)])) == 1
+        assert await paper.execute_batch(redis, [item]) == []
+        # andere worker zonder lokale cache: de SET NX in Redis houdt hem tegen
+        paper._dedup.clear()
+        assert await paper.execute_batch(redis, [item]) == []
+        entries = await redis.xrange(paper.PAPER_STREAM)
+        assert len(entries) == 1
+        assert orjson.loads(entries[0][1][b"payload"])["fill_model"] == "tob"
+    asyncio.run(go())
+
+def test_execute_batch_book_without_history_writes_nothing(redis, books, skipped):
+    async def go():
+        assert await paper.execute_batch(redis, [_item()]) == []
+        assert await redis.xlen(paper.PAPER_STREAM) == 0
+        assert await redis.keys("paper:dedup:*") == []
+    asyncio.run(go())
@@ -0,0 +1,194 @@
+import asyncio
+
+import pytest
+
+from bot.services import sharding
+from bot.services.sharding import HashRing, ShardManager
+
+KEYS = [f"SYM{i}/EUR" for i in range(200)]
+
+class _LuaFreeRedis:
+    """fakeredis zonder lupa kent geen EVAL: de twee lock-scripts hier als get + pexpire/del (single-threaded)."""
+
+    def __init__(self, redis):
+        self._redis = redis
+
+    def __getattr__(self, name):
+        return getattr(self._redis, name)
+
+    def pipeline(self, transaction=True):
+        return _Pipe(self._redis)
+
+class _Pipe:
+    def __init__(self, redis):
+        self._redis = redis
+        self._ops = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        out = []
+        for name, args, kwargs in self._ops:
+            if name == "eval":
+                out.append(await self._eval(*args))
+            else:
+                out.append(await getattr(self._redis, name)(*args, **kwargs))
+        return out
+
+    async def _eval(self, script, numkeys, key, owner, *argv):
+        if await self._redis.get(key) != owner.encode():
+            return 0
+        if script == sharding._RENEW_LUA:
+            return int(await self._redis.pexpire(key, int(argv[0])))
+        assert script == sharding._RELEASE_LUA
+        return await self._redis.delete(key)
+
+def _owners(managers, keys=KEYS):
+    return {k: [m.id for m in managers if m.owns(k)] for k in keys}
+
+def test_ring_owner_independent_of_member_order():
+    a = HashRing(["a", "b", "c"], vnodes=32)
+    b = HashRing(["c", "a", "b"], vnodes=32)
+    assert [a.owner(k) for k in KEYS] == [b.owner(k) for k in KEYS]
+    assert set(a.owner(k) for k in KEYS) == {"a", "b", "c"}
+
+def test_ring_join_only_moves_keys_to_new_member():
+    before = HashRing(["a", "b", "c"], vnodes=64)
+    after = HashRing(["a", "b", "c", "d"], vnodes=64)
+    moved = [k for k in KEYS if before.owner(k) != after.owner(k)]
+    assert moved
+    assert all(after.owner(k) == "d" for k in moved)
+    # ongeveer een kwart, zeker niet alles
+    assert len(moved) < len(KEYS) / 2
+
+def test_ring_empty_has_no_owner():
+    assert HashRing([]).owner("BTC/EUR") is None
+
+def test_single_replica_owns_everything(redis):
+    async def go():
+        a = ShardManager(_LuaFreeRedis(redis), "a", lease_ms=5000, vnodes=16)
+        a.add_keys(KEYS)
+        await a._beat()
+        assert a.members == ["a"]
+        assert all(a.owns(k) for k in KEYS)
+        owned, _ = a.current(list(reversed(KEYS)))
+        assert owned == list(reversed(KEYS))
+    asyncio.run(go())
+
+def test_rebalance_never_double_owns(redis):
+    async def go():
+        r = _LuaFreeRedis(redis)
+        a = ShardManager(r, "a", lease_ms=5000, vnodes=16)
+        b = ShardManager(r, "b", lease_ms=5000, vnodes=16)
+        a.add_keys(KEYS)
+        b.add_keys(KEYS)
+        await a._beat()
+        assert all(a.owns(k) for k in KEYS)
+
+        # b komt erbij: de locks van a staan nog, dus b krijgt nog niets
+        await b._beat()
+        assert not any(b.owns(k) for k in KEYS)
+        ring = HashRing(["a", "b"], vnodes=16)
+        for_b = [k for k in KEYS if ring.owner(k) == "b"]
+        assert for_b
+
+        steps = [a, b, a, b]
+        for m in steps:
+            await m._beat()
+            assert all(len(ids) <= 1 for ids in _owners([a, b]).values())
+
+        owners = _owners([a, b])
+        assert all(owners[k] == [ring.owner(k)] for k in KEYS)
+    asyncio.run(go())
+
+def test_lost_keys_stop_before_release(redis):
+    async def go():
+        r = _LuaFreeRedis(redis)
+        a = ShardManager(r, "a", lease_ms=5000, vnodes=16)
+        b = ShardManager(r, "b", lease_ms=5000, vnodes=16)
+        a.add_keys(KEYS)
+        b.add_keys(KEYS)
+        await a._beat()
+        await b._beat()
+        _, changed = a.current(KEYS)
+        await a._beat()
+        # a ziet b, stopt meteen met b's keys en meldt dat ...
+        assert changed.is_set()
+        lost = [k for k in KEYS if HashRing(["a", "b"], vnodes=16).owner(k) == "b"]
+        assert not any(a.owns(k) for k in lost)
+        # ... maar de locks blijven tot a's volgende beat
+        assert await redis.mget([a._lock(k) for k in lost]) == [b"a"] * len(lost)
+        await a._beat()
+        assert await redis.mget([a._lock(k) for k in lost]) == [None] * len(lost)
+    asyncio.run(go())
+
+def test_close_hands_over_immediately(redis):
+    async def go():
+        r = _LuaFreeRedis(redis)
+        a = ShardManager(r, "a", lease_ms=60000, vnodes=16)
+        b = ShardManager(r, "b", lease_ms=60000, vnodes=16)
+        a.add_keys(KEYS)
+        b.add_keys(KEYS)
+        await a._beat()
+        await b._beat()
+        await a.close()
+        assert not any(a.owns(k) for k in KEYS)
+        await b._beat()
+        assert b.members == ["b"]
+        assert all(b.owns(k) for k in KEYS)
+    asyncio.run(go())
+
+def test_expired_lease_owns_nothing(redis, monkeypatch):
+    async def go():
+        a = ShardManager(_LuaFreeRedis(redis), "a", lease_ms=1000, vnodes=16)
+        a.add_keys(KEYS)
+        await a._beat()
+        assert a.owns(KEYS[0])
+        now = sharding.time.monotonic()
+        monkeypatch.setattr(sharding.time, "monotonic", lambda: now + 1.0)
+        assert not a.owns(KEYS[0])
+        assert a.current(KEYS)[0] == []
+    asyncio.run(go())
+
+def test_run_sharded_without_sharding_runs_all_keys(monkeypatch):
+    monkeypatch.setattr(sharding, "_shard", None)
+    monkeypatch.setattr(sharding, "SHARD_ENABLED", False)
+    seen = []
+
+    async def start(keys):
+        seen.append(list(keys))
+
+    asyncio.run(sharding.run_sharded(KEYS[:3], start, "test"))
+    assert seen == [KEYS[:3]]
+
+def test_run_sharded_restarts_on_rebalance(redis, monkeypatch):
+    async def go():
+        a = ShardManager(_LuaFreeRedis(redis), "a", lease_ms=5000, vnodes=16)
+        monkeypatch.setattr(sharding, "_shard", a)
+        started, cancelled = [], []
+
+        async def start(keys):
+            started.append(list(keys))
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(list(keys))
+                raise
+
+        task = asyncio.create_task(sharding.run_sharded(KEYS[:4], start, "test"))
+        await asyncio.sleep(0)
+        assert started == []  # nog geen lease: niets draaien
+        await a._beat()
+        await asyncio.sleep(0.01)
+        assert started == [KEYS[:4]]
+        await a.close()
+        await asyncio.sleep(0.01)
+        assert cancelled == [KEYS[:4]]
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(go())